@@ -0,0 +1,362 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from . import metrics
+
+# Configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity above which a rephrased question reuses a cached answer
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER", "256"))
+# Owners (a user, or a user with a document scope) kept by the memory backend,
+# least recently used dropped first
+ANSWER_CACHE_MAX_OWNERS = int(os.getenv("ANSWER_CACHE_MAX_OWNERS", "256"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# "memory" (per process) or "sqlite" (one file shared by every worker on the host)
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory").lower()
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", str(PROJECT_ROOT / "data" / "answer_cache.db"))
+# Users whose question-vector matrix a process keeps for the sqlite backend
+ANSWER_CACHE_MATRICES = 64
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?.!").strip().lower()
+
+
+class _UserEntries:
+    def __init__(self, version):
+        self.version = version
+        self.entries = OrderedDict()  # normalized question -> entry dict
+        # Unit-norm float32 question vectors, rows aligned with vector_keys;
+        # the only copy of each vector
+        self.matrix = None
+        self.vector_keys = []
+
+
+class AnswerCache:
+    """
+    Per-user cache of generated answers. Exact hits match on the normalized
+    question; near-duplicates match when the question embedding is within
+    the cosine threshold. Each user's entries are tied to a corpus version
+    and dropped as soon as their document set changes.
+
+    Entries are kept per owner: a user id, or (user_id, scope) for
+    document-scoped chat. At most max_owners owners are kept, least
+    recently used dropped first, each with at most max_per_user entries.
+    """
+
+    def __init__(self, similarity: float = ANSWER_CACHE_SIMILARITY, max_per_user: int = ANSWER_CACHE_MAX_PER_USER,
+                 ttl: float = ANSWER_CACHE_TTL, max_owners: int = ANSWER_CACHE_MAX_OWNERS):
+        self.similarity = similarity
+        self.max_per_user = max_per_user
+        self.max_owners = max_owners
+        self.ttl = ttl
+        self._users: "OrderedDict[Any, _UserEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _user_id(owner) -> int:
+        return owner[0] if isinstance(owner, tuple) else owner
+
+    def _user(self, user_id, version) -> _UserEntries:
+        user = self._users.get(user_id)
+        if user is None or user.version != version:
+            user = _UserEntries(version)
+            self._users[user_id] = user
+            while len(self._users) > self.max_owners:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return user
+
+    def get_exact(self, user_id: int, question: str, version) -> Optional[Dict[str, Any]]:
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._live(self._user(user_id, version), key)
+            if entry is not None:
+                self.exact_hits += 1
+            return entry
+
+    def get_similar(self, user_id: int, vector: List[float], version) -> Optional[Dict[str, Any]]:
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            user = self._user(user_id, version)
+            if user.matrix is not None and len(user.vector_keys):
+                scores = user.matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    entry = self._live(user, user.vector_keys[best])
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def put(self, user_id: int, question: str, version, answer: str, sources=None,
+            vector: Optional[List[float]] = None):
+        key = normalize_question(question)
+        with self._lock:
+            user = self._user(user_id, version)
+            user.entries[key] = {"answer": answer, "sources": sources or [], "created": time.time()}
+            user.entries.move_to_end(key)
+            self._set_vector(user, key, vector)
+            while len(user.entries) > self.max_per_user:
+                oldest, _ = user.entries.popitem(last=False)
+                self._set_vector(user, oldest, None)
+
+    def record_miss(self):
+        """
+        Counts a lookup that missed without a semantic search.
+        """
+        with self._lock:
+            self.misses += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            for owner in [o for o in self._users if self._user_id(o) == user_id]:
+                del self._users[owner]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "backend": "memory",
+                "users": len({self._user_id(owner) for owner in self._users}),
+                "owners": len(self._users),
+                "entries": sum(len(u.entries) for u in self._users.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _live(self, user: _UserEntries, key: str) -> Optional[Dict[str, Any]]:
+        entry = user.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            del user.entries[key]
+            self._set_vector(user, key, None)
+            return None
+        user.entries.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def _set_vector(user: _UserEntries, key: str, vector: Optional[List[float]]):
+        """
+        Replaces, adds or (vector None) removes the matrix row for `key`.
+        """
+        row = user.vector_keys.index(key) if key in user.vector_keys else None
+        if vector is None:
+            if row is not None:
+                del user.vector_keys[row]
+                user.matrix = np.delete(user.matrix, row, axis=0) if user.vector_keys else None
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        if row is not None:
+            user.matrix[row] = vector
+        else:
+            user.vector_keys.append(key)
+            user.matrix = vector[None, :] if user.matrix is None else np.vstack([user.matrix, vector])
+
+
+class SQLiteAnswerCache(AnswerCache):
+    """
+    AnswerCache kept in a SQLite file, so every worker process serves the
+    answers any of them generated. Same interface and matching rules;
+    entries are trimmed oldest-first rather than least recently used, so
+    reads never write. Each process keeps the question-vector matrix of the
+    users it has looked up and reloads it when their rows change.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, similarity: float = ANSWER_CACHE_SIMILARITY,
+                 max_per_user: int = ANSWER_CACHE_MAX_PER_USER, ttl: float = ANSWER_CACHE_TTL):
+        super().__init__(similarity, max_per_user, ttl)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " owner TEXT NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " key TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " sources TEXT NOT NULL,"
+            " vector BLOB,"
+            " created REAL NOT NULL,"
+            " PRIMARY KEY (owner, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_user ON answers (user_id)")
+        self._conn.commit()
+        self._matrices = OrderedDict()  # owner -> (signature, matrix, keys), LRU
+
+    @staticmethod
+    def _owner(owner) -> str:
+        # user_id, or (user_id, scope) for document-scoped chat
+        return repr(owner)
+
+    def _entry(self, row) -> Optional[Dict[str, Any]]:
+        answer, sources, created = row
+        if time.time() - created > self.ttl:
+            return None
+        return {"answer": answer, "sources": json.loads(sources), "created": created}
+
+    def get_exact(self, user_id, question: str, version) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, sources, created FROM answers WHERE owner = ? AND key = ? AND version = ?",
+                (self._owner(user_id), normalize_question(question), str(version)),
+            ).fetchone()
+            entry = self._entry(row) if row is not None else None
+            if entry is not None:
+                self.exact_hits += 1
+            return entry
+
+    def get_similar(self, user_id, vector: List[float], version) -> Optional[Dict[str, Any]]:
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        owner, version = self._owner(user_id), str(version)
+        with self._lock:
+            signature = self._conn.execute(
+                "SELECT COUNT(*), MAX(rowid), MAX(created) FROM answers WHERE owner = ? AND version = ?",
+                (owner, version),
+            ).fetchone() + (version,)
+            cached = self._matrices.get(owner)
+            if cached is None or cached[0] != signature:
+                rows = self._conn.execute(
+                    "SELECT key, vector FROM answers WHERE owner = ? AND version = ? AND vector IS NOT NULL",
+                    (owner, version),
+                ).fetchall()
+                matrix = np.stack([np.frombuffer(v, dtype=np.float32) for _, v in rows]) if rows else None
+                if matrix is not None:
+                    matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+                cached = self._matrices[owner] = (signature, matrix, [k for k, _ in rows])
+                while len(self._matrices) > ANSWER_CACHE_MATRICES:
+                    self._matrices.popitem(last=False)
+            self._matrices.move_to_end(owner)
+            _, matrix, keys = cached
+            if matrix is not None:
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    row = self._conn.execute(
+                        "SELECT answer, sources, created FROM answers WHERE owner = ? AND key = ? AND version = ?",
+                        (owner, keys[best], version),
+                    ).fetchone()
+                    entry = self._entry(row) if row is not None else None
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def put(self, user_id, question: str, version, answer: str, sources=None,
+            vector: Optional[List[float]] = None):
+        owner = self._owner(user_id)
+        blob = np.asarray(vector, dtype=np.float32).tobytes() if vector is not None else None
+        with self._lock:
+            # Entries for an older corpus version can never hit again
+            self._conn.execute("DELETE FROM answers WHERE owner = ? AND version != ?", (owner, str(version)))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (owner, user_id, key, version, answer, sources, vector, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (owner, self._user_id(user_id), normalize_question(question), str(version), answer,
+                 json.dumps(sources or []), blob, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE owner = ? AND rowid NOT IN"
+                " (SELECT rowid FROM answers WHERE owner = ? ORDER BY created DESC LIMIT ?)",
+                (owner, owner, self.max_per_user),
+            )
+            self._conn.commit()
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+            self._matrices.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            users, entries = self._conn.execute("SELECT COUNT(DISTINCT user_id), COUNT(*) FROM answers").fetchone()
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "backend": "sqlite",
+                "users": users,
+                "entries": entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def make_answer_cache():
+    """
+    The answer cache for ANSWER_CACHE_BACKEND. Any class with AnswerCache's
+    get_exact / get_similar / record_miss / put / invalidate / stats can be
+    plugged in here.
+    """
+    if ANSWER_CACHE_BACKEND == "sqlite":
+        return SQLiteAnswerCache()
+    if ANSWER_CACHE_BACKEND != "memory":
+        raise ValueError(f"Unknown ANSWER_CACHE_BACKEND: {ANSWER_CACHE_BACKEND}")
+    return AnswerCache()
+
+
+answer_cache = make_answer_cache()
+
+
+def lookup(user_id: int, question: str, version, embed_query: Callable[[str], Optional[List[float]]]):
+    """
+    Returns (entry, question_vector). The vector is computed only when the
+    exact lookup misses; the embedding cache makes the retriever's own
+    embed_query for the same question free afterwards. embed_query may
+    return None when retrieval won't embed the question either, and only
+    the exact lookup applies then.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    entry = answer_cache.get_exact(user_id, question, version)
+    if entry is not None:
+        metrics.CACHE_REQUESTS.inc(cache="answer", result="hit")
+        return entry, None
+    vector = embed_query(question)
+    if vector is None:
+        answer_cache.record_miss()
+        metrics.CACHE_REQUESTS.inc(cache="answer", result="miss")
+        return None, None
+    entry = answer_cache.get_similar(user_id, vector, version)
+    metrics.CACHE_REQUESTS.inc(cache="answer", result="similar_hit" if entry is not None else "miss")
+    return entry, vector
+
+
+def store(user_id: int, question: str, version, answer: str, sources=None,
+          vector: Optional[List[float]] = None):
+    """
+    Caches a generated answer; a no-op when the cache is disabled, like lookup.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return
+    answer_cache.put(user_id, question, version, answer, sources, vector)
@@ -1,9 +1,13 @@
 import os
+import time
+import threading
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from jose import JWTError, jwt
@@ -18,6 +22,10 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")  # Change in production!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated principals are cached briefly so the hot path skips SQLite
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX = 10000
+
 # Path Configuration (Up 3 levels: app -> backend -> project_root)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
@@ -76,7 +84,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return new_user
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def login_for_access_token(user: schemas.UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
     if not db_user or not verify_password(user.password, db_user.hashed_password):
         raise HTTPException(
@@ -89,13 +97,63 @@ def login_for_access_token(user: schemas.UserCreate, db: Session = Depends(get_d
     access_token = create_access_token(
         data={"sub": str(db_user.id)}, expires_delta=access_token_expires
     )
+    # Open the user's vector store now so their first /chat skips initialization
+    background_tasks.add_task(_warm_up_store, db_user.id)
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _warm_up_store(user_id: int):
+    # Imported here: chromadb is only loaded once someone actually logs in
+    from . import vector_store
+    vector_store.warm_up(user_id)
+
 oauth2_scheme = Depends(database.SessionLocal) # Placeholder, correct generic way below:
 from fastapi.security import OAuth2PasswordBearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated user as seen by request handlers (no ORM session attached).
+    """
+    id: int
+    email: str
+
+
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def invalidate_user(user_id: int):
+    with _user_cache_lock:
+        _user_cache.pop(int(user_id), None)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _on_user_change(mapper, connection, target):
+    invalidate_user(target.id)
+
+def _load_principal(user_id: int) -> Optional[Principal]:
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+    db = database.SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is None:
+            return None
+        principal = Principal(id=user.id, email=user.email)
+    finally:
+        db.close()
+
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_MAX:
+            _user_cache.clear()
+        _user_cache[user_id] = (principal, now + USER_CACHE_TTL)
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -109,8 +167,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
+    # A DB session is only opened on a cache miss
+    user = _load_principal(int(user_id))
     if user is None:
         raise credentials_exception
     return user
-
@@ -0,0 +1,136 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+from . import tokens, metrics
+
+# Configuration
+# Prompt tokens available for retrieved context (0 = no packing, legacy join of all chunks)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Share of a chunk's word trigrams already in a better-ranked segment above which it is dropped
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.9"))
+
+# The chunker repeats up to CHUNK_OVERLAP_TOKENS=80 tokens (80 characters with
+# the legacy splitter) between neighbours; allow for long tokens and separators
+# and require enough overlap to be unambiguous.
+MAX_OVERLAP_CHARS = 800
+MIN_OVERLAP_CHARS = 20
+# "Content: ...\nSource: ..., Ref: ..." wrapper and the blank line between chunks
+PER_CHUNK_OVERHEAD_TOKENS = 16
+
+_WORD = re.compile(r"\w+")
+
+
+def _location(doc: Document) -> Tuple[str, str]:
+    metadata = doc.metadata
+    return (
+        metadata.get("document_name", ""),
+        str(metadata.get("page_number", metadata.get("row_range", ""))),
+    )
+
+
+def merge_overlap(a: str, b: str) -> Optional[str]:
+    """
+    Joins two chunks of the same page if one contains the other or the end
+    of one repeats the start of the other; returns None when they don't touch.
+    """
+    if b in a:
+        return a
+    if a in b:
+        return b
+    limit = min(len(a), len(b), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:size]):
+            return a + b[size:]
+        if b.endswith(a[:size]):
+            return b + a[size:]
+    return None
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _covered(candidate: set, other: set) -> float:
+    if not candidate:
+        return 1.0
+    return len(candidate & other) / len(candidate)
+
+
+def _merge_neighbours(docs: List[Document]) -> List[Document]:
+    """
+    Collapses overlapping chunks that share a file and page/row range into
+    one segment. Segments keep the metadata of their best-ranked chunk and
+    the rank order of that chunk.
+    """
+    segments: List[Document] = []
+    by_location: Dict[Tuple[str, str], List[int]] = {}
+    for doc in docs:
+        location = _location(doc)
+        text = doc.page_content
+        merged_into = None
+        for index in by_location.get(location, []):
+            segment = segments[index]
+            if segment is None:
+                continue
+            joined = merge_overlap(segment.page_content, text)
+            if joined is None:
+                continue
+            if merged_into is None:
+                segment.page_content = joined
+                merged_into = index
+            else:
+                # The new chunk bridged two earlier segments: fold the later one in
+                segments[merged_into].page_content = joined
+                segments[index] = None
+            text = segments[merged_into].page_content
+        if merged_into is None:
+            by_location.setdefault(location, []).append(len(segments))
+            segments.append(Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata)))
+    return [s for s in segments if s is not None]
+
+
+def _drop_near_duplicates(docs: List[Document], threshold: float) -> List[Document]:
+    kept: List[Document] = []
+    kept_shingles: List[set] = []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(_covered(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_documents(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET,
+                   dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Document]:
+    """
+    Turns ranked retrieval results into the context actually sent to the LLM:
+    overlapping neighbours are merged, near-duplicates dropped, and segments
+    taken in rank order while they fit the token budget. The best segment is
+    always kept so a tight budget never yields an empty context.
+    """
+    if budget <= 0 or not docs:
+        return docs
+
+    segments = _drop_near_duplicates(_merge_neighbours(docs), dedup_threshold)
+    costs = tokens.count_tokens_batch([s.page_content for s in segments], tokens.LLM_ENCODING_NAME)
+
+    packed = []
+    used = 0
+    for segment, cost in zip(segments, costs):
+        cost += PER_CHUNK_OVERHEAD_TOKENS
+        if packed and used + cost > budget:
+            continue
+        packed.append(segment)
+        used += cost
+    metrics.TOKENS.inc(used, kind="context")
+    return packed
@@ -0,0 +1,246 @@
+import os
+import asyncio
+import base64
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+import httpx
+import numpy as np
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    from langchain.embeddings.base import Embeddings
+from dotenv import load_dotenv
+
+from .tokens import count_tokens_batch
+from . import metrics
+
+load_dotenv()
+
+# Configuration
+# Point EMBEDDING_API_BASE at scripts/fake_embedding_server.py to benchmark offline
+EMBEDDING_API_BASE = os.getenv("EMBEDDING_API_BASE", os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "8000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))  # API hard limit is 2048 inputs
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "60"))
+# Longest wait between retries, whether from backoff or the server's Retry-After
+MAX_RETRY_DELAY = 30.0
+# Per-input context of text-embedding-3-*; longer inputs are budgeted at this size
+MAX_INPUT_TOKENS = 8191
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date),
+    capped at MAX_RETRY_DELAY; None when absent or unparseable.
+    """
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        delay = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), MAX_RETRY_DELAY)
+
+
+def pack_batches(texts: List[str], max_tokens: int = EMBED_BATCH_TOKENS, max_items: int = EMBED_BATCH_SIZE) -> List[List[int]]:
+    """
+    Groups text indices into batches whose summed token count stays under
+    max_tokens. Order is preserved so results can be reassembled by index.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i, n_tokens in enumerate(count_tokens_batch(texts)):
+        n_tokens = min(n_tokens, MAX_INPUT_TOKENS)
+        if current and (current_tokens + n_tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _decode_embedding(value) -> List[float]:
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype=np.float32).tolist()
+    return value
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency window: halves on congestion (a 429, a 5xx or a failed
+    connection), grows by one after a run of successes, never exceeds the
+    configured ceiling.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, throttled: bool = False):
+        async with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class EmbeddingAPIError(Exception):
+    """
+    The embedding API kept failing (5xx or connection errors) through every retry.
+    """
+
+
+class RateLimitedError(EmbeddingAPIError):
+    """
+    The embedding API kept answering 429 through every retry.
+    """
+
+
+class BatchEmbedder(Embeddings):
+    """
+    Embeds texts by calling the OpenAI-compatible /embeddings endpoint with
+    token-budgeted batches sent concurrently over one pooled HTTP client.
+    The client lives on a private event loop thread so synchronous callers
+    (ingestion workers, LangChain retrievers) can share its connection pool.
+    """
+
+    def __init__(self, model: str, api_base: str = EMBEDDING_API_BASE, api_key: Optional[str] = None,
+                 concurrency: int = EMBED_CONCURRENCY, batch_tokens: int = EMBED_BATCH_TOKENS,
+                 batch_size: int = EMBED_BATCH_SIZE):
+        self.model = model
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+        self.concurrency = concurrency
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self._loop = None
+        self._client = None
+        self._limiter = None
+        self._start_lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.failures = 0  # 5xx responses and transport errors, each retried
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="embedder-loop", daemon=True).start()
+                self._client = asyncio.run_coroutine_threadsafe(self._make_client(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _make_client(self):
+        self._limiter = AdaptiveLimiter(self.concurrency)
+        return httpx.AsyncClient(
+            base_url=self.api_base,
+            headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else {},
+            timeout=EMBED_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+
+    async def _post_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            await self._limiter.acquire()
+            congested = False
+            retry_after = None
+            try:
+                self.requests += 1
+                # base64 float32 payloads are ~4x smaller and far cheaper to parse than JSON floats
+                response = await self._client.post(
+                    "/embeddings",
+                    json={"model": self.model, "input": batch, "encoding_format": "base64"},
+                )
+                if response.status_code == 429:
+                    congested = True
+                    self.throttled += 1
+                    retry_after = response.headers.get("retry-after")
+                    if attempt == EMBED_MAX_RETRIES:
+                        raise RateLimitedError(f"Embedding API returned 429 after {attempt + 1} attempts")
+                elif response.status_code >= 500:
+                    congested = True
+                    self.failures += 1
+                    retry_after = response.headers.get("retry-after")
+                    if attempt == EMBED_MAX_RETRIES:
+                        raise EmbeddingAPIError(
+                            f"Embedding API returned {response.status_code} after {attempt + 1} attempts"
+                        )
+                else:
+                    response.raise_for_status()
+                    body = response.json()
+                    metrics.TOKENS.inc(body.get("usage", {}).get("total_tokens", 0), kind="embedding")
+                    data = sorted(body["data"], key=lambda d: d["index"])
+                    return [_decode_embedding(d["embedding"]) for d in data]
+            except httpx.TransportError as e:
+                # Dropped connections and timeouts: back off and retry like a 5xx
+                congested = True
+                self.failures += 1
+                if attempt == EMBED_MAX_RETRIES:
+                    raise EmbeddingAPIError(
+                        f"Embedding API unreachable after {attempt + 1} attempts: {e!r}"
+                    ) from e
+            finally:
+                await self._limiter.release(throttled=congested)
+
+            # Exponential backoff with full jitter, or the server's hint if given
+            delay = retry_after_seconds(retry_after)
+            if delay is None:
+                delay = random.uniform(0, min(MAX_RETRY_DELAY, 0.5 * 2 ** attempt))
+            await asyncio.sleep(delay)
+
+    async def _embed_all(self, texts: List[str]) -> List[List[float]]:
+        batches = pack_batches(texts, self.batch_tokens, self.batch_size)
+        results = await asyncio.gather(*(self._post_batch([texts[i] for i in b]) for b in batches))
+        vectors: List[List[float]] = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._embed_all(texts), loop).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        loop = self._ensure_loop()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._embed_all(texts), loop))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
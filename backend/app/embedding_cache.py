@@ -0,0 +1,223 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Union
+
+import numpy as np
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    from langchain.embeddings.base import Embeddings
+
+from . import metrics
+
+# Configuration
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(DATA_DIR / "embedding_cache.db"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "256"))
+# After going over budget, evict down to this fraction so we don't evict on every insert
+EVICT_TARGET_RATIO = 0.9
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, size-bounded store of embeddings shared by all users.
+    Vectors are stored as float32 blobs in SQLite; least recently used rows
+    are evicted once the total blob size exceeds max_bytes. The running size
+    is kept in the database, so several worker processes can share the file.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value)"
+            " SELECT 'total_bytes', COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        )
+        self._conn.commit()
+        self._total_bytes = self._read_total_bytes()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0  # UTF-8 text bytes we did not have to send to the API
+        self.evictions = 0
+
+    def get_many(self, model: str, texts: List[str], as_arrays: bool = False) -> List[Optional[Sequence[float]]]:
+        """
+        Cached vectors for texts, None where missing. as_arrays returns float32
+        arrays instead of lists, skipping the list conversion for NumPy callers.
+        """
+        keys = [cache_key(model, t) for t in texts]
+        with self._lock:
+            found = self._fetch_locked(keys, as_arrays)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+
+            results = []
+            for key, text in zip(keys, texts):
+                vector = found.get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self.bytes_saved += len(text.encode("utf-8"))
+                results.append(vector)
+        return results
+
+    def peek_many(self, model: str, texts: List[str], as_arrays: bool = False) -> List[Optional[Sequence[float]]]:
+        """
+        Like get_many, but read-only: no last_used update (so no write lock on
+        the shared file) and no hit/miss counting. For query-time readers.
+        """
+        keys = [cache_key(model, t) for t in texts]
+        with self._lock:
+            found = self._fetch_locked(keys, as_arrays)
+        return [found.get(key) for key in keys]
+
+    def _fetch_locked(self, keys: List[str], as_arrays: bool) -> dict:
+        found = {}
+        # SQLite caps bound parameters, so look up in slices
+        for i in range(0, len(keys), 500):
+            batch = list(set(keys[i:i + 500]))
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                found[key] = vector if as_arrays else vector.tolist()
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows[cache_key(model, text)] = (len(vector), blob)
+        if not rows:
+            return
+        with self._lock:
+            # Take the write lock before looking: another worker may be
+            # inserting the same keys
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                keys = list(rows)
+                existing = set()
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    existing.update(k for (k,) in self._conn.execute(
+                        f"SELECT key FROM embeddings WHERE key IN ({placeholders})", batch
+                    ))
+                new_rows = [(k, dim, blob, now) for k, (dim, blob) in rows.items() if k not in existing]
+                self._conn.executemany(
+                    "INSERT INTO embeddings (key, dim, vector, last_used) VALUES (?, ?, ?, ?)", new_rows
+                )
+                self._add_total_bytes(sum(len(r[2]) for r in new_rows))
+                if self._total_bytes > self.max_bytes:
+                    self._evict_locked()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _read_total_bytes(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()[0]
+
+    def _add_total_bytes(self, delta: int):
+        # Read back: other processes add to the same counter
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_bytes'", (delta,))
+        self._total_bytes = self._read_total_bytes()
+
+    def _evict_locked(self):
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        cursor = self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC")
+        doomed = []
+        freed = 0
+        for key, size in cursor:
+            if self._total_bytes - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        cursor.close()
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._add_total_bytes(-freed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "size_bytes": self._read_total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings client so only cache misses reach the embedding API.
+    `cache` is an EmbeddingCache, or a function returning one that is called
+    on first use (so the cache file isn't opened at import).
+    """
+
+    def __init__(self, underlying: Embeddings, cache: Union[EmbeddingCache, Callable[[], EmbeddingCache]],
+                 model: str):
+        self.underlying = underlying
+        self._cache = cache
+        self.model = model
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache() if callable(self._cache) else self._cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model, texts)
+
+        # Identical chunks within one upload are embedded once
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        metrics.CACHE_REQUESTS.inc(len(texts) - len(missing), cache="embedding", result="hit")
+        metrics.CACHE_REQUESTS.inc(len(missing), cache="embedding", result="miss")
+        if missing:
+            with metrics.span("embed", inputs=len(missing)):
+                fresh = self.underlying.embed_documents(missing)
+            self.cache.put_many(self.model, missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
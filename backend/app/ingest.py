@@ -1,8 +1,9 @@
 import os
-import uuid
-from typing import List, Dict, Any
+import hashlib
+from functools import lru_cache
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import pandas as pd
-import pdfplumber
+from pandas.api.types import is_numeric_dtype, is_object_dtype
 try:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 except ImportError:
@@ -12,7 +13,17 @@ try:
 except ImportError:
     from langchain.schema import Document
 
-# PRD Section 7: Processed with strict constraints
+from .tokens import count_tokens_batch
+from . import pdf_extract, metrics
+from .splitter import CharacterSplitter, make_token_splitter
+
+# PRD Section 7: Processed with strict constraints (400-token chunks)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "80"))
+# "token" splits on tiktoken tokens; "char" is the legacy splitter that
+# counted characters as tokens (TEXT_SPLITTER below)
+CHUNKER = os.getenv("CHUNKER", "token").lower()
+
 TEXT_SPLITTER = RecursiveCharacterTextSplitter(
     chunk_size=400,
     chunk_overlap=80,
@@ -20,128 +31,218 @@ TEXT_SPLITTER = RecursiveCharacterTextSplitter(
     is_separator_regex=False,
 )
 
-def process_file(file_path: str, original_filename: str, user_id: int) -> List[Document]:
+# Tabular ingestion: rows are grouped into blocks of about TABLE_BLOCK_TOKENS
+# tokens (set it to 0 for the legacy fixed ROWS_PER_BLOCK grouping).
+TABLE_BLOCK_TOKENS = int(os.getenv("TABLE_BLOCK_TOKENS", "400"))
+ROWS_PER_BLOCK = 10
+# Tables are serialized in slices of this many rows, so only one slice's row
+# text is held at a time
+TABLE_READ_CHUNK_ROWS = int(os.getenv("TABLE_READ_CHUNK_ROWS", "5000"))
+# TXT files are read in blocks of about this many characters, cut at a blank
+# line where possible, instead of loading the whole file into one Document
+TXT_BLOCK_CHARS = int(os.getenv("TXT_BLOCK_CHARS", "65536"))
+
+def _read_text_blocks(file_path: str, block_chars: int = TXT_BLOCK_CHARS) -> Iterator[str]:
     """
-    Extracts text from PDF, TXT, CSV, or XLSX and returns a list of LangChain Documents.
+    Yields the file in paragraph-aligned blocks. A block is closed at the
+    first blank line after block_chars, or unconditionally at twice that, so
+    files smaller than one block come back whole and unchanged.
+    """
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = []
+        size = 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= 2 * block_chars or (size >= block_chars and not line.strip()):
+                yield "".join(lines)
+                lines, size = [], 0
+        if lines:
+            yield "".join(lines)
+
+def _read_table(file_path: str, ext: str) -> Iterator[pd.DataFrame]:
+    """
+    The cleaned table in slices of TABLE_READ_CHUNK_ROWS rows. The file is
+    parsed and cleaned whole (uploads are capped at 5 MB): a chunked
+    read_csv infers dtypes per slice, so a column could render as "1" above
+    a slice boundary and "1.0" below it, changing text and chunk ids.
+    """
+    df = pd.read_csv(file_path) if ext == ".csv" else pd.read_excel(file_path)
+    # Basic cleaning (PRD Section 7: Step 2)
+    df = df.dropna(how="all")
+    df = df.fillna("")
+    for start in range(0, len(df), TABLE_READ_CHUNK_ROWS):
+        yield df.iloc[start:start + TABLE_READ_CHUNK_ROWS]
+
+def serialize_rows(df: pd.DataFrame) -> List[str]:
+    """
+    Renders each row as "col: val | col: val" using column-wise string
+    operations instead of iterrows(). Output matches the previous
+    per-row f-string serialization exactly.
+    """
+    if df.empty:
+        return []
+    # iterrows() upcast all-numeric rows to one dtype (ints rendered as "3.0");
+    # apply the same interleaved dtype so the text doesn't change.
+    if all(is_numeric_dtype(dtype) for dtype in df.dtypes) and df.dtypes.nunique() > 1:
+        df = df.astype(df.to_numpy().dtype)
+
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        # astype(str) matches str() for numeric and object columns; datetimes
+        # and other extension types format differently, so map str() there.
+        if is_numeric_dtype(series.dtype) or is_object_dtype(series.dtype):
+            text = series.astype(str)
+        else:
+            text = series.map(str)
+        columns.append(f"{col}: " + text)
+    if len(columns) == 1:
+        return columns[0].tolist()
+    return columns[0].str.cat(columns[1:], sep=" | ").tolist()
+
+def _table_blocks(frames: Iterable[pd.DataFrame]) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yields (text_block, start_row, end_row) across all frames (cleaned
+    slices from _read_table), carrying a partially filled block over slice
+    boundaries.
+    """
+    buffer, labels, buffer_tokens = [], [], 0
+    start_row = 0
+
+    for df in frames:
+        row_texts = serialize_rows(df)
+        row_labels = df.index.tolist()
+        row_tokens = count_tokens_batch(row_texts) if TABLE_BLOCK_TOKENS > 0 else None
+
+        for i, row_str in enumerate(row_texts):
+            if row_tokens is not None and buffer and buffer_tokens + row_tokens[i] > TABLE_BLOCK_TOKENS:
+                yield "\n".join(buffer), start_row, labels[-1]
+                start_row = labels[-1] + 1
+                buffer, labels, buffer_tokens = [], [], 0
+
+            buffer.append(row_str)
+            labels.append(row_labels[i])
+            if row_tokens is not None:
+                buffer_tokens += row_tokens[i]
+            elif len(buffer) >= ROWS_PER_BLOCK:
+                yield "\n".join(buffer), start_row, labels[-1]
+                start_row = labels[-1] + 1
+                buffer, labels = [], []
+
+    # Remaining rows
+    if buffer:
+        yield "\n".join(buffer), start_row, start_row + len(buffer) - 1
+
+@metrics.timed("extract")
+def iter_documents(file_path: str, original_filename: str, user_id: int,
+                   source_file: Optional[str] = None) -> Iterator[Document]:
+    """
+    Extracts text from PDF, TXT, CSV, or XLSX and yields LangChain Documents
+    one page / row block at a time, so downstream stages can start early.
+    `source_file` is the path recorded on the chunks when file_path is a
+    staged copy (defaults to file_path).
     """
     ext = os.path.splitext(file_path)[1].lower()
-    docs = []
-
-    try:
-        if ext == ".pdf":
-            with pdfplumber.open(file_path) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    text = page.extract_text() or ""
-                    if text.strip():
-                        docs.append(Document(
-                            page_content=text,
-                            metadata={
-                                "user_id": user_id,
-                                "document_name": original_filename,
-                                "page_number": i + 1,
-                                "source_file": file_path
-                            }
-                        ))
-        
-        elif ext == ".txt":
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-                if text.strip():
-                     docs.append(Document(
-                        page_content=text,
-                        metadata={
-                            "user_id": user_id,
-                            "document_name": original_filename,
-                            "page_number": 1,
-                            "source_file": file_path
-                        }
-                    ))
-
-        elif ext in [".csv", ".xlsx", ".xls"]:
-            if ext == ".csv":
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-            
-            # Basic cleaning (PRD Section 7: Step 2)
-            df.dropna(how="all", inplace=True)
-            df = df.fillna("")
-            
-            # Convert rows to string format for embedding
-            # Grouping generic chunks provided by pandas or iterating rows? 
-            # PRD implies strictly managing tokens, but for CSV structure retrieval is tricky.
-            # Strategy: Convert each row to a string, then chunk normally, 
-            # OR typically for RAG on CSV, each row is a doc.
-            # Given the constraint of "Text Extraction" then "Chunking", 
-            # let's convert the dataframe to a string representation but keep track of rows?
-            # Better approach for PRD "Structured Data" section 12 implies Pandas computes, LLM explains.
-            # But for RAG retrieval, we need text.
-            # Let's simple-serialize 10 rows at a time or just standard text conversion.
-            # PRD Section 7 Step 1: "CSV/XLSX -> pandas".
-            # PRD Section 12: "Pandas executes computations... No LLM-driven calculations"
-            # This implies the RAG part is mostly for finding *context* or explanation?
-            # Let's serialize rows into text blocks roughly matching chunk size or just full text.
-            # To support "row_range" metadata, we need to manually chunk by rows.
-            
-            rows_buffer = []
-            start_row = 0
-            ROWS_PER_BLOCK = 10 # heuristic to fit in 400 tokens vaguely
-            
-            for index, row in df.iterrows():
-                row_str = " | ".join(f"{col}: {val}" for col, val in row.items())
-                rows_buffer.append(row_str)
+    source_file = source_file or file_path
+
+    if ext == ".pdf":
+        # Parallel page-range extraction for large PDFs (see pdf_extract)
+        for page_number, text in pdf_extract.iter_pages(file_path):
+            if text.strip():
+                yield Document(
+                    page_content=text,
+                    metadata={
+                        "user_id": user_id,
+                        "document_name": original_filename,
+                        "page_number": page_number,
+                        "source_file": source_file
+                    }
+                )
+    
+    elif ext == ".txt":
+        for text in _read_text_blocks(file_path):
+            if text.strip():
+                yield Document(
+                    page_content=text,
+                    metadata={
+                        "user_id": user_id,
+                        "document_name": original_filename,
+                        "page_number": 1,
+                        "source_file": source_file
+                    }
+                )
+
+    elif ext in [".csv", ".xlsx", ".xls"]:
+        # PRD Section 7 Step 1: "CSV/XLSX -> pandas".
+        # PRD Section 12: "Pandas executes computations... No LLM-driven calculations"
+        # For RAG retrieval we still need text, so rows are serialized as
+        # "col: val | ..." lines and grouped into blocks with "row_range" metadata.
+        for text_block, start_row, end_row in _table_blocks(_read_table(file_path, ext)):
+            yield Document(
+                page_content=text_block,
+                metadata={
+                    "user_id": user_id,
+                    "document_name": original_filename,
+                    "row_range": f"rows {start_row}-{end_row}",
+                    "source_file": source_file
+                }
+            )
                 
-                if len(rows_buffer) >= ROWS_PER_BLOCK:
-                    text_block = "\n".join(rows_buffer)
-                    end_row = index
-                    docs.append(Document(
-                        page_content=text_block,
-                        metadata={
-                            "user_id": user_id,
-                            "document_name": original_filename,
-                            "row_range": f"rows {start_row}-{end_row}",
-                            "source_file": file_path
-                        }
-                    ))
-                    rows_buffer = []
-                    start_row = index + 1
-            
-            # Remaining rows
-            if rows_buffer:
-                text_block = "\n".join(rows_buffer)
-                end_row = start_row + len(rows_buffer) - 1
-                docs.append(Document(
-                        page_content=text_block,
-                        metadata={
-                            "user_id": user_id,
-                            "document_name": original_filename,
-                            "row_range": f"rows {start_row}-{end_row}",
-                            "source_file": file_path
-                        }
-                    ))
-                    
-        else:
-            raise ValueError(f"Unsupported file type: {ext}")
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
 
-    except Exception as e:
-        # print(f"Error processing file {file_path}: {e}")
-        raise e
+def process_file(file_path: str, original_filename: str, user_id: int) -> List[Document]:
+    """
+    Extracts text from PDF, TXT, CSV, or XLSX and returns a list of LangChain Documents.
+    """
+    return list(iter_documents(file_path, original_filename, user_id))
 
-    return docs
+def make_chunk_id(metadata: Dict[str, Any], ordinal: int, text: str) -> str:
+    """
+    Deterministic chunk id from the file, page/row location and chunk text,
+    so an unchanged chunk keeps its id across re-uploads.
+    """
+    location = metadata.get("page_number", metadata.get("row_range", ""))
+    key = f"{metadata.get('document_name', '')}\0{location}\0{ordinal}\0{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
 
+@lru_cache(maxsize=1)
+def get_splitter():
+    """
+    The configured splitter. Without the tiktoken encoding (offline) the
+    token chunker degrades to the character splitter at ~4 characters per token.
+    """
+    if CHUNKER == "char":
+        return CharacterSplitter(TEXT_SPLITTER)
+    splitter = make_token_splitter(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    if splitter is None:
+        return CharacterSplitter(RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_TOKENS * 4,
+            chunk_overlap=CHUNK_OVERLAP_TOKENS * 4,
+            length_function=len,
+            is_separator_regex=False,
+        ))
+    return splitter
+
+@metrics.timed("chunk_text")
 def chunk_text(documents: List[Document]) -> List[Document]:
     """
-    Splits documents into chunks of 400 tokens (approx characters) with overlap.
-    Adds unique chunk_id to metadata.
+    Splits documents into chunks of CHUNK_TOKENS tokens with overlap, one
+    page / row block at a time. Adds a deterministic chunk_id to metadata.
     """
-    chunked_docs = TEXT_SPLITTER.split_documents(documents)
-    
-    for doc in chunked_docs:
-        # Generate unique chunk ID (PRD Section 7)
-        doc.metadata["chunk_id"] = str(uuid.uuid4())
-        
-        # Ensure row_range or page_number persists correctly
-        # The splitter keeps metadata from source doc.
-        pass
-        
+    chunked_docs = []
+    # One batched encode for all pages in the batch
+    pieces = get_splitter().split_texts([doc.page_content for doc in documents])
+    for source_doc, texts in zip(documents, pieces):
+        seen = {}
+        for text in texts:
+            # Chunks keep the metadata (page_number / row_range) of their source doc
+            metadata = dict(source_doc.metadata)
+            # Generate chunk ID (PRD Section 7); ordinal separates repeated text on one page
+            ordinal = seen.get(text, 0)
+            seen[text] = ordinal + 1
+            metadata["chunk_id"] = make_chunk_id(metadata, ordinal, text)
+            chunked_docs.append(Document(page_content=text, metadata=metadata))
+
     return chunked_docs
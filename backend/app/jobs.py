@@ -0,0 +1,432 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+# ingest, vector_store and lexical_index pull in pandas/pdfplumber/chromadb;
+# they are imported by the worker on first use so startup stays light.
+from . import models, database, manifest, metrics, locks
+
+# Bounded worker pool: extraction, chunking and embedding run here instead of
+# on the event loop, so one large upload cannot stall /chat.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+# Pages / row blocks extracted before handing a batch to chunk -> index -> embed
+INGEST_BATCH_DOCS = int(os.getenv("INGEST_BATCH_DOCS", "16"))
+# Extraction runs ahead of chunk/embed by at most this many batches (backpressure)
+INGEST_PREFETCH_BATCHES = int(os.getenv("INGEST_PREFETCH_BATCHES", "2"))
+# Upper bound on chunks embedded and stored per call, so one huge page or
+# text block never holds all of its vectors in memory at once
+INGEST_EMBED_CHUNKS = int(os.getenv("INGEST_EMBED_CHUNKS", "256"))
+
+STAGES = ("extract", "chunk", "index", "embed", "prune")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# Running + waiting jobs; submissions beyond this are rejected instead of piling up.
+_slots = threading.BoundedSemaphore(INGEST_WORKERS + INGEST_QUEUE_SIZE)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class QuotaExceededError(Exception):
+    pass
+
+
+def staging_path(files_dir: Path, filename: str) -> Path:
+    """
+    Where an upload waits, next to the file it replaces, until its job swaps
+    it in. Nothing but that job touches it.
+    """
+    return Path(files_dir) / f".{uuid.uuid4().hex}.{filename}"
+
+
+def active_job(db, user_id: int, filename: str) -> Optional[models.IngestionJob]:
+    return db.query(models.IngestionJob).filter(
+        models.IngestionJob.user_id == user_id,
+        models.IngestionJob.filename == filename,
+        models.IngestionJob.status.in_(ACTIVE_STATUSES)
+    ).first()
+
+
+def create_job(db, user_id: int, filename: str, file_path: str) -> models.IngestionJob:
+    """
+    Persists a new queued job for an upload staged at `file_path` (see
+    staging_path). Call submit() once the row is committed.
+    """
+    job = models.IngestionJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        file_path=file_path,
+        status="queued",
+        stages={stage: {"status": "pending"} for stage in STAGES},
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def submit(job_id: str):
+    """
+    Hands a persisted job to the worker pool. Raises QueueFullError when the
+    pool and its waiting queue are saturated.
+    """
+    if not _slots.acquire(blocking=False):
+        raise QueueFullError("Ingestion queue is full, try again shortly.")
+    future = _executor.submit(run_job, job_id)
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def job_progress(job: models.IngestionJob) -> float:
+    stages = job.stages or {}
+    done = sum(1 for stage in STAGES if stages.get(stage, {}).get("status") == "done")
+    return done / len(STAGES)
+
+
+def _update_stage(db, job, stage: str, **fields):
+    # JSON columns are not mutation-tracked; reassign a copy so the change is flushed.
+    stages = dict(job.stages or {})
+    entry = dict(stages.get(stage, {}))
+    entry.update(fields)
+    stages[stage] = entry
+    job.stages = stages
+    db.commit()
+
+
+class _StageTracker:
+    """
+    Accumulates per-stage wall time and item counts across pipelined batches
+    and mirrors them onto the job row.
+    """
+
+    def __init__(self, db, job):
+        self.db = db
+        self.job = job
+        self.totals = {stage: 0.0 for stage in STAGES}
+        self.items = {stage: 0 for stage in STAGES}
+
+    def _record(self, stage: str, elapsed: float, n_items: int, status: str = "running"):
+        self.totals[stage] += elapsed
+        self.items[stage] += n_items
+        metrics.INGEST_STAGE_SECONDS.observe(elapsed, stage=stage)
+        _update_stage(self.db, self.job, stage, status=status,
+                      duration_ms=round(self.totals[stage] * 1000, 2), items=self.items[stage])
+
+    def run(self, stage: str, func, *args, items: int = None):
+        self.job.current_stage = stage
+        start = time.perf_counter()
+        result = func(*args)
+        if items is None:
+            items = len(result) if isinstance(result, list) else 0
+        self._record(stage, time.perf_counter() - start, items)
+        return result
+
+    def batches(self, stage: str, iterator, size: int):
+        """
+        Groups an iterator into lists of `size`, charging the time spent
+        waiting on it to `stage`.
+        """
+        iterator = iter(iterator)
+        while True:
+            self.job.current_stage = stage
+            start = time.perf_counter()
+            batch = []
+            for item in iterator:
+                batch.append(item)
+                if len(batch) >= size:
+                    break
+            self._record(stage, time.perf_counter() - start, len(batch))
+            if not batch:
+                return
+            yield batch
+
+    def finish(self):
+        for stage in STAGES:
+            _update_stage(self.db, self.job, stage, status="done")
+
+
+def _count_units(raw_docs, page_count: int, row_count: int):
+    for doc in raw_docs:
+        if "row_range" in doc.metadata:
+            start, end = doc.metadata["row_range"].split(" ", 1)[1].split("-")
+            row_count += int(end) - int(start) + 1
+        else:
+            page_count = max(page_count, doc.metadata.get("page_number", 0))
+    return page_count, row_count
+
+
+_END = object()
+
+
+def _prefetch(iterator, depth: int):
+    """
+    Pulls `iterator` on a helper thread, at most `depth` items ahead of the
+    consumer; the bounded queue is the backpressure between extraction and
+    the chunk/embed stages. Errors are re-raised in the consumer, and
+    stopping early closes the source (cancelling pending PDF ranges).
+    """
+    items = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, name="ingest-prefetch", daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _prune_chunks(user_id: int, chunk_ids: list):
+    from . import lexical_index, vector_store
+    lexical_index.get_index(user_id).delete_chunks(chunk_ids)
+    vector_store.delete_chunks(user_id, chunk_ids)
+
+
+def _claim(db, job_id: str) -> bool:
+    """
+    Moves a queued job to running in one UPDATE, so a job submitted by more
+    than one worker (after a restart) still runs once.
+    """
+    claimed = (
+        db.query(models.IngestionJob)
+        .filter(models.IngestionJob.id == job_id, models.IngestionJob.status == "queued")
+        .update({"status": "running", "started_at": datetime.utcnow(), "error": None}, synchronize_session=False)
+    )
+    db.commit()
+    return claimed == 1
+
+
+def run_job(job_id: str):
+    """
+    Executes one ingestion job end to end, recording per-stage timings.
+    Runs in a worker thread with its own DB session. Jobs of one user run one
+    at a time across all workers (the user's ingest lock); reads of their
+    data go on from any worker meanwhile.
+    """
+    db = database.SessionLocal()
+    try:
+        job = db.query(models.IngestionJob).filter(models.IngestionJob.id == job_id).first()
+        if job is None or job.status != "queued":
+            return
+
+        with locks.user_ingest_lock(job.user_id):
+            if not _claim(db, job_id):
+                return
+            db.refresh(job)
+            _ingest(db, job)
+    finally:
+        db.close()
+
+
+def _ingest(db, job: models.IngestionJob):
+    """
+    Runs a claimed job: extract, chunk, index, embed, prune.
+    """
+    from . import ingest, lexical_index, vector_store
+
+    manifest.set_status(db, job.user_id, job.filename, "processing")
+
+    # The upload stays in its staging path (see staging_path) until it is
+    # fully stored; the previous version keeps serving from `target` until
+    # then, and is all that is left if this job fails.
+    target = os.path.join(os.path.dirname(job.file_path), job.filename)
+    swapped = False
+    written = []
+    try:
+        tracker = _StageTracker(db, job)
+        file_hash = manifest.file_sha256(job.file_path)
+        previous = manifest.get_file(db, job.user_id, job.filename)
+
+        if previous is not None and previous.file_hash == file_hash:
+            # Byte-identical re-upload: everything is already stored
+            _swap_in(db, job, target)
+            swapped = True
+            tracker.finish()
+            manifest.set_status(db, job.user_id, job.filename, "ready")
+            total_chunks = previous.chunk_count
+        else:
+            known_ids = manifest.chunk_ids(db, previous)
+            current_ids = {}  # insertion-ordered set
+            page_count = row_count = 0
+            _, _, other_chunks = manifest.usage(db, job.user_id, exclude=job.filename)
+            chunk_allowance = manifest.MAX_CHUNKS_PER_USER - other_chunks
+
+            # Streaming pipeline: a prefetch thread extracts pages/row blocks at
+            # most INGEST_PREFETCH_BATCHES batches ahead, while this thread chunks,
+            # indexes and embeds each batch in slices of INGEST_EMBED_CHUNKS.
+            # Chunks whose deterministic id is already stored are skipped.
+            documents = _prefetch(ingest.iter_documents(job.file_path, job.filename, job.user_id, source_file=target),
+                                  INGEST_BATCH_DOCS * INGEST_PREFETCH_BATCHES)
+            try:
+                for raw_docs in tracker.batches("extract", documents, INGEST_BATCH_DOCS):
+                    page_count, row_count = _count_units(raw_docs, page_count, row_count)
+                    chunks = tracker.run("chunk", ingest.chunk_text, raw_docs)
+                    # Identical text at the same location (e.g. a paragraph repeated
+                    # across TXT blocks) shares an id and is stored once
+                    fresh = []
+                    for chunk in chunks:
+                        chunk_id = chunk.metadata["chunk_id"]
+                        if chunk_id not in current_ids and chunk_id not in known_ids:
+                            fresh.append(chunk)
+                        current_ids[chunk_id] = None
+                    if len(current_ids) > chunk_allowance:
+                        raise QuotaExceededError(
+                            f"Chunk quota exceeded ({manifest.MAX_CHUNKS_PER_USER} chunks per user)"
+                        )
+                    for start in range(0, len(fresh), INGEST_EMBED_CHUNKS):
+                        part = fresh[start:start + INGEST_EMBED_CHUNKS]
+                        written.extend(c.metadata["chunk_id"] for c in part)
+                        tracker.run("index", lexical_index.index_chunks, job.user_id, part)
+                        tracker.run("embed", vector_store.add_documents_to_chroma, job.user_id, part, items=len(part))
+            finally:
+                # Stops the prefetch thread if we bail out early
+                documents.close()
+
+            # Everything new is stored: swap the file in before the previous
+            # version loses its stale chunks
+            _swap_in(db, job, target)
+            swapped = True
+            stale = list(known_ids - current_ids.keys())
+            tracker.run("prune", _prune_chunks, job.user_id, stale, items=len(stale))
+            manifest.record_file(db, job.user_id, job.filename, file_hash, current_ids, page_count, row_count)
+            tracker.finish()
+            total_chunks = len(current_ids)
+
+        job.status = "succeeded"
+        job.chunks_processed = total_chunks
+    except Exception as e:
+        # Cleanup so a failed file does not count against the upload limit.
+        # Until the swap job.file_path is this job's staged upload, never the
+        # previous version or a later upload's (those wait in their own
+        # staging paths).
+        if job.current_stage:
+            _update_stage(db, job, job.current_stage, status="failed")
+        if not swapped and job.file_path and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        # Chunks this run already stored aren't in the manifest; drop them
+        try:
+            _prune_chunks(job.user_id, written)
+        except Exception:
+            pass
+        job.status = "failed"
+        job.error = str(e)
+        # A re-upload that failed before the swap left the previous version
+        # on disk and indexed: it stays ready
+        kept = not swapped and job.file_path != target and os.path.exists(target)
+        manifest.mark_failed(db, job.user_id, job.filename,
+                             size_bytes=os.path.getsize(target) if kept else None)
+
+    job.current_stage = None
+    job.finished_at = datetime.utcnow()
+    db.commit()
+
+
+def _swap_in(db, job: models.IngestionJob, target: str):
+    """
+    Moves a fully stored upload from its staging path over the previous
+    version. Only the job holding the user's ingest lock does this.
+    """
+    if job.file_path != target:
+        os.replace(job.file_path, target)
+        job.file_path = target
+        db.commit()
+
+
+def _abandoned(user_id: int) -> bool:
+    """
+    True when no worker holds the user's ingest lock, i.e. a job marked
+    running for them died with its process.
+    """
+    lock = locks.user_ingest_lock(user_id)
+    try:
+        lock.acquire(timeout=0)
+    except locks.Timeout:
+        return False
+    lock.release()
+    return True
+
+
+def resume_pending_jobs():
+    """
+    Re-queues jobs interrupted by a restart. Jobs whose file vanished are failed.
+    With several workers, a job still running in another live worker is left
+    alone, and queued jobs may be submitted by more than one worker (the
+    claim in run_job keeps them from running twice).
+    """
+    db = database.SessionLocal()
+    try:
+        pending = (
+            db.query(models.IngestionJob)
+            .filter(models.IngestionJob.status.in_(ACTIVE_STATUSES))
+            .order_by(models.IngestionJob.created_at)
+            .all()
+        )
+        to_submit = []
+        for job in pending:
+            if job.status == "running" and not _abandoned(job.user_id):
+                continue
+            if not job.file_path or not os.path.exists(job.file_path):
+                job.status = "failed"
+                job.error = "Uploaded file missing after restart"
+                job.finished_at = datetime.utcnow()
+                continue
+            # Stages restart from scratch; partial progress is not trusted.
+            job.status = "queued"
+            job.current_stage = None
+            job.stages = {stage: {"status": "pending"} for stage in STAGES}
+            to_submit.append(job.id)
+        db.commit()
+    finally:
+        db.close()
+
+    resumed = 0
+    for job_id in to_submit:
+        try:
+            submit(job_id)
+            resumed += 1
+        except QueueFullError:
+            # Left as queued; picked up on the next restart.
+            break
+    return resumed
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+# Configuration
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Open per-user indexes kept by the process (one SQLite connection each);
+# least recently used and idle ones are closed
+LEXICAL_INDEX_POOL_MAX = int(os.getenv("LEXICAL_INDEX_POOL_MAX", "64"))
+LEXICAL_INDEX_IDLE_TIMEOUT = float(os.getenv("LEXICAL_INDEX_IDLE_TIMEOUT", "600"))
+
+# Identifiers such as "PN-4471-B" or "net_revenue" are kept whole and also split
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how i in is it its me my of on or "
+    "the this that these those to was were what when where which who why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def query_terms(text: str) -> List[str]:
+    return list(dict.fromkeys(t for t in tokenize(text) if t not in STOPWORDS))
+
+
+def scope_sql(scope, alias: str = "chunks") -> Tuple[str, List]:
+    """
+    SQL condition (and parameters) restricting chunks to a retrieval scope:
+    ((document_name, pages or None), ...). Matches on the indexed
+    document_name column first.
+    """
+    clauses, params = [], []
+    whole = [name for name, pages in scope if pages is None]
+    if whole:
+        clauses.append(f"{alias}.document_name IN ({','.join('?' * len(whole))})")
+        params.extend(whole)
+    for name, pages in scope:
+        if pages is not None:
+            clauses.append(f"({alias}.document_name = ? AND "
+                           f"json_extract({alias}.metadata, '$.page_number') IN ({','.join('?' * len(pages))}))")
+            params.append(name)
+            params.extend(pages)
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def get_index_path(user_id: int) -> str:
+    return str(DATA_DIR / str(user_id) / "lexical_index.db")
+
+
+class LexicalIndex:
+    """
+    Per-user inverted index on SQLite with BM25 scoring. Postings are keyed by
+    chunk_id so uploads and deletes update it incrementally.
+
+    close() only drops the connection: a caller still holding the index
+    after the pool closed it reconnects on its next call.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        with self._lock:
+            self._connect_locked()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Only used with self._lock held
+        if self._connection is None:
+            self._connect_locked()
+        return self._connection
+
+    def _connect_locked(self):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_name TEXT,
+                length INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks (document_name);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+            """
+        )
+        self._connection.commit()
+
+    def add(self, chunks: Iterable[Document]):
+        with self._lock:
+            for doc in chunks:
+                chunk_id = doc.metadata["chunk_id"]
+                self._delete_chunk_locked(chunk_id)
+                counts = Counter(tokenize(doc.page_content))
+                self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, document_name, length, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (chunk_id, doc.metadata.get("document_name"), sum(counts.values()),
+                     doc.page_content, json.dumps(doc.metadata)),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in counts.items()],
+                )
+            self._conn.commit()
+
+    def delete_chunks(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._delete_chunk_locked(chunk_id)
+            self._conn.commit()
+
+    def delete_document(self, document_name: str) -> int:
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE document_name = ?", (document_name,)
+            )]
+            for chunk_id in ids:
+                self._delete_chunk_locked(chunk_id)
+            self._conn.commit()
+        return len(ids)
+
+    def _delete_chunk_locked(self, chunk_id: str):
+        self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+        self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+
+    def search(self, query: str, k: int = 10, scope=None) -> Tuple[List[Tuple[Document, float]], float]:
+        """
+        Returns ([(document, bm25_score)], coverage) where coverage is the share
+        of query terms present in the top hit. With a scope, BM25 runs over
+        the chunks of those documents/pages only.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], 0.0
+
+        scope_clause, scope_params = scope_sql(scope, "c") if scope else ("1", [])
+        with self._lock:
+            n_docs, total_len = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks c WHERE {scope_clause}", scope_params
+            ).fetchone()
+            if not n_docs:
+                return [], 0.0
+            avg_len = total_len / n_docs
+
+            placeholders = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p "
+                f"JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term IN ({placeholders}) AND {scope_clause}",
+                terms + scope_params,
+            ).fetchall()
+
+            df = Counter(term for term, _, _, _ in rows)
+            scores: Dict[str, float] = {}
+            matched: Dict[str, set] = {}
+            for term, chunk_id, tf, length in rows:
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+                matched.setdefault(chunk_id, set()).add(term)
+
+            top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+            if not top:
+                return [], 0.0
+            ids = [chunk_id for chunk_id, _ in top]
+            placeholders = ",".join("?" * len(ids))
+            stored = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    f"SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({placeholders})", ids
+                )
+            }
+
+        results = []
+        for chunk_id, score in top:
+            content, metadata = stored[chunk_id]
+            results.append((Document(id=chunk_id, page_content=content, metadata=json.loads(metadata)), score))
+        coverage = len(matched[top[0][0]]) / len(terms)
+        return results, coverage
+
+    def vacuum(self):
+        """
+        Reclaims pages freed by deletes.
+        """
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# user_id -> (index, last used), least recently used first
+_indexes: "OrderedDict[int, Tuple[LexicalIndex, float]]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(user_id: int) -> LexicalIndex:
+    """
+    The user's index from the process-wide pool, bounded like the vector
+    store pool: at most LEXICAL_INDEX_POOL_MAX open, and indexes unused for
+    LEXICAL_INDEX_IDLE_TIMEOUT seconds closed on the next lookup.
+    """
+    now = time.monotonic()
+    with _indexes_lock:
+        entry = _indexes.pop(user_id, None)
+        index = entry[0] if entry is not None else LexicalIndex(get_index_path(user_id))
+        _indexes[user_id] = (index, now)
+        closing = []
+        for uid, (old, last_used) in list(_indexes.items()):
+            if len(_indexes) <= LEXICAL_INDEX_POOL_MAX and now - last_used <= LEXICAL_INDEX_IDLE_TIMEOUT:
+                break
+            if uid == user_id:
+                break
+            del _indexes[uid]
+            closing.append(old)
+    for old in closing:
+        old.close()
+    return index
+
+
+def index_chunks(user_id: int, chunks: List[Document]) -> List[Document]:
+    """
+    Adds freshly chunked documents to the user's lexical index (ingest stage).
+    """
+    get_index(user_id).add(chunks)
+    return chunks
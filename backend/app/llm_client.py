@@ -0,0 +1,239 @@
+import os
+import asyncio
+import hashlib
+import random
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from . import metrics
+
+# Configuration
+# Completions in flight at once across all users, and per user
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+LLM_USER_CONCURRENCY = int(os.getenv("LLM_USER_CONCURRENCY", "8"))
+# Seconds for a whole completion, or between streamed chunks
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Identical in-flight requests share one upstream call
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() == "true"
+
+# Statuses worth retrying (timeouts, conflicts, rate limits and server errors)
+RETRY_STATUSES = {408, 409, 429}
+RETRY_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+
+def _retryable(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    # openai's exception classes, matched by name so openai isn't imported here
+    return type(error).__name__ in RETRY_ERRORS
+
+
+def prompt_digest(messages) -> str:
+    """
+    Fingerprint of a rendered prompt, so requests only coalesce when they
+    would send exactly the same messages.
+    """
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Flight:
+    """
+    One upstream completion and everything waiting on it. Parts are kept so
+    a caller joining mid-stream replays what it missed.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, part: Optional[str] = None, error: Optional[BaseException] = None, done: bool = False):
+        async with self._changed:
+            if part:
+                self.parts.append(part)
+            self.error = error
+            self.done = done
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or len(self.parts) > seen)
+                new, done, error = self.parts[seen:], self.done, self.error
+            seen += len(new)
+            for part in new:
+                yield part
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class _LoopState:
+    """
+    Limits and in-flight calls for one event loop (asyncio primitives can't
+    be shared across loops).
+    """
+
+    def __init__(self, concurrency: int):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.users: Dict[int, list] = {}  # user_id -> [Semaphore, holders]
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.tasks = set()  # strong references to upstream tasks
+
+
+class LLMClient:
+    """
+    Async completion layer in front of the chat model. Calls go through a
+    global and a per-user concurrency limit (a user's waiting requests don't
+    hold global slots), each attempt has a timeout, and timeouts, rate
+    limits and server errors are retried with jittered backoff.
+
+    Requests given the same key while one is in flight share its upstream
+    call: followers receive the same tokens (replayed from the start if they
+    join mid-stream) and the same result or error. The upstream call runs in
+    its own task, so a leader that disconnects doesn't cut off its followers.
+    The model's HTTP connection pool is shared by everything; see
+    rag.get_llm.
+    """
+
+    def __init__(self, get_model: Callable[[], Any], concurrency: int = LLM_CONCURRENCY,
+                 user_concurrency: int = LLM_USER_CONCURRENCY, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, coalesce: bool = LLM_COALESCE,
+                 callbacks: Optional[list] = None):
+        self.get_model = get_model
+        self.concurrency = concurrency
+        self.user_concurrency = user_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+        self.callbacks = callbacks or []
+        self._states: Dict[Any, _LoopState] = {}
+        self.upstream = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.errors = 0
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            # Drop state of closed loops (test clients, benchmark runs)
+            for old in [l for l in self._states if l.is_closed()]:
+                del self._states[old]
+            state = self._states[loop] = _LoopState(self.concurrency)
+        return state
+
+    @asynccontextmanager
+    async def _slot(self, state: _LoopState, user_id: int):
+        entry = state.users.get(user_id)
+        if entry is None:
+            entry = state.users[user_id] = [asyncio.Semaphore(self.user_concurrency), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with state.slots:
+                    yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del state.users[user_id]
+
+    async def _call(self, flight: _Flight, state: _LoopState, user_id: int, messages, model, stream: bool):
+        config = {"callbacks": self.callbacks}
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._slot(state, user_id):
+                    self.upstream += 1
+                    metrics.LLM_REQUESTS.inc(result="upstream")
+                    if not stream:
+                        message = await asyncio.wait_for(model.ainvoke(messages, config=config), self.timeout)
+                        await flight.publish(message.content, done=True)
+                        return
+                    chunks = model.astream(messages, config=config).__aiter__()
+                    try:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                            except StopAsyncIteration:
+                                break
+                            if chunk.content:
+                                await flight.publish(chunk.content)
+                    finally:
+                        await chunks.aclose()
+                    await flight.publish(done=True)
+                    return
+            except Exception as error:
+                # Tokens already went out to callers, so a partial stream can't be replayed
+                if attempt == self.max_retries or flight.parts or not _retryable(error):
+                    self.errors += 1
+                    metrics.LLM_REQUESTS.inc(result="error")
+                    await flight.publish(error=error, done=True)
+                    return
+            self.retries += 1
+            metrics.LLM_REQUESTS.inc(result="retry")
+            await asyncio.sleep(random.uniform(0, min(10.0, 0.5 * 2 ** attempt)))
+
+    async def _run(self, state: _LoopState, key: Optional[Hashable], flight: _Flight, *args):
+        try:
+            await self._call(flight, state, *args)
+        except BaseException as error:
+            await flight.publish(error=error, done=True)
+            raise
+        finally:
+            if key is not None and state.flights.get(key) is flight:
+                del state.flights[key]
+
+    def _join(self, user_id: int, messages, key: Optional[Hashable], model, stream: bool) -> _Flight:
+        state = self._state()
+        if key is not None and self.coalesce:
+            key = (key, prompt_digest(messages))
+            flight = state.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                metrics.LLM_REQUESTS.inc(result="coalesced")
+                return flight
+        else:
+            key = None
+        flight = _Flight()
+        if key is not None:
+            state.flights[key] = flight
+        task = asyncio.create_task(self._run(state, key, flight, user_id, messages, model or self.get_model(), stream))
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+        return flight
+
+    async def stream(self, user_id: int, messages, key: Optional[Hashable] = None, model=None) -> AsyncIterator[str]:
+        """
+        Completion text chunks as they arrive.
+        """
+        async for part in self._join(user_id, messages, key, model, stream=True).follow():
+            yield part
+
+    async def complete(self, user_id: int, messages, key: Optional[Hashable] = None, model=None) -> str:
+        """
+        The whole completion text.
+        """
+        parts = [part async for part in self._join(user_id, messages, key, model, stream=False).follow()]
+        return "".join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        in_flight = sum(len(state.flights) for state in self._states.values())
+        return {
+            "upstream_calls": self.upstream,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "errors": self.errors,
+            "coalesced_in_flight": in_flight,
+            "concurrency": self.concurrency,
+            "user_concurrency": self.user_concurrency,
+        }
@@ -0,0 +1,58 @@
+import os
+import threading
+from pathlib import Path
+
+from filelock import FileLock, Timeout  # noqa: F401 (re-exported for callers probing a lock)
+
+# Configuration
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+
+# Lock files live next to the data they guard, so every worker process (and
+# every thread: each thread holds its own handle) contends on the same file.
+# The OS drops a lock when its process dies, so a crashed worker never leaves
+# a user locked.
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(path: Path) -> FileLock:
+    key = str(path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            os.makedirs(path.parent, exist_ok=True)
+            lock = _locks[key] = FileLock(key)
+        return lock
+
+
+def user_write_lock(user_id: int) -> FileLock:
+    """
+    Serializes individual writes (upserts, deletes, compaction) to one
+    user's vector store and corpus version, across threads and workers.
+    Re-entrant within a thread.
+    """
+    return _lock(DATA_DIR / str(user_id) / ".write.lock")
+
+
+def user_ingest_lock(user_id: int) -> FileLock:
+    """
+    Held by the single ingestion job running for a user, for the whole job.
+    A job marked running whose lock is free was abandoned by a dead worker.
+    """
+    return _lock(DATA_DIR / str(user_id) / ".ingest.lock")
+
+
+def user_upload_lock(user_id: int) -> FileLock:
+    """
+    Held briefly while an upload checks for an active job on the same file
+    and queues its own, so two workers can't both queue one.
+    """
+    return _lock(DATA_DIR / str(user_id) / ".upload.lock")
+
+
+def startup_lock() -> FileLock:
+    """
+    Serializes schema creation and job recovery when several workers start.
+    """
+    return _lock(DATA_DIR / ".startup.lock")
@@ -1,24 +1,70 @@
 import os
-import shutil
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, BackgroundTasks, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from .database import engine, Base
-from . import auth, models, ingest, vector_store, schemas, rag
+# Only light modules at import time. rag, vector_store, lexical_index and
+# answer_cache (LangChain, OpenAI, chromadb, pandas) are imported inside the
+# endpoints that need them, or ahead of time by the startup warm-up.
+from . import auth, models, schemas, jobs, manifest, metrics, locks
 
-# Create Database Tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="DocuMind Pro Backend")
+# eager: import heavy modules and build model clients before serving
+# background: same, in a thread after startup (first requests may still pay for it)
+# off: everything on first use
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+def warm_up():
+    # Imported only to load them (and pandas/pdfplumber/chromadb/LangChain
+    # behind them) now rather than on the first upload or chat
+    from . import ingest, lexical_index, answer_cache, vector_store  # noqa: F401
+    from . import rag
+    rag.get_chain()
+
+def _warm_up_quietly():
+    try:
+        warm_up()
+    except Exception:
+        logger.exception("Startup warm-up failed; modules will load on first use")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Workers started together take turns creating tables and recovering jobs
+    with locks.startup_lock():
+        # Create Database Tables
+        Base.metadata.create_all(bind=engine)
+        # Pick up ingestion jobs that were queued or running when the process stopped
+        jobs.resume_pending_jobs()
+    if STARTUP_WARMUP == "eager":
+        await run_in_threadpool(_warm_up_quietly)
+    elif STARTUP_WARMUP == "background":
+        threading.Thread(target=_warm_up_quietly, name="warm-up", daemon=True).start()
+    yield
+    jobs.shutdown()
+
+app = FastAPI(title="DocuMind Pro Backend", lifespan=lifespan)
 
 # Configuration (Same as auth.py, centralized would be better but keeping simple)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 
+# PRD Section 6: Hard Limits
+MAX_FILES_PER_USER = 15
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "5")) * 1024 * 1024)
+UPLOAD_COPY_BLOCK = 1024 * 1024
+SUPPORTED_EXTENSIONS = {".pdf", ".txt", ".csv", ".xlsx", ".xls"}
+
 # CORS (Allow frontend)
 app.add_middleware(
     CORSMiddleware,
@@ -34,77 +80,293 @@ app.include_router(auth.router, tags=["Authentication"])
 def read_root():
     return {"message": "DocuMind Pro API is running"}
 
-@app.post("/upload")
+@app.post("/upload", status_code=202)
 async def upload_file(
     file: UploadFile = File(...),
-    current_user: models.User = Depends(auth.get_current_user) # We need to expose a get_current_user in auth
+    current_user: auth.Principal = Depends(auth.get_current_user), # We need to expose a get_current_user in auth
+    db: Session = Depends(auth.get_db)
 ):
     user_id = current_user.id
     user_files_dir = DATA_DIR / str(user_id) / "files"
-    
+
+    # Unsupported types and files still being processed are rejected before anything is saved
+    if os.path.splitext(file.filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {os.path.splitext(file.filename)[1]}")
+    if jobs.active_job(db, user_id, file.filename) is not None:
+        raise HTTPException(status_code=409, detail="File is still being processed")
+
     # Ensure directory exists
     os.makedirs(user_files_dir, exist_ok=True)
     
-    # 1. Enforce Max Files Limit (PRD: Max 15)
-    existing_files = [f for f in os.listdir(user_files_dir) if os.path.isfile(os.path.join(user_files_dir, f))]
-    if len(existing_files) >= 15:
+    # 1. Enforce Max Files Limit (PRD: Max 15) and the chunk/byte quotas from the catalog.
+    # Re-uploading an existing name replaces it and doesn't count against the limits.
+    file_count, byte_count, chunk_count = manifest.usage(db, user_id, exclude=file.filename)
+    if file_count >= MAX_FILES_PER_USER:
          raise HTTPException(status_code=400, detail="File limit exceeded (Max 15 files). Delete some files to upload more.")
+    if chunk_count >= manifest.MAX_CHUNKS_PER_USER:
+         raise HTTPException(status_code=400, detail="Chunk quota exceeded. Delete some files to upload more.")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+         raise HTTPException(status_code=413, detail=f"File too large (Max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).")
+    if byte_count + (file.size or 0) > manifest.MAX_BYTES_PER_USER:
+         raise HTTPException(status_code=400, detail="Storage quota exceeded. Delete some files to upload more.")
 
-    # 2. Save File
-    file_path = user_files_dir / file.filename
+    # 2. Save File (blocking disk I/O kept off the event loop). Copied in blocks
+    # and cut off at the size limit, into a staging path of its own; the job
+    # swaps it in over the existing version (see jobs._ingest).
+    staged_path = jobs.staging_path(user_files_dir, file.filename)
+    limit = min(MAX_UPLOAD_BYTES, manifest.MAX_BYTES_PER_USER - byte_count)
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        size = await run_in_threadpool(_save_upload, file.file, staged_path, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-        
-    # 3. Process & Ingest
+    if size is None:
+        if limit < MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=400, detail="Storage quota exceeded. Delete some files to upload more.")
+        raise HTTPException(status_code=413, detail=f"File too large (Max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).")
+
+    # 3. Queue Process & Ingest; the worker pool does extract/chunk/embed
     try:
-        # Extract
-        raw_docs = ingest.process_file(str(file_path), file.filename, user_id)
-        
-        # Chunk
-        chunks = ingest.chunk_text(raw_docs)
-        
-        # Embed & Store
-        vector_store.add_documents_to_chroma(user_id, chunks)
-        
-        return {
-            "filename": file.filename,
-            "status": "success",
-            "chunks_processed": len(chunks),
-            "total_files": len(existing_files) + 1
-        }
-        
-    except ValueError as e:
-         # Cleanup invalid file
-         os.remove(file_path)
-         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-         # Cleanup on failure
-         if os.path.exists(file_path):
-            os.remove(file_path)
-         # print(f"Ingestion failed: {e}")
-         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
-
-@app.get("/files")
-async def list_files(current_user: models.User = Depends(auth.get_current_user)):
+        job = await run_in_threadpool(_queue_upload, db, user_id, file.filename, staged_path, size)
+    except BaseException:
+        if staged_path.exists():
+            os.remove(staged_path)
+        raise
+
+    return {
+        "job_id": job.id,
+        "filename": file.filename,
+        "status": job.status,
+        "total_files": file_count + 1
+    }
+
+def _queue_upload(db: Session, user_id: int, filename: str, staged_path: Path, size: int):
+    """
+    Registers a saved upload and queues its job. The active-job check and
+    the job row are made under the user's upload lock, so concurrent uploads
+    of one name (in any worker) queue at most one job.
+    """
+    with locks.user_upload_lock(user_id):
+        if jobs.active_job(db, user_id, filename) is not None:
+            raise HTTPException(status_code=409, detail="File is still being processed")
+        previous = manifest.get_file(db, user_id, filename)
+        previous = None if previous is None else (previous.status, previous.size_bytes)
+        manifest.register_upload(db, user_id, filename, size)
+        job = jobs.create_job(db, user_id, filename, str(staged_path))
+        try:
+            jobs.submit(job.id)
+        except jobs.QueueFullError as e:
+            # Nothing was replaced yet: drop this job and put the catalog back
+            db.delete(job)
+            db.commit()
+            manifest.revert_upload(db, user_id, filename, previous)
+            raise HTTPException(status_code=503, detail=str(e))
+    return job
+
+def _save_upload(source, file_path: Path, limit: int):
+    """
+    Streams the upload to disk. Returns the size, or None (and no file) if
+    it goes over `limit` bytes.
+    """
+    partial = file_path.with_name(file_path.name + ".part")
+    size = 0
+    try:
+        with open(partial, "wb") as buffer:
+            for block in iter(lambda: source.read(UPLOAD_COPY_BLOCK), b""):
+                size += len(block)
+                if size > limit:
+                    break
+                buffer.write(block)
+        if size > limit:
+            os.remove(partial)
+            return None
+        os.replace(partial, file_path)
+        return size
+    except BaseException:
+        if partial.exists():
+            os.remove(partial)
+        raise
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobResponse)
+def get_job(
+    job_id: str,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    job = db.query(models.IngestionJob).filter(
+        models.IngestionJob.id == job_id,
+        models.IngestionJob.user_id == current_user.id
+    ).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return schemas.JobResponse(
+        job_id=job.id,
+        filename=job.filename,
+        status=job.status,
+        current_stage=job.current_stage,
+        progress=jobs.job_progress(job),
+        stages=job.stages or {},
+        chunks_processed=job.chunks_processed or 0,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+@app.get("/files", response_model=schemas.FileListResponse)
+def list_files(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    user_id = current_user.id
+    total, total_bytes, total_chunks = manifest.usage(db, user_id)
+    files = manifest.list_files(db, user_id, offset, limit)
+    return schemas.FileListResponse(
+        files=[schemas.FileInfo.model_validate(f) for f in files],
+        total=total,
+        total_bytes=total_bytes,
+        total_chunks=total_chunks,
+        offset=offset,
+        limit=limit,
+    )
+
+@app.delete("/files/{filename}")
+def delete_file(
+    filename: str,
+    background_tasks: BackgroundTasks,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
     user_id = current_user.id
     user_files_dir = DATA_DIR / str(user_id) / "files"
-    
-    if not os.path.exists(user_files_dir):
-        return {"files": []}
-    
-    files = [f for f in os.listdir(user_files_dir) if os.path.isfile(os.path.join(user_files_dir, f))]
-    return {"files": files}
+    file_path = user_files_dir / filename
+
+    # Reject path tricks; only plain names inside the user's directory
+    if os.path.basename(filename) != filename or manifest.get_file(db, user_id, filename) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if jobs.active_job(db, user_id, filename) is not None:
+        raise HTTPException(status_code=409, detail="File is still being processed")
+
+    from . import vector_store, lexical_index
+
+    # Vectors, lexical postings and manifest go first so a crash leaves no orphans
+    # that the catalog can't see; removing the vectors also bumps the corpus
+    # version, which invalidates cached answers.
+    chunks_deleted = vector_store.delete_document(user_id, filename)
+    lexical_index.get_index(user_id).delete_document(filename)
+    manifest.delete_file(db, user_id, filename)
+    if file_path.is_file():
+        os.remove(file_path)
+
+    background_tasks.add_task(_compact_user_stores, user_id)
+    return {"filename": filename, "status": "deleted", "chunks_deleted": chunks_deleted}
+
+def _compact_user_stores(user_id: int):
+    from . import vector_store, lexical_index
+    if vector_store.compact(user_id):
+        lexical_index.get_index(user_id).vacuum()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: stage latency histograms plus chunk, token
+    and cache counters.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/embedding-cache")
+def embedding_cache_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    from . import vector_store
+    return vector_store.get_embedding_cache().stats()
+
+@app.get("/stats/vector-stores")
+def vector_store_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    from . import vector_store
+    return vector_store.store_pool.stats()
+
+@app.get("/stats/answer-cache")
+def answer_cache_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    from . import answer_cache
+    return answer_cache.answer_cache.stats()
+
+@app.get("/stats/llm")
+def llm_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    from . import rag
+    return rag.llm_pool.stats()
+
+def _resolve_scope(db: Session, user_id: int, documents: Optional[List[schemas.DocumentScope]]):
+    """
+    Validates a chat request's document scope against the user's catalog.
+    Returns None when there is nothing to narrow (no scope, or every file
+    selected in full), so retrieval runs without a filter.
+    """
+    if not documents:
+        return None
+    from . import retrieval
+
+    known = manifest.document_names(db, user_id)
+    unknown = sorted({d.document_name for d in documents} - known)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown documents: {', '.join(unknown)}")
+    scope = retrieval.make_scope([(d.document_name, d.pages) for d in documents])
+    if all(pages is None for _, pages in scope) and len(scope) == len(known):
+        return None
+    return scope
 
 @app.post("/chat")
 async def chat(
     request: schemas.ChatRequest,
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
 ):
+    from . import rag
+    scope = _resolve_scope(db, current_user.id, request.documents)
     try:
-        answer = rag.get_answer(current_user.id, request.question)
+        answer = await rag.get_answer(current_user.id, request.question, scope)
         return {"answer": answer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+
+@app.post("/chat/batch")
+async def chat_batch(
+    request: schemas.BatchChatRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    """
+    Answers a list of questions in one call (evaluation runs). Retrieval and
+    completions run concurrently; results come back in request order.
+    """
+    from . import rag
+    scope = _resolve_scope(db, current_user.id, request.documents)
+    try:
+        results = await rag.answer_batch(current_user.id, request.questions, scope)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: schemas.ChatRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    """
+    Server-sent events: "token" events while the LLM generates, then a
+    "sources" event with structured citations and a "metrics" event with
+    retrieval, time-to-first-token and total latency.
+    """
+    from . import rag
+    scope = _resolve_scope(db, current_user.id, request.documents)
+    async def event_stream():
+        async for event in rag.stream_answer(current_user.id, request.question, scope):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
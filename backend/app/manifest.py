@@ -0,0 +1,188 @@
+import os
+import hashlib
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Per-user quotas over the catalog totals; uploads are checked against them
+# up front and ingestion re-checks the chunk quota while it streams.
+MAX_CHUNKS_PER_USER = int(os.getenv("MAX_CHUNKS_PER_USER", "5000"))
+MAX_BYTES_PER_USER = int(os.getenv("MAX_BYTES_PER_USER", str(200 * 1024 * 1024)))
+
+# Chunk rows are read and written as plain columns in batches; a large file
+# has tens of thousands of them, far too many to hold as ORM objects.
+CHUNK_ROW_BATCH = 5000
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_file(db: Session, user_id: int, document_name: str) -> Optional[models.IngestedFile]:
+    return db.query(models.IngestedFile).filter(
+        models.IngestedFile.user_id == user_id,
+        models.IngestedFile.document_name == document_name
+    ).first()
+
+
+def document_names(db: Session, user_id: int) -> Set[str]:
+    rows = db.query(models.IngestedFile.document_name).filter(models.IngestedFile.user_id == user_id)
+    return {name for (name,) in rows}
+
+
+def chunk_ids(db: Session, record: Optional[models.IngestedFile]) -> Set[str]:
+    if record is None or record.id is None:
+        return set()
+    rows = db.query(models.IngestedChunk.chunk_id).filter(models.IngestedChunk.file_id == record.id)
+    return {chunk_id for (chunk_id,) in rows.yield_per(CHUNK_ROW_BATCH)}
+
+
+def _delete_chunk_rows(db: Session, file_id: int, ids: Optional[List[str]] = None):
+    query = db.query(models.IngestedChunk).filter(models.IngestedChunk.file_id == file_id)
+    if ids is None:
+        query.delete(synchronize_session=False)
+        return
+    for i in range(0, len(ids), CHUNK_ROW_BATCH):
+        query.filter(models.IngestedChunk.chunk_id.in_(ids[i:i + CHUNK_ROW_BATCH])).delete(synchronize_session=False)
+
+
+def usage(db: Session, user_id: int, exclude: Optional[str] = None) -> Tuple[int, int, int]:
+    """
+    (files, bytes, chunks) for a user in one indexed aggregate query,
+    optionally leaving out a file that is about to be replaced.
+    """
+    query = db.query(
+        func.count(models.IngestedFile.id),
+        func.coalesce(func.sum(models.IngestedFile.size_bytes), 0),
+        func.coalesce(func.sum(models.IngestedFile.chunk_count), 0),
+    ).filter(models.IngestedFile.user_id == user_id)
+    if exclude is not None:
+        query = query.filter(models.IngestedFile.document_name != exclude)
+    files, size_bytes, chunks = query.one()
+    return files, size_bytes, chunks
+
+
+def list_files(db: Session, user_id: int, offset: int = 0, limit: int = 50) -> List[models.IngestedFile]:
+    return (
+        db.query(models.IngestedFile)
+        .filter(models.IngestedFile.user_id == user_id)
+        .order_by(models.IngestedFile.document_name)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+
+def register_upload(db: Session, user_id: int, document_name: str, size_bytes: int) -> models.IngestedFile:
+    """
+    Adds (or re-queues) the catalog row for an upload so it counts against
+    quotas immediately. Hash and chunk ids of a previous version are kept
+    for the incremental diff.
+    """
+    record = get_file(db, user_id, document_name)
+    if record is None:
+        record = models.IngestedFile(user_id=user_id, document_name=document_name)
+        db.add(record)
+    record.size_bytes = size_bytes
+    record.status = "queued"
+    record.updated_at = datetime.utcnow()
+    db.commit()
+    return record
+
+
+def revert_upload(db: Session, user_id: int, document_name: str, previous: Optional[Tuple[str, int]]):
+    """
+    Undoes register_upload for an upload that never got queued: a new row is
+    dropped, an existing one gets its previous (status, size_bytes) back.
+    """
+    record = get_file(db, user_id, document_name)
+    if record is None:
+        return
+    if previous is None:
+        _delete_chunk_rows(db, record.id)
+        db.delete(record)
+    else:
+        record.status, record.size_bytes = previous
+        record.updated_at = datetime.utcnow()
+    db.commit()
+
+
+def set_status(db: Session, user_id: int, document_name: str, status: str):
+    record = get_file(db, user_id, document_name)
+    if record is not None:
+        record.status = status
+        record.updated_at = datetime.utcnow()
+        db.commit()
+
+
+def mark_failed(db: Session, user_id: int, document_name: str, size_bytes: Optional[int] = None):
+    """
+    A file that never finished ingesting leaves the catalog. A failed
+    re-upload whose previous version is still on disk and indexed goes back
+    to ready with that version's size_bytes; without it the row stays listed
+    as failed so its old chunks can still be deleted.
+    """
+    record = get_file(db, user_id, document_name)
+    if record is None:
+        return
+    if record.file_hash is None:
+        db.delete(record)
+    elif size_bytes is not None:
+        record.status = "ready"
+        record.size_bytes = size_bytes
+        record.updated_at = datetime.utcnow()
+    else:
+        record.status = "failed"
+        record.updated_at = datetime.utcnow()
+    db.commit()
+
+
+def record_file(db: Session, user_id: int, document_name: str, file_hash: str,
+                ids: Iterable[str], page_count: int = 0, row_count: int = 0) -> models.IngestedFile:
+    """
+    Replaces the catalog entry for a file with its current chunk ids and
+    counts, in the same transaction that marks it ready.
+    """
+    ids = list(dict.fromkeys(ids))
+    record = get_file(db, user_id, document_name)
+    if record is None:
+        record = models.IngestedFile(user_id=user_id, document_name=document_name)
+        db.add(record)
+        db.flush()
+
+    current = chunk_ids(db, record)
+    wanted = set(ids)
+    _delete_chunk_rows(db, record.id, [chunk_id for chunk_id in current if chunk_id not in wanted])
+    added = [chunk_id for chunk_id in ids if chunk_id not in current]
+    for i in range(0, len(added), CHUNK_ROW_BATCH):
+        db.execute(insert(models.IngestedChunk),
+                   [{"file_id": record.id, "chunk_id": chunk_id} for chunk_id in added[i:i + CHUNK_ROW_BATCH]])
+
+    now = datetime.utcnow()
+    record.file_hash = file_hash
+    record.chunk_count = len(ids)
+    record.page_count = page_count
+    record.row_count = row_count
+    record.status = "ready"
+    record.ingested_at = now
+    record.updated_at = now
+    db.commit()
+    return record
+
+
+def delete_file(db: Session, user_id: int, document_name: str) -> bool:
+    record = get_file(db, user_id, document_name)
+    if record is None:
+        return False
+    _delete_chunk_rows(db, record.id)
+    db.delete(record)
+    db.commit()
+    return True
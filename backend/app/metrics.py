@@ -0,0 +1,236 @@
+import os
+import time
+import inspect
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Mirror spans and instruments to OpenTelemetry (OTLP exporter, configured by the
+# standard OTEL_EXPORTER_OTLP_* variables). Requires the opentelemetry SDK.
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+
+# Prometheus' defaults, stretched for multi-second ingestion stages
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_tracer = None
+_meter = None
+_NOOP = nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels: counter.inc(2, cache="answer").
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        self._otel = _meter.create_counter(name, description=documentation) if _meter else None
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        if self._otel is not None:
+            self._otel.add(amount, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in seconds (or any unit), Prometheus style.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+        self._otel = _meter.create_histogram(name, description=documentation) if _meter else None
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+        if self._otel is not None:
+            self._otel.record(value, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def _setup_otel():
+    global _tracer, _meter
+    try:
+        from opentelemetry import trace, metrics as otel_metrics
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but the OpenTelemetry SDK/OTLP exporter is not installed")
+        return
+
+    resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "documind-backend")})
+    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(tracer_provider)
+    otel_metrics.set_meter_provider(MeterProvider(
+        resource=resource, metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())]
+    ))
+    _tracer = trace.get_tracer("documind")
+    _meter = otel_metrics.get_meter("documind")
+
+
+if METRICS_ENABLED and OTEL_ENABLED:
+    _setup_otel()
+
+
+# Hot-path metrics
+STAGE_SECONDS = Histogram(
+    "documind_stage_seconds", "Wall time of instrumented operations (extraction, chunking, embedding, "
+    "Chroma writes, retrieval, LLM calls).", ["stage"])
+INGEST_STAGE_SECONDS = Histogram(
+    "documind_ingest_stage_seconds", "Wall time per ingestion job stage and batch.", ["stage"])
+CHUNKS = Counter("documind_chunks_total", "Chunks written to or removed from vector stores.", ["op"])
+TOKENS = Counter("documind_tokens_total", "Tokens sent to embedding and chat models.", ["kind"])
+CACHE_REQUESTS = Counter("documind_cache_requests_total", "Embedding and answer cache lookups.", ["cache", "result"])
+LLM_REQUESTS = Counter("documind_llm_requests_total", "Chat completions: upstream calls, requests served by "
+                       "another in-flight call, retries and failures.", ["result"])
+
+REGISTRY = (STAGE_SECONDS, INGEST_STAGE_SECONDS, CHUNKS, TOKENS, CACHE_REQUESTS, LLM_REQUESTS)
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def _timed_span(stage: str, attributes: Dict):
+    start = time.perf_counter()
+    if _tracer is None:
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+        return
+    with _tracer.start_as_current_span(stage, attributes=attributes):
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def span(stage: str, **attributes):
+    """
+    Times a block into documind_stage_seconds{stage=...} (and an OpenTelemetry
+    span when enabled). A shared no-op context when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _timed_span(stage, attributes)
+
+
+def timed(stage: str):
+    """
+    Decorator form of span(). Returns the function untouched when metrics
+    are disabled, so there is no per-call cost at all.
+
+    On a generator function it records, once the generator is exhausted or
+    closed, only the time spent producing items, not the time the consumer
+    holds it suspended between them (no OpenTelemetry span in that case).
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                elapsed = 0.0
+                generator = func(*args, **kwargs)
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        yield item
+                finally:
+                    generator.close()
+                    STAGE_SECONDS.observe(elapsed, stage=stage)
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _timed_span(stage, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy.orm import relationship
 from .database import Base
 
 class User(Base):
@@ -7,3 +10,59 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+
+class IngestionJob(Base):
+    """
+    One background ingestion of an uploaded file (extract -> chunk -> embed).
+    Persisted so queued/running jobs can be resumed after a restart.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    filename = Column(String)
+    file_path = Column(String)
+    # queued -> running -> succeeded | failed
+    status = Column(String, default="queued", index=True)
+    current_stage = Column(String, nullable=True)
+    # {"extract": {"status": "done", "duration_ms": 12.5, "items": 3}, ...}
+    stages = Column(JSON, default=dict)
+    chunks_processed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class IngestedFile(Base):
+    """
+    Per-user file catalog: one row per uploaded file with its size, content
+    hash, extraction counts, ingest status and timestamps. Also the manifest
+    of chunk ids currently stored for the file.
+    """
+    __tablename__ = "ingested_files"
+    __table_args__ = (UniqueConstraint("user_id", "document_name"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    document_name = Column(String)
+    size_bytes = Column(Integer, default=0)
+    file_hash = Column(String, nullable=True)
+    page_count = Column(Integer, default=0)
+    row_count = Column(Integer, default=0)
+    chunk_count = Column(Integer, default=0)
+    # queued -> processing -> ready | failed
+    status = Column(String, default="queued")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    ingested_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    chunks = relationship("IngestedChunk", cascade="all, delete-orphan", back_populates="file")
+
+class IngestedChunk(Base):
+    __tablename__ = "ingested_chunks"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("ingested_files.id"), index=True)
+    chunk_id = Column(String, index=True)
+
+    file = relationship("IngestedFile", back_populates="chunks")
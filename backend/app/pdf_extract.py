@@ -0,0 +1,77 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import pdfplumber
+
+# Configuration
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+# Below this many pages the pool round-trip costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server process has live threads and sockets
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def count_pages(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extracts pages [start, end) and returns (1-based page number, text).
+    Runs inside pool workers; each page is closed as soon as its text is read
+    so pdfplumber's per-page object cache never holds the whole range.
+    """
+    pages = []
+    with pdfplumber.open(file_path) as pdf:
+        for i in range(start, end):
+            page = pdf.pages[i]
+            pages.append((i + 1, page.extract_text() or ""))
+            page.close()
+    return pages
+
+
+def iter_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) in page order. Large PDFs are split into page
+    ranges parsed in parallel by a process pool; at most two ranges per worker
+    are in flight, so early pages reach the caller while later ones parse.
+    """
+    n_pages = count_pages(file_path)
+    if PDF_WORKERS <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+        with pdfplumber.open(file_path) as pdf:
+            for i, page in enumerate(pdf.pages):
+                text = page.extract_text() or ""
+                page.close()
+                yield i + 1, text
+        return
+
+    pool = _get_pool()
+    ranges = deque((start, min(start + PDF_PAGES_PER_TASK, n_pages))
+                   for start in range(0, n_pages, PDF_PAGES_PER_TASK))
+    in_flight = deque()
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < PDF_WORKERS * 2:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(extract_range, file_path, start, end))
+            yield from in_flight.popleft().result()
+    finally:
+        # Caller stopped early (quota, error): drop ranges nobody will read
+        for future in in_flight:
+            future.cancel()
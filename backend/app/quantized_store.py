@@ -0,0 +1,371 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+# Configuration
+# Candidates re-scored with full-precision vectors, as a multiple of k
+QUANTIZED_RERANK_FACTOR = int(os.getenv("QUANTIZED_RERANK_FACTOR", "4"))
+# int8 rows converted to float32 per step of the scan: small enough that the
+# float32 scratch block (768 KB at 1536 dims) stays in L2 cache for the dot
+SCAN_BLOCK_ROWS = 128
+
+CODES_FILE = "vectors.i8"
+SCALES_FILE = "scales.f32"
+FULL_FILE = "vectors.f32"
+META_FILE = "meta.db"
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization: codes * scale ~= vector.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class QuantizedStore:
+    """
+    Per-user vector store on flat files: int8 codes and per-row scales for a
+    vectorized scan, float32 vectors for exact re-ranking of the top
+    candidates, and chunk text/metadata in SQLite. The int8 codes are
+    memory-mapped (page cache, not process heap): the scan reads 1 byte per
+    dimension instead of keeping Chroma's HNSW graph and float32 vectors
+    resident, and re-ranking preads only the candidate rows of the float file.
+
+    Rows are append-only; deletes clear a row's live flag and copy_live_to()
+    rewrites the files without dead rows. Vectors are L2-normalized on
+    insert, so inner product ranks like Chroma's L2 distance on unit vectors.
+    """
+
+    def __init__(self, path: str, embed_query: Optional[Callable[[str], List[float]]] = None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embed_query = embed_query
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, META_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS rows (
+                slot INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document_name TEXT,
+                live INTEGER NOT NULL DEFAULT 1,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rows_document ON rows (document_name);
+            """
+        )
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM settings WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self._full_fd = None
+        self._load_locked()
+
+    # -- files ---------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load_locked(self):
+        """
+        (Re)maps the vector files and rebuilds the live mask from SQLite.
+        """
+        count = self._conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM rows").fetchone()[0]
+        self._count = count
+        live = np.zeros(count, dtype=bool)
+        slots = [r[0] for r in self._conn.execute("SELECT slot FROM rows WHERE live = 1")]
+        live[slots] = True
+        self._live = live
+        if count and self.dim:
+            self._codes = np.memmap(self._file(CODES_FILE), dtype=np.int8, mode="r", shape=(count, self.dim))
+            self._scales = np.memmap(self._file(SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+            if self._full_fd is None:
+                self._full_fd = os.open(self._file(FULL_FILE), os.O_RDONLY)
+        else:
+            self._codes = self._scales = None
+
+    def _read_full_locked(self, slots: Sequence[int]) -> np.ndarray:
+        """
+        Full-precision rows by slot. Read with pread rather than a mapping:
+        a few scattered rows per query, and mapped file pages would be
+        faulted in (and counted as resident) far beyond the rows needed.
+        Runs under the lock so close() can't release the fd mid-read (and
+        its number can't be reused under us).
+        """
+        if self._full_fd is None:
+            raise ValueError(f"Quantized store at {self.path} is closed")
+        row_bytes = self.dim * 4
+        out = np.empty((len(slots), self.dim), dtype=np.float32)
+        for i, slot in enumerate(slots):
+            out[i] = np.frombuffer(os.pread(self._full_fd, row_bytes, int(slot) * row_bytes), dtype=np.float32)
+        return out
+
+    def _write_rows(self, slot: int, vectors: np.ndarray):
+        codes, scales = quantize(vectors)
+        for name, data, width in ((CODES_FILE, codes, self.dim), (SCALES_FILE, scales, 1),
+                                  (FULL_FILE, vectors.astype(np.float32), self.dim)):
+            mode = "r+b" if os.path.exists(self._file(name)) else "wb"
+            with open(self._file(name), mode) as f:
+                f.seek(slot * width * data.itemsize)
+                f.write(np.ascontiguousarray(data).tobytes())
+
+    # -- writes --------------------------------------------------------------
+
+    def upsert(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+               metadatas: Sequence[Dict], documents: Sequence[str]):
+        if not ids:
+            return
+        # An id repeated within the batch keeps its last occurrence, so it
+        # gets exactly one row
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            embeddings = [embeddings[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            documents = [documents[i] for i in keep]
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.execute("INSERT INTO settings (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            existing = dict(self._conn.execute(
+                f"SELECT chunk_id, slot FROM rows WHERE chunk_id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall())
+            fresh = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+            # Re-written ids keep their slot; new ids are appended
+            for i, chunk_id in enumerate(ids):
+                if chunk_id in existing:
+                    self._write_rows(existing[chunk_id], vectors[i:i + 1])
+            if fresh:
+                self._write_rows(self._count, vectors[fresh])
+
+            rows = []
+            next_slot = self._count
+            for i, chunk_id in enumerate(ids):
+                slot = existing.get(chunk_id)
+                if slot is None:
+                    slot, next_slot = next_slot, next_slot + 1
+                metadata = metadatas[i] or {}
+                rows.append((slot, chunk_id, metadata.get("document_name"), documents[i], json.dumps(metadata)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows (slot, chunk_id, document_name, live, content, metadata) "
+                "VALUES (?, ?, ?, 1, ?, ?)", rows,
+            )
+            self._conn.commit()
+            self._load_locked()
+
+    def delete(self, ids: Sequence[str]) -> int:
+        if not ids:
+            return 0
+        with self._lock:
+            deleted = 0
+            for i in range(0, len(ids), 500):
+                batch = list(ids[i:i + 500])
+                deleted += self._conn.execute(
+                    f"UPDATE rows SET live = 0 WHERE live = 1 AND chunk_id IN ({','.join('?' * len(batch))})", batch
+                ).rowcount
+            self._conn.commit()
+            self._load_locked()
+        return deleted
+
+    def delete_document(self, document_name: str) -> int:
+        with self._lock:
+            deleted = self._conn.execute(
+                "UPDATE rows SET live = 0 WHERE live = 1 AND document_name = ?", (document_name,)
+            ).rowcount
+            self._conn.commit()
+            self._load_locked()
+        return deleted
+
+    def get_embeddings(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Stored (normalized) vectors of live rows by chunk id.
+        """
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, slot FROM rows WHERE live = 1 AND chunk_id IN ({','.join('?' * len(ids))})",
+                list(ids),
+            ).fetchall()
+            if not rows:
+                return {}
+            vectors = self._read_full_locked([slot for _, slot in rows])
+        return {chunk_id: vector for (chunk_id, _), vector in zip(rows, vectors)}
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._live.sum())
+
+    def dead_count(self) -> int:
+        with self._lock:
+            return self._count - int(self._live.sum())
+
+    def iter_live(self, batch: int = 1000):
+        """
+        Yields (ids, embeddings, metadatas, documents) batches of live rows.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT slot, chunk_id, content, metadata FROM rows WHERE live = 1 ORDER BY slot"
+            ).fetchall()
+        for i in range(0, len(rows), batch):
+            part = rows[i:i + batch]
+            with self._lock:
+                embeddings = self._read_full_locked([r[0] for r in part])
+            yield [r[1] for r in part], embeddings, [json.loads(r[3]) for r in part], [r[2] for r in part]
+
+    def copy_live_to(self, path: str):
+        """
+        Writes a fresh store at path holding only the live rows (compaction).
+        """
+        target = QuantizedStore(path)
+        try:
+            for ids, embeddings, metadatas, documents in self.iter_live():
+                target.upsert(ids, embeddings, metadatas, documents)
+        finally:
+            target.close()
+
+    # -- reads ---------------------------------------------------------------
+
+    def _where_sql(self, where: Dict) -> Tuple[str, List]:
+        """
+        Translates the Chroma "where" subset used by retrieval ({field: value},
+        {field: {"$in": [...]}}, "$and", "$or") into SQL over the rows table.
+        """
+        clauses, params = [], []
+        for key, value in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._where_sql(clause) for clause in value]
+                joiner = " AND " if key == "$and" else " OR "
+                clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+                params.extend(p for _, part_params in parts for p in part_params)
+                continue
+            column = "document_name" if key == "document_name" else "json_extract(metadata, ?)"
+            column_params = [] if key == "document_name" else [f"$.{key}"]
+            if isinstance(value, dict):
+                if set(value) != {"$in"}:
+                    raise ValueError(f"Unsupported filter operator in {value}")
+                values = list(value["$in"])
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(column_params + values)
+            else:
+                clauses.append(f"{column} = ?")
+                params.extend(column_params + [value])
+        return "(" + " AND ".join(clauses) + ")", params
+
+    def _filter_mask(self, where: Dict, count: int) -> np.ndarray:
+        sql, params = self._where_sql(where)
+        mask = np.zeros(count, dtype=bool)
+        slots = [r[0] for r in self._conn.execute(
+            f"SELECT slot FROM rows WHERE live = 1 AND slot < ? AND {sql}", [count] + params
+        )]
+        mask[slots] = True
+        return mask
+
+    def search_by_vector(self, embedding: Sequence[float], k: int = 10,
+                         filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """
+        Top-k (document, cosine similarity): int8 scan over live rows, then
+        exact float32 scores for the best k * QUANTIZED_RERANK_FACTOR. A
+        filter is resolved in SQLite first and only the matching rows are
+        scanned.
+        """
+        with self._lock:
+            count, live, codes, scales = self._count, self._live, self._codes, self._scales
+            rows = np.flatnonzero(live & self._filter_mask(filter, count)) if filter else None
+        live_count = int(live.sum()) if rows is None else len(rows)
+        if codes is None or not live_count or k <= 0:
+            return []
+
+        query = np.array(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        if rows is None:
+            approx = np.empty(count, dtype=np.float32)
+            for start in range(0, count, SCAN_BLOCK_ROWS):
+                end = min(start + SCAN_BLOCK_ROWS, count)
+                np.dot(codes[start:end].astype(np.float32), query, out=approx[start:end])
+            approx *= scales
+            approx[~live] = -np.inf
+        else:
+            approx = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                block = rows[start:start + SCAN_BLOCK_ROWS]
+                np.dot(codes[block].astype(np.float32), query, out=approx[start:start + len(block)])
+            approx *= scales[rows]
+
+        m = min(max(k * QUANTIZED_RERANK_FACTOR, k), live_count)
+        top = np.argpartition(-approx, m - 1)[:m] if m < len(approx) else np.arange(len(approx))
+        candidates = top if rows is None else rows[top]
+        candidates = np.sort(candidates[np.isfinite(approx[top])])  # sequential reads from the float file
+        with self._lock:
+            full = self._read_full_locked(candidates)
+        exact = full @ query
+        order = np.argsort(-exact)[:k]
+        slots = [int(candidates[i]) for i in order]
+        scores = [float(exact[i]) for i in order]
+        if not slots:
+            return []
+
+        with self._lock:
+            stored = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    f"SELECT slot, chunk_id, content, metadata FROM rows WHERE slot IN ({','.join('?' * len(slots))})",
+                    slots,
+                )
+            }
+        results = []
+        for slot, score in zip(slots, scores):
+            if slot not in stored:
+                continue  # compacted away mid-search
+            chunk_id, content, metadata = stored[slot]
+            results.append((Document(id=chunk_id, page_content=content, metadata=json.loads(metadata)), score))
+        return results
+
+    def similarity_search(self, query: str, k: int = 10, filter: Optional[Dict] = None) -> List[Document]:
+        """
+        Same call shape as Chroma.similarity_search.
+        """
+        return [doc for doc, _ in self.search_by_vector(self.embed_query(query), k=k, filter=filter)]
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for name in os.listdir(self.path):
+            try:
+                total += os.path.getsize(os.path.join(self.path, name))
+            except OSError:
+                pass
+        return total
+
+    def close(self):
+        with self._lock:
+            self._codes = self._scales = None
+            if self._full_fd is not None:
+                os.close(self._full_fd)
+                self._full_fd = None
+            self._conn.close()
@@ -1,18 +1,33 @@
-from typing import List
-from langchain_openai import ChatOpenAI
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import List, AsyncIterator, Dict, Any, Optional
 try:
     from langchain_core.prompts import ChatPromptTemplate
-    from langchain_core.runnables import RunnablePassthrough
+    from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
     from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.callbacks import BaseCallbackHandler
 except ImportError:
     from langchain.prompts import ChatPromptTemplate
-    from langchain.schema.runnable import RunnablePassthrough
+    from langchain.schema.runnable import Runnable, RunnableLambda, RunnablePassthrough
     from langchain.schema.output_parser import StrOutputParser
+    from langchain.callbacks.base import BaseCallbackHandler
 
-from . import vector_store
+from . import vector_store, answer_cache, retrieval, rerank, context, metrics, tokens, llm_client
+
+logger = logging.getLogger(__name__)
 
 # PRD Section 10 & 11: RAG Pipeline & Answer Format
-LLM = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+LLM_MODEL = "gpt-4o-mini"
+# Keep-alive connections to the chat API, shared by every request
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", str(llm_client.LLM_CONCURRENCY)))
+# Built on first use (get_llm / get_chain): constructing the OpenAI client and
+# importing langchain_openai is a large share of cold-start time.
+LLM = None
+RAG_CHAIN = None
+_init_lock = threading.RLock()
 
 STRICT_SYSTEM_PROMPT = """You are DocuMind Pro, a helpful assistant.
 Answer the user's question using the provided context.
@@ -32,6 +47,57 @@ If the answer is not entirely in the context, summarize what IS in the context r
 If the context is completely irrelevant, then explicitly refuse.
 """
 
+# Parsed once; every request reuses the same template
+PROMPT = ChatPromptTemplate.from_template(STRICT_SYSTEM_PROMPT)
+
+# Completions in flight at once for a /chat/batch request
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+ERROR_MESSAGE = "Sorry, I encountered an error processing your request."
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Times every chat model call into documind_stage_seconds{stage="llm"} and
+    counts prompt/completion tokens from the reported usage. Streamed calls
+    without usage fall back to counting the completion text.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            for generation in (g for gens in response.generations for g in gens):
+                message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if message_usage:
+                    prompt_tokens += message_usage.get("input_tokens", 0)
+                    completion_tokens += message_usage.get("output_tokens", 0)
+                else:
+                    completion_tokens += tokens.count_tokens(generation.text, tokens.LLM_ENCODING_NAME)
+        metrics.TOKENS.inc(prompt_tokens, kind="prompt")
+        metrics.TOKENS.inc(completion_tokens, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+LLM_CALLBACKS = [LLMMetricsHandler()] if metrics.METRICS_ENABLED else []
+
+# Every completion goes through here: concurrency limits, timeouts/retries and
+# coalescing of identical in-flight questions (see llm_client.LLMClient)
+llm_pool = llm_client.LLMClient(lambda: get_llm(), callbacks=LLM_CALLBACKS)
+
 def format_docs(docs):
     """
     CRITICAL: Format context to include metadata so LLM can cite sources.
@@ -54,34 +120,253 @@ def format_docs(docs):
         
     return "\n\n".join(formatted_chunks)
         
-def get_answer(user_id: int, question: str) -> str:
+def _retrieval_k() -> int:
+    # k=10 kept from optimization, or a wider candidate set when the MMR
+    # re-rank stage narrows it down afterwards
+    return rerank.RERANK_FETCH_K if rerank.RERANK_ENABLED else retrieval.RETRIEVAL_K
+
+def get_retriever(user_id: int, scope: Optional[retrieval.Scope] = None,
+                  lexical: Optional[retrieval.LexicalResult] = None):
+    # Hybrid BM25 + vector retrieval, reusing BM25 results already computed
+    # for the question (see _cache_lookup)
+    return retrieval.HybridRetriever(user_id=user_id, k=_retrieval_k(), scope=scope, lexical=lexical)
+
+def _cache_owner(user_id: int, scope: Optional[retrieval.Scope]):
+    # Scoped answers are cached apart from whole-corpus ones (and per scope)
+    return user_id if scope is None else (user_id, scope)
+
+def format_sources(docs) -> List[Dict[str, Any]]:
     """
-    Retrieves documents and generates an answer using RAG.
+    Structured citations for the retrieved chunks, one per distinct file/location.
     """
-    vectorstore = vector_store.get_vectorstore(user_id)
-    # Reverting to simple retrieval significantly robust
-    # We kept k=10 from optimization
-    retriever = vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={
-            "k": 10, 
-            "filter": {"user_id": user_id} 
-        }
+    sources = []
+    seen = set()
+    for doc in docs:
+        source = {"document_name": doc.metadata.get("document_name", "Unknown File")}
+        if "page_number" in doc.metadata:
+            source["page_number"] = doc.metadata["page_number"]
+        elif "row_range" in doc.metadata:
+            source["row_range"] = doc.metadata["row_range"]
+        key = tuple(source.items())
+        if key not in seen:
+            seen.add(key)
+            sources.append(source)
+    return sources
+
+def _lexical_search(user_id: int, question: str, scope: Optional[retrieval.Scope]):
+    # What the retriever's BM25 half would find; None when it has none
+    if not retrieval.HYBRID_RETRIEVAL:
+        return None
+    return retrieval.lexical_search(user_id, question, k=_retrieval_k(), scope=scope)
+
+def _cache_lookup(user_id: int, question: str, version, scope: Optional[retrieval.Scope],
+                  lexical: Optional[retrieval.LexicalResult] = None):
+    """
+    Answer-cache lookup ahead of retrieval: (entry, question_vector, lexical).
+    On an exact miss the BM25 search runs first (unless `lexical` has it);
+    when it is decisive retrieval never embeds the question, so neither
+    does the semantic lookup. The BM25 results go on to the retriever.
+    """
+    def embed_query(text: str):
+        nonlocal lexical
+        if lexical is None:
+            lexical = _lexical_search(user_id, text, scope)
+        if retrieval.skips_dense(lexical):
+            return None
+        return vector_store.embedding_function.embed_query(text)
+
+    entry, vector = answer_cache.lookup(_cache_owner(user_id, scope), question, version, embed_query)
+    return entry, vector, lexical
+
+def _retrieve(inputs: Dict[str, Any]):
+    docs = get_retriever(inputs["user_id"], inputs.get("scope"), inputs.get("lexical")).invoke(inputs["question"])
+    if not rerank.RERANK_ENABLED:
+        return docs
+    return rerank.rerank(inputs["user_id"], inputs["question"], docs)
+
+async def _aretrieve(inputs: Dict[str, Any]):
+    # Opening the store touches disk; keep it off the event loop
+    retriever = await asyncio.to_thread(get_retriever, inputs["user_id"], inputs.get("scope"), inputs.get("lexical"))
+    docs = await retriever.ainvoke(inputs["question"])
+    if not rerank.RERANK_ENABLED:
+        return docs
+    # Cache/store lookups are blocking SQLite reads
+    return await asyncio.to_thread(rerank.rerank, inputs["user_id"], inputs["question"], docs)
+
+def _prompt_inputs(inputs: Dict[str, Any]) -> Dict[str, str]:
+    return {"context": format_docs(inputs["docs"]), "question": inputs["question"]}
+
+def _flight_key(user_id: int, question: str, version, scope: Optional[retrieval.Scope]):
+    # Identical questions against the same corpus version share a completion
+    if version is None:
+        return None
+    return (_cache_owner(user_id, scope), version, question)
+
+def build_chain(llm=None) -> Runnable:
+    """
+    Composes the RAG pipeline once. Input is {"user_id", "question"} and an
+    optional "scope", "version" (the corpus version, which lets identical
+    in-flight questions share a completion) and "lexical" (BM25 results
+    already computed for the question); the retriever is resolved per
+    call from them, so one compiled chain serves every user. Output is the
+    input plus "docs" (the packed context chunks) and "answer".
+    """
+    model = (llm or get_llm()).with_config(callbacks=LLM_CALLBACKS)
+
+    async def agenerate(inputs: Dict[str, Any]) -> str:
+        messages = PROMPT.format_messages(**_prompt_inputs(inputs))
+        key = _flight_key(inputs["user_id"], inputs["question"], inputs.get("version"), inputs.get("scope"))
+        return await llm_pool.complete(inputs["user_id"], messages, key=key, model=llm)
+
+    # Sync invoke calls the model directly; the async path goes through llm_pool
+    generate = RunnableLambda(_prompt_inputs) | PROMPT | model | StrOutputParser()
+    generate = RunnableLambda(generate.invoke, afunc=agenerate)
+    return (
+        RunnablePassthrough.assign(docs=RunnableLambda(_retrieve, afunc=_aretrieve) | context.pack_documents)
+        | RunnablePassthrough.assign(answer=generate)
     )
-    
-    # Standard RAG Chain
-    prompt = ChatPromptTemplate.from_template(STRICT_SYSTEM_PROMPT)
-    
-    rag_chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | LLM
-        | StrOutputParser()
+
+def get_llm():
+    global LLM
+    if LLM is None:
+        with _init_lock:
+            if LLM is None:
+                import httpx
+                from langchain_openai import ChatOpenAI
+                # One pooled async client for all completions; timeouts and
+                # retries are handled per attempt by llm_pool
+                LLM = ChatOpenAI(
+                    model=LLM_MODEL, temperature=0, max_retries=0, timeout=llm_client.LLM_TIMEOUT,
+                    http_async_client=httpx.AsyncClient(
+                        timeout=llm_client.LLM_TIMEOUT,
+                        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                            max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                    ),
+                )
+    return LLM
+
+def get_chain() -> Runnable:
+    global RAG_CHAIN
+    if RAG_CHAIN is None:
+        with _init_lock:
+            if RAG_CHAIN is None:
+                RAG_CHAIN = build_chain(get_llm())
+    return RAG_CHAIN
+
+async def get_answer(user_id: int, question: str, scope: Optional[retrieval.Scope] = None) -> str:
+    """
+    Retrieves documents and generates an answer using RAG.
+    """
+    try:
+        version = vector_store.get_corpus_version(user_id)
+        owner = _cache_owner(user_id, scope)
+        cached, question_vector, lexical = await asyncio.to_thread(_cache_lookup, user_id, question, version, scope)
+        if cached is not None:
+            return cached["answer"]
+
+        result = await get_chain().ainvoke({"user_id": user_id, "question": question, "scope": scope,
+                                            "version": version, "lexical": lexical})
+        answer_cache.store(owner, question, version, result["answer"],
+                           format_sources(result["docs"]), question_vector)
+        return result["answer"]
+    except Exception:
+        logger.exception("RAG error for user %s", user_id)
+        return ERROR_MESSAGE
+
+
+async def answer_batch(user_id: int, questions: List[str],
+                       scope: Optional[retrieval.Scope] = None) -> List[Dict[str, Any]]:
+    """
+    Answers many questions at once: one embedding request covers every
+    question that needs one, cached answers are served directly, and the
+    remaining distinct questions run through the chain concurrently. Results keep input order;
+    a failed question gets an error entry instead of failing the batch.
+    """
+    version = vector_store.get_corpus_version(user_id)
+    owner = _cache_owner(user_id, scope)
+    distinct = list(dict.fromkeys(questions))
+
+    # BM25 first: questions it decides are never embedded. The rest are
+    # embedded in one request, which warms the embedding cache so the
+    # answer-cache lookups and the retrievers' query embeddings are local hits.
+    lexicals = await asyncio.gather(*(asyncio.to_thread(_lexical_search, user_id, q, scope) for q in distinct))
+    dense = [q for q, lexical in zip(distinct, lexicals) if not retrieval.skips_dense(lexical)]
+    if dense:
+        await asyncio.to_thread(vector_store.embedding_function.embed_documents, dense)
+    lookups = await asyncio.gather(*(
+        asyncio.to_thread(_cache_lookup, user_id, q, version, scope, lexical)
+        for q, lexical in zip(distinct, lexicals)
+    ))
+
+    results: Dict[str, Dict[str, Any]] = {}
+    misses = []
+    for question, (cached, vector, lexical) in zip(distinct, lookups):
+        if cached is not None:
+            results[question] = {"answer": cached["answer"], "sources": cached["sources"], "cached": True}
+        else:
+            misses.append((question, vector, lexical))
+
+    outputs = await get_chain().abatch(
+        [{"user_id": user_id, "question": q, "scope": scope, "version": version, "lexical": lexical}
+         for q, _, lexical in misses],
+        config={"max_concurrency": CHAT_BATCH_CONCURRENCY},
+        return_exceptions=True,
     )
-    
+    for (question, vector, _), output in zip(misses, outputs):
+        if isinstance(output, Exception):
+            results[question] = {"answer": ERROR_MESSAGE, "sources": [], "cached": False, "error": True}
+            continue
+        sources = format_sources(output["docs"])
+        answer_cache.store(owner, question, version, output["answer"], sources, vector)
+        results[question] = {"answer": output["answer"], "sources": sources, "cached": False}
+
+    return [{"question": q, **results[q]} for q in questions]
+
+
+async def stream_answer(user_id: int, question: str,
+                        scope: Optional[retrieval.Scope] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async RAG: retrieves without blocking the event loop, then yields LLM tokens
+    as they arrive. Events are {"event": "token" | "sources" | "metrics" | "error", "data": ...}.
+    """
+    start = time.perf_counter()
     try:
-        response = rag_chain.invoke(question)
-        return response
-    except Exception as e:
-        # print(f"RAG Error: {e}")
-        return "Sorry, I encountered an error processing your request."
+        version = vector_store.get_corpus_version(user_id)
+        owner = _cache_owner(user_id, scope)
+        cached, question_vector, lexical = await asyncio.to_thread(_cache_lookup, user_id, question, version, scope)
+        if cached is not None:
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield {"event": "token", "data": cached["answer"]}
+            yield {"event": "sources", "data": cached["sources"]}
+            yield {"event": "metrics", "data": {
+                "retrieval_ms": 0.0, "ttft_ms": elapsed_ms, "total_ms": elapsed_ms, "cached": True,
+            }}
+            return
+
+        docs = context.pack_documents(await _aretrieve({"user_id": user_id, "question": question, "scope": scope,
+                                                        "lexical": lexical}))
+        retrieval_ms = (time.perf_counter() - start) * 1000
+
+        messages = PROMPT.format_messages(question=question, context=format_docs(docs))
+
+        ttft_ms = None
+        parts = []
+        async for part in llm_pool.stream(user_id, messages, key=_flight_key(user_id, question, version, scope)):
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+            parts.append(part)
+            yield {"event": "token", "data": part}
+    except Exception:
+        logger.exception("RAG error for user %s", user_id)
+        yield {"event": "error", "data": ERROR_MESSAGE}
+        return
+
+    sources = format_sources(docs)
+    answer_cache.store(owner, question, version, "".join(parts), sources, question_vector)
+    yield {"event": "sources", "data": sources}
+    yield {"event": "metrics", "data": {
+        "retrieval_ms": round(retrieval_ms, 1),
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        "cached": False,
+    }}
@@ -0,0 +1,104 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+from . import metrics
+
+# Configuration
+# Re-rank retrieved candidates with MMR over their stored embeddings before
+# packing the context (no extra API call; skipped if the query vector isn't cached)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+# Candidates retrieved for re-ranking, and chunks kept afterwards
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "6"))
+# 1.0 = pure relevance, 0.0 = pure diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Drop candidates whose cosine similarity to the question is below this, or
+# more than RERANK_SCORE_MARGIN below the best candidate's (the best is always kept)
+RERANK_MIN_SIMILARITY = float(os.getenv("RERANK_MIN_SIMILARITY", "0.0"))
+RERANK_SCORE_MARGIN = float(os.getenv("RERANK_SCORE_MARGIN", "0.25"))
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = MMR_LAMBDA,
+        min_similarity: float = RERANK_MIN_SIMILARITY, score_margin: float = RERANK_SCORE_MARGIN) -> List[int]:
+    """
+    Maximal marginal relevance over candidate vectors. Candidates below the
+    similarity floor are dropped first; then each pick maximizes
+    lambda * sim(query) - (1 - lambda) * max sim(already picked). The
+    pairwise similarities are one matrix product and the running maximum is
+    updated in place, so the loop is k vector ops over n <= ~50 candidates.
+    Returns candidate indices in pick order.
+    """
+    if k <= 0 or not len(candidates):
+        return []
+    query = _unit(np.asarray(query, dtype=np.float32))
+    candidates = _unit(np.asarray(candidates, dtype=np.float32))
+    relevance = candidates @ query
+
+    best = float(relevance.max())
+    floor = min(best, max(min_similarity, best - score_margin))
+    kept = np.flatnonzero(relevance >= floor)
+    relevance = relevance[kept]
+    similarity = candidates[kept] @ candidates[kept].T
+
+    first = int(np.argmax(relevance))
+    picked = [first]
+    redundancy = similarity[first].copy()
+    available = np.ones(len(kept), dtype=bool)
+    available[first] = False
+    while len(picked) < min(k, len(kept)):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return [int(kept[i]) for i in picked]
+
+
+def rerank(user_id: int, question: str, docs: List[Document], k: int = RERANK_TOP_K) -> List[Document]:
+    """
+    Picks a relevant, non-redundant subset of the retrieved chunks. Vectors
+    come from the embedding cache (the query and every ingested chunk were
+    embedded through it) with the user's store as fallback for evicted
+    chunks; without a cached query vector the docs are only truncated, so
+    this never calls the embedding API.
+    """
+    if not RERANK_ENABLED or len(docs) <= 1:
+        return docs[:k]
+    from . import vector_store
+
+    with metrics.span("rerank", candidates=len(docs)):
+        texts = [question] + [doc.page_content for doc in docs]
+        cached = vector_store.get_embedding_cache().peek_many(vector_store.EMBEDDING_MODEL, texts, as_arrays=True)
+        query_vector: Optional[np.ndarray] = cached[0]
+        if query_vector is None:
+            return docs[:k]
+
+        vectors = cached[1:]
+        missing = [doc.metadata.get("chunk_id") for doc, v in zip(docs, vectors) if v is None]
+        if missing:
+            stored = vector_store.get_embeddings(user_id, [i for i in missing if i])
+            vectors = [v if v is not None else stored.get(doc.metadata.get("chunk_id"))
+                       for doc, v in zip(docs, vectors)]
+        usable = [i for i, v in enumerate(vectors) if v is not None]
+        if not usable:
+            return docs[:k]
+
+        order = mmr(query_vector, np.stack([np.asarray(vectors[i], dtype=np.float32) for i in usable]), k)
+        picked = [docs[usable[i]] for i in order]
+        # Chunks with no vector anywhere can't be scored; they only fill leftover slots
+        unscored = [doc for doc, v in zip(docs, vectors) if v is None]
+        return (picked + unscored)[:k]
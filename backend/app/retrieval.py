@@ -0,0 +1,138 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from langchain_core.documents import Document
+    from langchain_core.retrievers import BaseRetriever
+    from langchain_core.callbacks import CallbackManagerForRetrieverRun
+except ImportError:
+    from langchain.schema import Document, BaseRetriever
+    from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+
+from . import vector_store, lexical_index, metrics
+
+# Configuration
+RETRIEVAL_K = 10
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+RRF_K = 60
+# Lexical-only fast path: skip the vector search (and its query embedding call)
+# when the best BM25 hit contains every query term and clearly beats the runner-up.
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+LEXICAL_DECISIVE_RATIO = float(os.getenv("LEXICAL_DECISIVE_RATIO", "2.0"))
+
+
+# Documents (and optionally pages) a question is restricted to:
+# ((document_name, (page, ...) or None), ...), sorted so equal scopes are equal keys
+Scope = Tuple[Tuple[str, Optional[Tuple[int, ...]]], ...]
+
+
+def make_scope(documents) -> Optional[Scope]:
+    """
+    Normalizes [(document_name, pages or None)] into a hashable Scope.
+    """
+    if not documents:
+        return None
+    pages_by_name: Dict[str, Optional[set]] = {}
+    for name, pages in documents:
+        if name in pages_by_name and pages_by_name[name] is None:
+            continue
+        if pages is None:
+            pages_by_name[name] = None
+        else:
+            pages_by_name.setdefault(name, set()).update(pages)
+    return tuple(sorted(
+        (name, None if pages is None else tuple(sorted(pages))) for name, pages in pages_by_name.items()
+    ))
+
+
+def scope_filter(scope: Optional[Scope]) -> Optional[Dict]:
+    """
+    Chroma "where" clause for a scope, evaluated by the store before the
+    similarity search. Whole documents share one $in clause.
+    """
+    if not scope:
+        return None
+    whole = [name for name, pages in scope if pages is None]
+    clauses = []
+    if whole:
+        clauses.append({"document_name": whole[0]} if len(whole) == 1 else {"document_name": {"$in": whole}})
+    for name, pages in scope:
+        if pages is not None:
+            clauses.append({"$and": [{"document_name": name}, {"page_number": {"$in": list(pages)}}]})
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def doc_key(doc: Document) -> str:
+    return doc.metadata.get("chunk_id") or doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int = RETRIEVAL_K, rrf_k: int = RRF_K) -> List[Document]:
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in ranked]
+
+
+def is_decisive(lexical_hits, coverage: float) -> bool:
+    if not lexical_hits or coverage < 1.0:
+        return False
+    if len(lexical_hits) == 1:
+        return True
+    return lexical_hits[0][1] >= LEXICAL_DECISIVE_RATIO * lexical_hits[1][1]
+
+
+# (hits, coverage) of one BM25 search: hits are (Document, score), best first
+LexicalResult = Tuple[List[Tuple[Document, float]], float]
+
+
+def lexical_search(user_id: int, query: str, k: int = RETRIEVAL_K, scope: Optional[Scope] = None) -> LexicalResult:
+    with metrics.span("lexical_search"):
+        return lexical_index.get_index(user_id).search(query, k=k, scope=scope)
+
+
+def skips_dense(lexical: Optional[LexicalResult]) -> bool:
+    """
+    True when a HybridRetriever given these lexical results answers from
+    them alone, without embedding the query.
+    """
+    return HYBRID_RETRIEVAL and LEXICAL_FAST_PATH and lexical is not None and is_decisive(*lexical)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 over the user's local inverted index fused with Chroma similarity
+    search by reciprocal rank fusion. An optional scope restricts both
+    searches to some documents/pages before ranking, not after. `lexical`
+    takes the BM25 results for the query when the caller already has them.
+    """
+
+    user_id: int
+    k: int = RETRIEVAL_K
+    scope: Optional[Scope] = None
+    lexical: Optional[LexicalResult] = None
+
+    def _vector_search(self, query: str) -> List[Document]:
+        with metrics.span("vector_search"), vector_store.get_vectorstore(self.user_id) as vectorstore:
+            # Collections are per user already, so there is no user_id filter;
+            # only a document scope narrows the search.
+            return vectorstore.similarity_search(query, k=self.k, filter=scope_filter(self.scope))
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with metrics.span("retrieval"):
+            if not HYBRID_RETRIEVAL:
+                return self._vector_search(query)
+
+            lexical = self.lexical
+            if lexical is None:
+                lexical = lexical_search(self.user_id, query, k=self.k, scope=self.scope)
+            lexical_hits, _ = lexical
+            if skips_dense(lexical):
+                return [doc for doc, _ in lexical_hits]
+
+            vector_docs = self._vector_search(query)
+            return reciprocal_rank_fusion([vector_docs, [doc for doc, _ in lexical_hits]], k=self.k)
@@ -1,4 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, EmailStr, Field
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -15,5 +18,51 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+class DocumentScope(BaseModel):
+    document_name: str
+    # PDF/TXT page numbers within the document; None means the whole document
+    pages: Optional[List[int]] = Field(None, min_length=1)
+
 class ChatRequest(BaseModel):
     question: str
+    # Restrict retrieval to these documents (and pages); None searches everything
+    documents: Optional[List[DocumentScope]] = Field(None, min_length=1, max_length=100)
+
+class BatchChatRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=100)
+    documents: Optional[List[DocumentScope]] = Field(None, min_length=1, max_length=100)
+
+class JobResponse(BaseModel):
+    job_id: str
+    filename: str
+    status: str
+    current_stage: Optional[str] = None
+    progress: float
+    stages: Dict[str, Dict[str, Any]]
+    chunks_processed: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class FileInfo(BaseModel):
+    document_name: str
+    size_bytes: int
+    file_hash: Optional[str] = None
+    page_count: int
+    row_count: int
+    chunk_count: int
+    status: str
+    created_at: datetime
+    ingested_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class FileListResponse(BaseModel):
+    files: List[FileInfo]
+    total: int
+    total_bytes: int
+    total_chunks: int
+    offset: int
+    limit: int
@@ -0,0 +1,130 @@
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, Optional, Sequence
+
+from .tokens import get_encoding
+
+# Preferred cut points, strongest first: paragraph, line, sentence, word
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class TokenSplitter:
+    """
+    Splits text into chunks of at most chunk_size tiktoken tokens with
+    chunk_overlap tokens repeated between neighbours.
+
+    Every text is encoded exactly once (the whole batch in one
+    encode_ordinary_batch call); cut points are then chosen on the token
+    offsets, preferring a paragraph, line, sentence or word break in the
+    second half of each window, so nothing is re-tokenized per candidate
+    split the way a length_function-driven splitter does. Each text is split
+    on its own, so chunks never cross a page or row-block boundary.
+    """
+
+    def __init__(self, chunk_size: int = 400, chunk_overlap: int = 80, encoding=None,
+                 separators: Sequence[str] = SEPARATORS):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding = encoding if encoding is not None else get_encoding()
+        if self.encoding is None:
+            raise RuntimeError("tiktoken encoding is not available")
+        self.separators = tuple(separators)
+
+    def _offsets(self, text: str, ids: List[int]) -> List[int]:
+        """
+        Character offset at which each token starts.
+        """
+        if text.isascii():
+            # One byte per character: offsets are the running token byte lengths
+            lengths = map(len, self.encoding.decode_tokens_bytes(ids))
+            return [0] + list(accumulate(lengths))[:-1]
+        return self.encoding.decode_with_offsets(ids)[1]
+
+    def _cut(self, text: str, lo: int, hi: int) -> int:
+        """
+        End of the chunk: just after the strongest separator in text[lo:hi],
+        or hi itself when there is none.
+        """
+        for separator in self.separators:
+            position = text.rfind(separator, lo, hi)
+            if position != -1:
+                return position + len(separator)
+        return hi
+
+    def _split(self, text: str, ids: List[int]) -> List[str]:
+        total = len(ids)
+        if total <= self.chunk_size:
+            stripped = text.strip()
+            return [stripped] if stripped else []
+
+        offsets = self._offsets(text, ids)
+        chunks = []
+        start = 0  # token index
+        while start < total:
+            start_char = offsets[start]
+            window_end = start + self.chunk_size
+            if window_end >= total:
+                end_char = len(text)
+                end = total
+            else:
+                # Don't cut before half a window, so chunks stay close to chunk_size
+                end_char = self._cut(text, offsets[start + self.chunk_size // 2], offsets[window_end])
+                # The token holding the cut: a cut inside a " word" token must
+                # not push the next chunk past the rest of that word
+                end = bisect_right(offsets, end_char, start + 1, window_end + 1) - 1
+            chunk = text[start_char:end_char].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= total:
+                break
+
+            # Step back by the overlap, then forward to the token holding the
+            # next word start (tokens carry their leading space), never past
+            # the token holding the cut so no text falls between chunks
+            next_start = max(end - self.chunk_overlap, start + 1)
+            if next_start < end:
+                match = _WHITESPACE.search(text, offsets[next_start], end_char)
+                if match is not None:
+                    next_start = max(bisect_right(offsets, match.end(), next_start, end + 1) - 1, next_start)
+            start = next_start
+        return chunks
+
+    def split_texts(self, texts: Sequence[str]) -> List[List[str]]:
+        """
+        Chunks for each text, in order.
+        """
+        encoded = self.encoding.encode_ordinary_batch(list(texts))
+        return [self._split(text, ids) for text, ids in zip(texts, encoded)]
+
+    def split_text(self, text: str) -> List[str]:
+        return self.split_texts([text])[0]
+
+
+class CharacterSplitter:
+    """
+    Adapter giving a LangChain character splitter the split_texts() interface.
+    """
+
+    def __init__(self, splitter):
+        self.splitter = splitter
+
+    def split_texts(self, texts: Sequence[str]) -> List[List[str]]:
+        return [self.splitter.split_text(text) for text in texts]
+
+    def split_text(self, text: str) -> List[str]:
+        return self.splitter.split_text(text)
+
+
+def make_token_splitter(chunk_size: int, chunk_overlap: int) -> Optional[TokenSplitter]:
+    """
+    A TokenSplitter, or None when tiktoken can't load its encoding (offline).
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return None
+    return TokenSplitter(chunk_size, chunk_overlap, encoding=encoding)
@@ -0,0 +1,41 @@
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+
+# text-embedding-3-* tokenize with cl100k_base: chunk sizes and embedding
+# batches are counted with it
+ENCODING_NAME = "cl100k_base"
+# gpt-4o / gpt-4o-mini use o200k_base: context and prompt budgets
+LLM_ENCODING_NAME = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = ENCODING_NAME):
+    """
+    Returns the tiktoken encoding, or None when it cannot be loaded
+    (tiktoken downloads the BPE file on first use, which fails offline).
+    """
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+def _estimate(text: str) -> int:
+    # ~4 characters per token for English text
+    return max(1, len(text) // 4) if text else 0
+
+
+def count_tokens(text: str, encoding_name: str = ENCODING_NAME) -> int:
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return _estimate(text)
+    return len(encoding.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: List[str], encoding_name: str = ENCODING_NAME) -> List[int]:
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return [_estimate(t) for t in texts]
+    return [len(ids) for ids in encoding.encode_ordinary_batch(texts)]
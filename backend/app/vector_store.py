@@ -1,49 +1,647 @@
 import os
+import json
+import time
+import shutil
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import chromadb
 from pathlib import Path
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 
+from .embedding_cache import EmbeddingCache, CachedEmbeddings
+from .embedder import BatchEmbedder
+from .quantized_store import QuantizedStore
+from . import locks, metrics
+
 load_dotenv()
 
 # Configuration
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# "chroma" (HNSW, float32) or "quantized" (int8 memory-mapped scan with exact
+# re-ranking, see quantized_store). Existing Chroma data is copied over the
+# first time a user's quantized store is opened.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
 # Create single embedding function instance to save resources? 
 # Or create per request. OpenAIEmbeddings is lightweight client.
-embedding_function = OpenAIEmbeddings(model="text-embedding-3-small")
+# Wrapped in a content-addressed cache so re-uploads and repeated boilerplate
+# only pay for chunks we have never embedded before. The cache's SQLite file
+# is opened on first use, not at import.
+_embedding_cache = None
+_init_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _init_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+# Misses go through the batched, concurrent embedder rather than LangChain's
+# serial OpenAIEmbeddings loop.
+embedding_function = CachedEmbeddings(
+    BatchEmbedder(model=EMBEDDING_MODEL), get_embedding_cache, EMBEDDING_MODEL
+)
+
+# Open-store pool sizing (PRD: 4 GB box)
+STORE_POOL_MAX = int(os.getenv("STORE_POOL_MAX", "16"))
+STORE_POOL_MAX_MB = int(os.getenv("STORE_POOL_MAX_MB", "512"))
+STORE_IDLE_TIMEOUT = float(os.getenv("STORE_IDLE_TIMEOUT", "600"))
+# Fixed per-client overhead on top of the on-disk index size
+STORE_BASE_BYTES = 8 * 1024 * 1024
+
+# Rebuild a user's collection once deleted vectors make up this share of it
+COMPACTION_THRESHOLD = float(os.getenv("COMPACTION_THRESHOLD", "0.25"))
+COMPACTION_MIN_DELETED = int(os.getenv("COMPACTION_MIN_DELETED", "200"))
 
 def get_vectorstore_path(user_id: int) -> str:
     return str(DATA_DIR / str(user_id) / "chroma_db")
 
+def get_quantized_store_path(user_id: int) -> str:
+    return str(DATA_DIR / str(user_id) / "quantized_db")
+
+def get_store_path(user_id: int) -> str:
+    """
+    On-disk location of the user's store for the configured backend.
+    """
+    if VECTOR_BACKEND == "quantized":
+        return get_quantized_store_path(user_id)
+    return get_vectorstore_path(user_id)
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _release_client(persist_directory: str):
+    # chromadb keeps one System per persist path; stop it so its HNSW
+    # segments and SQLite handles are actually released.
+    _stop_system(_forget_system(persist_directory))
+
+
+def _forget_system(persist_directory: str, system=None):
+    """
+    Unregisters chromadb's shared System for a path (only if it is `system`,
+    when given), so the next client for the path starts a fresh one.
+    Collections already open keep working on the old System.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        registry = SharedSystemClient._identifier_to_system
+        if system is None or registry.get(persist_directory) is system:
+            return registry.pop(persist_directory, None)
+    except Exception:
+        pass
+    return system
+
+
+def _stop_system(system):
+    if system is None:
+        return
+    try:
+        system.stop()
+    except Exception:
+        pass
+
+
+def _estimate_bytes(vectorstore, persist_directory: str) -> int:
+    if isinstance(vectorstore, QuantizedStore):
+        # Memory-mapped: the int8 codes a scan touches are the working set,
+        # not the whole directory
+        return STORE_BASE_BYTES + vectorstore.count() * (vectorstore.dim or 0)
+    return STORE_BASE_BYTES + _dir_size(persist_directory)
+
+
+class _PooledStore:
+    def __init__(self, vectorstore, persist_directory: str, est_bytes: int, version: int):
+        self.vectorstore = vectorstore
+        self.persist_directory = persist_directory
+        self.est_bytes = est_bytes
+        # Corpus version the open handle reflects
+        self.version = version
+        self.last_used = time.monotonic()
+        # chromadb System behind a Chroma store (None for QuantizedStore)
+        self.system = getattr(getattr(vectorstore, "_client", None), "_system", None)
+        # Leases currently using the store; a retired store (evicted, idle or
+        # stale) is closed once the last one is released
+        self.holders = 0
+        self.retired = False
+        self.closing = False
+        self.closed = False
+
+
+class VectorStorePool:
+    """
+    Process-wide registry of open per-user stores (Chroma collections or
+    QuantizedStores, per VECTOR_BACKEND).
+    Evicts least recently used stores beyond max_stores or max_bytes
+    (estimated from the on-disk HNSW/SQLite size) and closes stores idle
+    for longer than idle_timeout seconds.
+
+    An open store doesn't see writes made by another worker process, so a
+    store whose corpus version moved on without this process writing it
+    (see note_write) is reopened on its next use.
+
+    Stores are handed out as leases (see lease). Evicting a store only
+    retires it: it leaves the pool at once, but is closed when its last
+    lease is released, so a search never runs on a closed store.
+    """
+
+    def __init__(self, max_stores: int = STORE_POOL_MAX, max_bytes: int = STORE_POOL_MAX_MB * 1024 * 1024,
+                 idle_timeout: float = STORE_IDLE_TIMEOUT):
+        self.max_stores = max_stores
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        # Signalled whenever a retired store gets closed
+        self._closed = threading.Condition(self._lock)
+        self._open_locks = {}
+        self._reaper = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reopens = 0
+
+    @contextmanager
+    def lease(self, user_id: int):
+        """
+        The user's open store, kept open until the block exits. Keep leases
+        short and don't nest them for one user.
+        """
+        entry = self._acquire(user_id)
+        try:
+            yield entry.vectorstore
+        finally:
+            self._release(entry)
+
+    def _acquire(self, user_id: int) -> _PooledStore:
+        self._start_reaper()
+        version = get_corpus_version(user_id)
+        with self._lock:
+            entry = self._stores.get(user_id)
+            if entry is not None and entry.version == version:
+                self._stores.move_to_end(user_id)
+                entry.last_used = time.monotonic()
+                entry.holders += 1
+                self.hits += 1
+                return entry
+            open_lock = self._open_locks.setdefault(user_id, threading.Lock())
+
+        # Creating a store takes the user's write lock, which always comes
+        # before the open lock (compaction holds it while in closed())
+        _create_quantized_store(user_id)
+        # Open outside the pool lock so one slow disk open doesn't stall other users
+        with open_lock:
+            with self._lock:
+                entry = self._stores.get(user_id)
+                if entry is not None and entry.version == version:
+                    entry.holders += 1
+                    self.hits += 1
+                    return entry
+                retired = []
+                if entry is not None:
+                    # Written by another worker since we opened it
+                    retired = self._retire_locked([self._stores.pop(user_id)])
+                    self.reopens += 1
+            self._close_all(retired)
+            entry = self._open(user_id, version)
+            with self._lock:
+                self.misses += 1
+                entry.holders = 1
+                self._stores[user_id] = entry
+                evicted = self._evict_over_budget_locked()
+        self._close_all(evicted)
+        return entry
+
+    def _release(self, entry: _PooledStore):
+        with self._lock:
+            entry.holders -= 1
+            close = entry.retired and entry.holders == 0
+        if close:
+            self._close(entry)
+
+    @contextmanager
+    def closed(self, user_id: int):
+        """
+        Retires the user's store, waits for its leases to be released, and
+        keeps it from reopening in this process until the block exits (for
+        swapping its directory). Other workers reopen on the version bump.
+        """
+        with self._lock:
+            open_lock = self._open_locks.setdefault(user_id, threading.Lock())
+        with open_lock:
+            with self._lock:
+                entry = self._stores.pop(user_id, None)
+                retired = self._retire_locked([entry] if entry is not None else [])
+            self._close_all(retired)
+            if entry is not None:
+                with self._lock:
+                    self._closed.wait_for(lambda: entry.closed)
+            yield
+
+    def note_write(self, user_id: int, previous: int, version: int):
+        """
+        Records that this process moved the user's corpus from `previous` to
+        `version` through its own open store, which therefore stays current.
+        If the store was already behind, it's left stale and reopened.
+        """
+        with self._lock:
+            entry = self._stores.get(user_id)
+            if entry is not None and entry.version == previous:
+                entry.version = version
+
+    def refresh_size(self, user_id: int):
+        """
+        Re-estimates a store's footprint after writes grew its index.
+        """
+        with self._lock:
+            entry = self._stores.get(user_id)
+            if entry is None:
+                return
+            entry.est_bytes = _estimate_bytes(entry.vectorstore, entry.persist_directory)
+            evicted = self._evict_over_budget_locked(keep=user_id)
+        self._close_all(evicted)
+
+    def close(self, user_id: int):
+        with self._lock:
+            entry = self._stores.pop(user_id, None)
+            retired = self._retire_locked([entry] if entry is not None else [])
+        self._close_all(retired)
+
+    def close_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [uid for uid, e in self._stores.items() if e.last_used < cutoff and not e.holders]
+            entries = [self._stores.pop(uid) for uid in idle]
+            self.evictions += len(entries)
+            retired = self._retire_locked(entries)
+        self._close_all(retired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_stores": len(self._stores),
+                "estimated_bytes": sum(e.est_bytes for e in self._stores.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reopens": self.reopens,
+                "leases": sum(e.holders for e in self._stores.values()),
+            }
+
+    def _open(self, user_id: int, version: int) -> _PooledStore:
+        # `version` was read before opening, so a write landing meanwhile
+        # only costs an extra reopen later
+        if VECTOR_BACKEND == "quantized":
+            persist_directory = get_quantized_store_path(user_id)
+            vectorstore = QuantizedStore(persist_directory, embed_query=embedding_function.embed_query)
+            return _PooledStore(vectorstore, persist_directory, _estimate_bytes(vectorstore, persist_directory),
+                                version)
+
+        persist_directory = get_vectorstore_path(user_id)
+        vectorstore = Chroma(
+            collection_name=f"user_{user_id}_docs",
+            embedding_function=embedding_function,
+            persist_directory=persist_directory
+        )
+        return _PooledStore(vectorstore, persist_directory, _estimate_bytes(vectorstore, persist_directory), version)
+
+    def _evict_over_budget_locked(self, keep=None):
+        evicted = []
+        total = sum(e.est_bytes for e in self._stores.values())
+        for uid in list(self._stores):
+            if len(self._stores) <= self.max_stores and total <= self.max_bytes:
+                break
+            if uid == keep or len(self._stores) == 1:
+                continue
+            entry = self._stores.pop(uid)
+            total -= entry.est_bytes
+            evicted.append(entry)
+        self.evictions += len(evicted)
+        return self._retire_locked(evicted)
+
+    def _retire_locked(self, entries) -> list:
+        """
+        Marks stores that left the pool as retired. Returns the ones nobody
+        holds, to be closed now (outside the lock); the rest close on their
+        last release.
+        """
+        for entry in entries:
+            entry.retired = True
+            # A reopen of the same path must get a fresh chromadb System,
+            # not this one (which is stopped when the entry closes)
+            if entry.system is not None:
+                _forget_system(entry.persist_directory, entry.system)
+        return [entry for entry in entries if entry.holders == 0]
+
+    def _close_all(self, entries):
+        for entry in entries:
+            self._close(entry)
+
+    def _close(self, entry: _PooledStore):
+        with self._lock:
+            if entry.closing:
+                return
+            entry.closing = True
+        try:
+            if isinstance(entry.vectorstore, QuantizedStore):
+                entry.vectorstore.close()
+            else:
+                _stop_system(entry.system)
+        finally:
+            with self._lock:
+                entry.closed = True
+                self._closed.notify_all()
+
+    def _start_reaper(self):
+        if self._reaper is not None or self.idle_timeout <= 0:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+
+            def reap():
+                while True:
+                    time.sleep(min(60.0, self.idle_timeout))
+                    self.close_idle()
+
+            self._reaper = threading.Thread(target=reap, name="vectorstore-reaper", daemon=True)
+            self._reaper.start()
+
+
+store_pool = VectorStorePool()
+
+# Serializes writes (ingest, delete, compaction) to one user's store, across
+# threads and worker processes
+user_write_lock = locks.user_write_lock
+
+# Bumped whenever a user's document set changes; derived caches key on it and
+# pooled stores reopen when it moves. Kept in a file next to the store so
+# every worker sees the same value, and so it never repeats across restarts
+# (cached answers may outlive the process).
+def _corpus_version_path(user_id: int) -> str:
+    return str(DATA_DIR / str(user_id) / "corpus_version")
+
+def get_corpus_version(user_id: int) -> int:
+    try:
+        with open(_corpus_version_path(user_id)) as f:
+            return int(f.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_corpus_version(user_id: int) -> int:
+    path = _corpus_version_path(user_id)
+    with user_write_lock(user_id):
+        previous = get_corpus_version(user_id)
+        version = previous + 1
+        with open(path + ".tmp", "w") as f:
+            f.write(str(version))
+        os.replace(path + ".tmp", path)
+    store_pool.note_write(user_id, previous, version)
+    return version
+
+def warm_up(user_id: int):
+    """
+    Opens the user's store ahead of their first /chat (called on login).
+    """
+    if os.path.exists(get_store_path(user_id)):
+        with store_pool.lease(user_id):
+            pass
+
 def add_documents_to_chroma(user_id: int, chunks: list):
     """
     Adds documents to the user's dedicated ChromaDB collection.
     """
-    persist_directory = get_vectorstore_path(user_id)
-    
-    # Initialize Chroma vector store with persistence
-    # We use LangChain's Chroma wrapper for easy integration
-    vectorstore = Chroma(
-        collection_name=f"user_{user_id}_docs",
-        embedding_function=embedding_function,
-        persist_directory=persist_directory
-    )
-    
-    vectorstore.add_documents(chunks)
-    vectorstore.add_documents(chunks)
+    if not chunks:
+        return
+
+    # Embed once, up front, then write vectors in bulk so Chroma never calls
+    # the embedding function itself.
+    texts = [doc.page_content for doc in chunks]
+    embeddings = embedding_function.embed_documents(texts)
+    ids = [doc.metadata.get("chunk_id") or str(uuid.uuid4()) for doc in chunks]
+    metadatas = [doc.metadata for doc in chunks]
+
+    with user_write_lock(user_id), metrics.span("chroma_write", chunks=len(ids)), \
+            store_pool.lease(user_id) as store:
+        if isinstance(store, QuantizedStore):
+            store.upsert(ids, embeddings, metadatas, texts)
+        else:
+            collection = store._collection
+            max_batch = collection._client.get_max_batch_size()
+            for i in range(0, len(ids), max_batch):
+                collection.upsert(
+                    ids=ids[i:i + max_batch],
+                    embeddings=embeddings[i:i + max_batch],
+                    metadatas=metadatas[i:i + max_batch],
+                    documents=texts[i:i + max_batch],
+                )
+    store_pool.refresh_size(user_id)
+    bump_corpus_version(user_id)
+    metrics.CHUNKS.inc(len(ids), op="upsert")
     # vectorstore.persist() # Deprecated in langchain-chroma (auto-persists)
-    # print(f"Added {len(chunks)} chunks to ChromaDB for user {user_id} at {persist_directory}")
 
-def get_vectorstore(user_id: int):
+def delete_chunks(user_id: int, chunk_ids: list):
+    """
+    Removes chunks from the user's collection by id.
+    """
+    if not chunk_ids:
+        return
+    with user_write_lock(user_id), store_pool.lease(user_id) as store:
+        if isinstance(store, QuantizedStore):
+            store.delete(chunk_ids)
+        else:
+            collection = store._collection
+            max_batch = collection._client.get_max_batch_size()
+            for i in range(0, len(chunk_ids), max_batch):
+                collection.delete(ids=chunk_ids[i:i + max_batch])
+        _record_deletions(user_id, len(chunk_ids))
+    bump_corpus_version(user_id)
+    metrics.CHUNKS.inc(len(chunk_ids), op="delete")
+
+def delete_document(user_id: int, document_name: str) -> int:
+    """
+    Drops every chunk of one document from the user's collection, matched by
+    metadata so chunks missing from the manifest are removed as well.
+    """
+    with user_write_lock(user_id), store_pool.lease(user_id) as store:
+        if isinstance(store, QuantizedStore):
+            deleted = store.delete_document(document_name)
+        else:
+            collection = store._collection
+            ids = collection.get(where={"document_name": document_name}, include=[])["ids"]
+            max_batch = collection._client.get_max_batch_size()
+            for i in range(0, len(ids), max_batch):
+                collection.delete(ids=ids[i:i + max_batch])
+            deleted = len(ids)
+        _record_deletions(user_id, deleted)
+    bump_corpus_version(user_id)
+    metrics.CHUNKS.inc(deleted, op="delete")
+    return deleted
+
+# Deleted vectors stay in Chroma's HNSW files until the collection is rebuilt;
+# the running count is kept next to the store so it survives restarts.
+def _compaction_state_path(user_id: int) -> str:
+    return str(DATA_DIR / str(user_id) / "compaction.json")
+
+def _deleted_since_compaction(user_id: int) -> int:
+    try:
+        with open(_compaction_state_path(user_id)) as f:
+            return json.load(f).get("deleted", 0)
+    except (OSError, ValueError):
+        return 0
+
+def _record_deletions(user_id: int, count: int, reset: bool = False):
+    deleted = 0 if reset else _deleted_since_compaction(user_id) + count
+    with open(_compaction_state_path(user_id), "w") as f:
+        json.dump({"deleted": deleted}, f)
+
+def compaction_due(user_id: int) -> bool:
+    deleted = _deleted_since_compaction(user_id)
+    if deleted < COMPACTION_MIN_DELETED:
+        return False
+    with store_pool.lease(user_id) as store:
+        live = store.count() if isinstance(store, QuantizedStore) else store._collection.count()
+    return deleted / (deleted + live) >= COMPACTION_THRESHOLD
+
+def compact(user_id: int, force: bool = False) -> bool:
+    """
+    Rebuilds the user's collection from its live vectors into a fresh
+    directory and swaps it in, reclaiming HNSW/SQLite space held by deletes.
+    Writers are blocked for the duration; readers reopen the new store.
     """
-    Returns the ready-to-use vectorstore for retrieval.
+    with user_write_lock(user_id):
+        if not force and not compaction_due(user_id):
+            return False
+        if VECTOR_BACKEND == "quantized":
+            _compact_quantized(user_id)
+            return True
+
+        persist_directory = get_vectorstore_path(user_id)
+        collection_name = f"user_{user_id}_docs"
+        with store_pool.lease(user_id) as store:
+            source = store._collection
+            metadata = source.metadata
+            data = source.get(include=["embeddings", "metadatas", "documents"])
+
+        rebuilt_directory = persist_directory + ".compact"
+        shutil.rmtree(rebuilt_directory, ignore_errors=True)
+        client = chromadb.PersistentClient(path=rebuilt_directory)
+        target = client.get_or_create_collection(collection_name, metadata=metadata)
+        max_batch = client.get_max_batch_size()
+        for i in range(0, len(data["ids"]), max_batch):
+            target.upsert(
+                ids=data["ids"][i:i + max_batch],
+                embeddings=data["embeddings"][i:i + max_batch],
+                metadatas=data["metadatas"][i:i + max_batch],
+                documents=data["documents"][i:i + max_batch],
+            )
+        del target, client
+        _release_client(rebuilt_directory)
+
+        _swap_in(user_id, persist_directory, rebuilt_directory)
+    return True
+
+def _swap_in(user_id: int, persist_directory: str, rebuilt_directory: str):
+    # This process's searches on the old store finish before its directory
+    # moves; other workers still hold it open and reopen on the version bump
+    retired_directory = persist_directory + ".old"
+    # Left behind by a compaction that crashed mid-swap; rename won't replace it
+    shutil.rmtree(retired_directory, ignore_errors=True)
+    with store_pool.closed(user_id):
+        os.rename(persist_directory, retired_directory)
+        os.rename(rebuilt_directory, persist_directory)
+    shutil.rmtree(retired_directory, ignore_errors=True)
+    _record_deletions(user_id, 0, reset=True)
+    bump_corpus_version(user_id)
+
+def _compact_quantized(user_id: int):
+    persist_directory = get_quantized_store_path(user_id)
+    rebuilt_directory = persist_directory + ".compact"
+    shutil.rmtree(rebuilt_directory, ignore_errors=True)
+    with store_pool.lease(user_id) as store:
+        store.copy_live_to(rebuilt_directory)
+    _swap_in(user_id, persist_directory, rebuilt_directory)
+
+def _create_quantized_store(user_id: int):
+    """
+    Creates the user's quantized store on first use, importing any Chroma
+    vectors they have, so the pool only ever opens an existing one.
+    """
+    persist_directory = get_quantized_store_path(user_id)
+    if VECTOR_BACKEND != "quantized" or os.path.exists(persist_directory):
+        return
+    with user_write_lock(user_id):
+        if os.path.exists(persist_directory):
+            return
+        # Built aside and renamed in, so a store that exists is complete
+        building_directory = persist_directory + ".import"
+        shutil.rmtree(building_directory, ignore_errors=True)
+        store = QuantizedStore(building_directory)
+        try:
+            _import_from_chroma(user_id, store)
+        finally:
+            store.close()
+        os.rename(building_directory, persist_directory)
+
+def _import_from_chroma(user_id: int, store: QuantizedStore, batch: int = 1000) -> int:
+    """
+    Copies a user's existing Chroma vectors into a new quantized store, so
+    switching VECTOR_BACKEND doesn't require re-uploading (or re-embedding).
     """
     persist_directory = get_vectorstore_path(user_id)
-    return Chroma(
-        collection_name=f"user_{user_id}_docs",
-        embedding_function=embedding_function,
-        persist_directory=persist_directory
-    )
+    if not os.path.exists(persist_directory):
+        return 0
+    client = chromadb.PersistentClient(path=persist_directory)
+    try:
+        collection = client.get_collection(f"user_{user_id}_docs")
+    except Exception:
+        _release_client(persist_directory)
+        return 0
+    copied = 0
+    while True:
+        data = collection.get(include=["embeddings", "metadatas", "documents"], limit=batch, offset=copied)
+        if not data["ids"]:
+            break
+        store.upsert(data["ids"], data["embeddings"], data["metadatas"], data["documents"])
+        copied += len(data["ids"])
+    del collection, client
+    _release_client(persist_directory)
+    return copied
+
+def get_embeddings(user_id: int, chunk_ids: list) -> dict:
+    """
+    Stored vectors for the given chunk ids (ids not in the store are absent).
+    """
+    if not chunk_ids:
+        return {}
+    with store_pool.lease(user_id) as store:
+        if isinstance(store, QuantizedStore):
+            return store.get_embeddings(chunk_ids)
+        data = store._collection.get(ids=list(chunk_ids), include=["embeddings"])
+    return dict(zip(data["ids"], data["embeddings"]))
+
+def get_vectorstore(user_id: int):
+    """
+    Leases the ready-to-use vectorstore for retrieval (a Chroma collection or
+    a QuantizedStore, both with similarity_search(query, k, filter)); use as
+    `with get_vectorstore(user_id) as vectorstore:`. Served from the
+    process-wide pool, so an active user's store is opened once.
+    """
+    return store_pool.lease(user_id)
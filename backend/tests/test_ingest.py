@@ -0,0 +1,20 @@
+from app import ingest
+
+
+def test_table_text_does_not_depend_on_slice_size(tmp_path, monkeypatch):
+    # "count" is all integers until a float (and a blank) far down the file;
+    # a per-slice dtype would render the early rows as "1" and the late ones as "1.0"
+    path = tmp_path / "table.csv"
+    lines = ["name,count,score"]
+    lines += [f"row{i},{i},{i % 3}" for i in range(40)]
+    lines += ["late,1.5,", ",,"]
+    path.write_text("\n".join(lines) + "\n")
+    monkeypatch.setattr(ingest, "TABLE_BLOCK_TOKENS", 0)
+
+    monkeypatch.setattr(ingest, "TABLE_READ_CHUNK_ROWS", 7)
+    sliced = list(ingest._table_blocks(ingest._read_table(str(path), ".csv")))
+    monkeypatch.setattr(ingest, "TABLE_READ_CHUNK_ROWS", 10_000)
+    whole = list(ingest._table_blocks(ingest._read_table(str(path), ".csv")))
+
+    assert sliced == whole
+    assert "count: 1.0 |" in sliced[0][0]
@@ -0,0 +1,24 @@
+import numpy as np
+
+from app.quantized_store import QuantizedStore
+
+
+def test_repeated_id_in_one_batch_keeps_the_last_write(tmp_path):
+    store = QuantizedStore(str(tmp_path / "store"))
+    try:
+        store.upsert(
+            ["a", "b", "a"],
+            [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+            [{"document_name": "first"}, {"document_name": "doc"}, {"document_name": "last"}],
+            ["first a", "b", "last a"],
+        )
+
+        assert store.count() == 2
+        assert store.dead_count() == 0
+        np.testing.assert_allclose(store.get_embeddings(["a"])["a"], [0.0, 0.0, 1.0], atol=1e-6)
+
+        hits = store.search_by_vector([0.0, 0.0, 1.0], k=2)
+        assert [doc.page_content for doc, _ in hits] == ["last a", "b"]
+        assert hits[0][0].metadata["document_name"] == "last"
+    finally:
+        store.close()
@@ -0,0 +1,49 @@
+import re
+
+import pytest
+import tiktoken
+
+from app.splitter import TokenSplitter
+
+
+PATTERN = r""" ?\w+| ?[^\s\w]+|\s+(?!\S)|\s+"""
+
+
+def word_encoding(texts):
+    """
+    A small offline BPE in which every space-prefixed word of texts is a
+    single token, like most words under cl100k_base.
+    """
+    ranks = {bytes([b]): b for b in range(256)}
+    pieces = {piece.encode() for text in texts for piece in re.findall(PATTERN, text)}
+    prefixes = sorted({piece[:n] for piece in pieces for n in range(2, len(piece) + 1)}, key=len)
+    for prefix in prefixes:
+        ranks.setdefault(prefix, len(ranks))
+    return tiktoken.Encoding(
+        name="test_words",
+        pat_str=PATTERN,
+        mergeable_ranks=ranks,
+        special_tokens={},
+    )
+
+
+def words(text):
+    return set(text.split())
+
+
+NUMBERED = " ".join(f"w{i}" for i in range(1000))
+# Sentences ending in a URL longer than the overlap, so the overlap holds
+# no whitespace before the ". " the chunk was cut on
+URLS = "".join(
+    f"word{i} at https://example.com/{'/'.join(['x'] * 60)}/{i}. " for i in range(100)
+)
+
+
+@pytest.mark.parametrize("text", [NUMBERED, URLS], ids=["numbered", "urls"])
+@pytest.mark.parametrize("overlap", [0, 80])
+def test_every_word_lands_in_a_chunk(text, overlap):
+    splitter = TokenSplitter(400, overlap, encoding=word_encoding([text]))
+    chunks = splitter.split_text(text)
+
+    assert len(chunks) > 1
+    assert words(text) <= set().union(*map(words, chunks))
@@ -7,6 +7,8 @@ const ChatInterface = () => {
     const [chatHistory, setChatHistory] = useState([]);
     const [isUploading, setIsUploading] = useState(false);
     const [error, setError] = useState('');
+    // Files the next question is restricted to (empty = all files)
+    const [selected, setSelected] = useState([]);
     const bottomRef = useRef(null);
 
     useEffect(() => {
@@ -22,11 +24,23 @@ const ChatInterface = () => {
         try {
             const response = await api.get('/files');
             setFiles(response.data.files);
+            const names = new Set(response.data.files.map(f => f.document_name));
+            setSelected(prev => prev.filter(name => names.has(name)));
         } catch (err) {
             console.error("Failed to fetch files", err);
         }
     };
 
+    const waitForJob = async (jobId) => {
+        while (true) {
+            const response = await api.get(`/jobs/${jobId}`);
+            if (response.data.status === 'succeeded' || response.data.status === 'failed') {
+                return response.data;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    };
+
     const handleUpload = async (e) => {
         const file = e.target.files[0];
         if (!file) return;
@@ -40,11 +54,16 @@ const ChatInterface = () => {
         formData.append('file', file);
 
         try {
-            await api.post('/upload', formData, {
+            const response = await api.post('/upload', formData, {
                 headers: {
                     'Content-Type': 'multipart/form-data',
                 },
             });
+            // Ingestion runs in the background; poll the job until it settles
+            const job = await waitForJob(response.data.job_id);
+            if (job.status === 'failed') {
+                setError(job.error || 'Processing failed');
+            }
             setIsUploading(false);
             fetchFiles(); // Refresh list
         } catch (err) {
@@ -54,6 +73,21 @@ const ChatInterface = () => {
         }
     };
 
+    const handleDelete = async (filename) => {
+        setError('');
+        try {
+            await api.delete(`/files/${encodeURIComponent(filename)}`);
+            fetchFiles();
+        } catch (err) {
+            console.error("Delete failed", err);
+            setError(err.response?.data?.detail || 'Delete failed');
+        }
+    };
+
+    const toggleSelected = (filename) => {
+        setSelected(prev => prev.includes(filename) ? prev.filter(n => n !== filename) : [...prev, filename]);
+    };
+
     const handleSendMessage = async (e) => {
         e.preventDefault();
         if (!message.trim()) return;
@@ -63,21 +97,58 @@ const ChatInterface = () => {
         setMessage('');
 
         try {
-            const response = await api.post('/chat', { question: userMsg.content });
-            const rawAnswer = response.data.answer;
+            // Stream tokens as they arrive (SSE over fetch; axios can't read a streaming body)
+            const response = await fetch(`${api.defaults.baseURL}/chat/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Authorization': `Bearer ${localStorage.getItem('token')}`,
+                },
+                body: JSON.stringify({
+                    question: userMsg.content,
+                    documents: selected.length ? selected.map(name => ({ document_name: name })) : null,
+                }),
+            });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
 
-            // Critical Parsing Logic: Split Answer and Sources
-            const parts = rawAnswer.split('Sources:');
-            const answerText = parts[0].replace('Answer:', '').trim();
-            const sourcesText = parts.length > 1 ? parts[1].trim() : '';
+            setChatHistory(prev => [...prev, { role: 'assistant', content: '', sources: '', pending: true }]);
+            const updateBotMsg = (fields) => setChatHistory(prev => [
+                ...prev.slice(0, -1),
+                { ...prev[prev.length - 1], ...fields },
+            ]);
 
-            const botMsg = {
-                role: 'assistant',
-                content: answerText,
-                sources: sourcesText
-            };
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let rawAnswer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const block of events) {
+                    const eventName = block.match(/^event: (.*)$/m)?.[1];
+                    const dataLine = block.match(/^data: (.*)$/m)?.[1];
+                    if (!eventName || dataLine === undefined) continue;
+                    const data = JSON.parse(dataLine);
 
-            setChatHistory(prev => [...prev, botMsg]);
+                    if (eventName === 'token') {
+                        rawAnswer += data;
+                        // Critical Parsing Logic: Split Answer and Sources
+                        const parts = rawAnswer.split('Sources:');
+                        updateBotMsg({
+                            content: parts[0].replace('Answer:', '').trim(),
+                            sources: parts.length > 1 ? parts[1].trim() : '',
+                        });
+                    } else if (eventName === 'error') {
+                        updateBotMsg({ content: data, isError: true });
+                    }
+                }
+            }
+            updateBotMsg({ pending: false });
         } catch (err) {
             console.error("Chat failed", err);
             const botMsg = {
@@ -85,7 +156,10 @@ const ChatInterface = () => {
                 content: "Sorry, I had trouble connecting to the server.",
                 isError: true
             };
-            setChatHistory(prev => [...prev, botMsg]);
+            // Replace the streaming placeholder if one was already added
+            setChatHistory(prev => prev[prev.length - 1]?.pending
+                ? [...prev.slice(0, -1), botMsg]
+                : [...prev, botMsg]);
         }
     };
 
@@ -143,9 +217,15 @@ const ChatInterface = () => {
                     <h3 style={{ fontSize: '0.9rem', textTransform: 'uppercase', letterSpacing: '0.05em', color: 'var(--text-secondary)', marginBottom: '12px' }}>
                         Your Files ({files.length})
                     </h3>
+                    {selected.length > 0 && (
+                        <small style={{ color: 'var(--text-secondary)', display: 'block', marginBottom: '8px' }}>
+                            Searching {selected.length} selected file{selected.length > 1 ? 's' : ''} ·{' '}
+                            <a href="#" onClick={(e) => { e.preventDefault(); setSelected([]); }}>all files</a>
+                        </small>
+                    )}
                     <ul style={{ listStyle: 'none', padding: 0 }}>
-                        {files.map((file, index) => (
-                            <li key={index} style={{
+                        {files.map((file) => (
+                            <li key={file.document_name} style={{
                                 padding: '10px 12px',
                                 borderBottom: '1px solid var(--border-color)',
                                 fontSize: '0.95rem',
@@ -154,7 +234,21 @@ const ChatInterface = () => {
                                 alignItems: 'center',
                                 gap: '8px'
                             }}>
-                                <span style={{ opacity: 0.7 }}>📄</span> {file}
+                                <input
+                                    type="checkbox"
+                                    checked={selected.includes(file.document_name)}
+                                    onChange={() => toggleSelected(file.document_name)}
+                                    title="Only search this file"
+                                />
+                                <span style={{ opacity: 0.7 }}>📄</span> {file.document_name}
+                                {file.status !== 'ready' && <span style={{ fontSize: '0.8rem', color: 'var(--text-secondary)' }}>({file.status})</span>}
+                                <button
+                                    onClick={() => handleDelete(file.document_name)}
+                                    title="Delete file"
+                                    style={{ marginLeft: 'auto', background: 'transparent', border: 'none', color: 'var(--text-secondary)', cursor: 'pointer' }}
+                                >
+                                    ✕
+                                </button>
                             </li>
                         ))}
                         {files.length === 0 && <li style={{ color: 'var(--text-secondary)', fontStyle: 'italic', padding: '10px 0' }}>No files uploaded.</li>}
@@ -0,0 +1,118 @@
+"""
+Chunking benchmark: the legacy character splitter (chunk_size=400 characters)
+against the token-aware splitter, on the pages and row blocks that ingestion
+actually produces for a synthetic TXT, CSV and PDF.
+
+    python scripts/bench_chunking.py --corpus large --repeat 3 --output bench_chunking.json
+
+For each splitter reports chunks produced, tiktoken tokens per chunk
+(mean/p50/p95/max and the share over the target) and splitting throughput.
+"naive" is LangChain's from_tiktoken_encoder splitter, which re-tokenizes
+every candidate split, for reference.
+
+Needs the cl100k_base encoding: run once with network access or point
+TIKTOKEN_CACHE_DIR at a cache that has it. Exits 1 if the token splitter
+produces a chunk more than a couple of tokens over the target (re-encoding a
+stripped chunk on its own can merge tokens slightly differently).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+def load_pages(size: str, seed: int):
+    from bench_e2e import build_corpus
+    from app import ingest
+
+    with tempfile.TemporaryDirectory(prefix="documind-chunk-") as directory:
+        pages = []
+        for path in build_corpus(directory, size, seed):
+            pages.extend(doc.page_content for doc in ingest.iter_documents(path, os.path.basename(path), 1))
+    return pages
+
+
+def measure(name: str, splitter, pages, encoding, target: int, repeat: int):
+    from bench_e2e import percentiles
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [chunk for texts in splitter.split_texts(pages) for chunk in texts]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    counts = [len(ids) for ids in encoding.encode_ordinary_batch(chunks)]
+    megabytes = sum(len(p.encode("utf-8")) for p in pages) / (1024 * 1024)
+    return {
+        "splitter": name,
+        "chunks": len(chunks),
+        "tokens_per_chunk": percentiles(counts),
+        "over_target": sum(1 for c in counts if c > target),
+        "total_chunk_tokens": sum(counts),
+        "seconds": round(best, 4),
+        "pages_per_second": round(len(pages) / best, 1),
+        "mb_per_second": round(megabytes / best, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", choices=("small", "medium", "large"), default="large")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N timings")
+    parser.add_argument("--skip-naive", action="store_true", help="skip the slow re-tokenizing splitter")
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args()
+
+    from app import ingest, tokens
+    from app.splitter import CharacterSplitter, TokenSplitter
+
+    encoding = tokens.get_encoding()
+    if encoding is None:
+        print(f"tiktoken could not load {tokens.ENCODING_NAME}; needs network or TIKTOKEN_CACHE_DIR")
+        sys.exit(2)
+
+    target, overlap = ingest.CHUNK_TOKENS, ingest.CHUNK_OVERLAP_TOKENS
+    pages = load_pages(args.corpus, args.seed)
+    page_tokens = sum(len(ids) for ids in encoding.encode_ordinary_batch(pages))
+    print(f"{len(pages)} pages/row blocks, {page_tokens} tokens; target {target} tokens, overlap {overlap}")
+
+    splitters = [
+        ("legacy_char", CharacterSplitter(ingest.TEXT_SPLITTER)),
+        ("token", TokenSplitter(target, overlap, encoding=encoding)),
+    ]
+    if not args.skip_naive:
+        splitters.append(("naive_tiktoken", CharacterSplitter(
+            ingest.RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                encoding_name=tokens.ENCODING_NAME, chunk_size=target, chunk_overlap=overlap))))
+
+    results = []
+    for name, splitter in splitters:
+        result = measure(name, splitter, pages, encoding, target, args.repeat)
+        results.append(result)
+        t = result["tokens_per_chunk"]
+        print(f"{name:<15} {result['chunks']:>6} chunks  tokens/chunk mean {t['mean']:6.1f} p50 {t['p50']:6.1f} "
+              f"p95 {t['p95']:6.1f} max {t['max']:6.1f}  over target {result['over_target']:>4}  "
+              f"{result['seconds']:7.3f}s  {result['mb_per_second']:6.2f} MB/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "chunking", "corpus": args.corpus, "pages": len(pages),
+                       "page_tokens": page_tokens, "target_tokens": target, "overlap_tokens": overlap,
+                       "results": results}, f, indent=2)
+
+    token_result = next(r for r in results if r["splitter"] == "token")
+    if token_result["tokens_per_chunk"]["max"] > target + 2:
+        print(f"REGRESSION: token splitter produced chunks of up to "
+              f"{token_result['tokens_per_chunk']['max']:.0f} tokens (target {target})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
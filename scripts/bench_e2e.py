@@ -0,0 +1,456 @@
+"""
+Offline end-to-end benchmark: upload -> ingest -> chat against the FastAPI
+app in-process, with deterministic local stand-ins for the embedding API and
+the chat model, so no OpenAI key or network is needed.
+
+    python scripts/bench_e2e.py --users 8 --corpus medium --queries 20 --output bench_e2e.json
+
+Each user uploads a synthetic TXT, CSV and PDF, then all users chat at once
+through /chat/stream. Reports per-stage ingest timings (extract, chunk,
+embed, store), retrieve/generate split, p50/p95/p99 latencies, throughput
+and peak RSS, and writes everything to JSON for tracking over time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+CORPUS_SIZES = {
+    # (txt paragraphs, csv rows, pdf pages)
+    "small": (20, 500, 8),
+    "medium": (100, 2500, 40),
+    "large": (400, 10000, 160),
+}
+
+TOPICS = "revenue forecast quarter margin pipeline invoice contract region churn warranty supplier audit".split()
+
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(TOPICS) for _ in range(rng.randint(8, 16))]
+    if rng.random() < 0.3:
+        words.append(f"PN-{rng.randint(1000, 9999)}-{rng.choice('ABC')}")
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(4, 8)))
+
+
+def write_txt(path: str, paragraphs: int, rng: random.Random):
+    with open(path, "w") as f:
+        f.write("\n\n".join(_paragraph(rng) for _ in range(paragraphs)))
+
+
+def write_csv(path: str, rows: int, rng: random.Random):
+    with open(path, "w") as f:
+        f.write("id,part,region,quarter,amount,notes\n")
+        for i in range(rows):
+            f.write(f"{i},PN-{rng.randint(1000, 9999)}-{rng.choice('ABC')},{rng.choice(TOPICS)},"
+                    f"Q{rng.randint(1, 4)},{rng.uniform(10, 5000):.2f},{rng.choice(TOPICS)} {rng.choice(TOPICS)}\n")
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: int, rng: random.Random):
+    """
+    Minimal text-only PDF (Helvetica, ~40 lines per page), enough for
+    pdfplumber to extract without pulling in a PDF writer dependency.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        words = _paragraph(rng).split() + _paragraph(rng).split() + _paragraph(rng).split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)][:40]
+        stream = "BT /F1 10 Tf 50 750 Td 14 TL\n" + "".join(f"({_pdf_escape(l)}) Tj T*\n" for l in lines) + "ET"
+        stream = stream.encode("latin-1")
+        content_id = len(objects) + 2
+        kids.append(len(objects) + 1)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def build_corpus(directory: str, size: str, seed: int) -> List[str]:
+    """
+    One TXT, CSV and PDF per user. Seeded per user so the shared embedding
+    cache doesn't turn every user after the first into cache hits.
+    """
+    paragraphs, rows, pages = CORPUS_SIZES[size]
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, name) for name in ("notes.txt", "ledger.csv", "report.pdf")]
+    write_txt(paths[0], paragraphs, rng)
+    write_csv(paths[1], rows, rng)
+    write_pdf(paths[2], pages, rng)
+    return paths
+
+
+def questions_for(seed: int, n: int) -> List[str]:
+    rng = random.Random(seed)
+    templates = [
+        "What does the report say about {a} and {b}?",
+        "Summarize the {a} figures for each {b}.",
+        "Which rows mention PN-{n}-{c}?",
+        "How did {a} change by quarter?",
+    ]
+    return [rng.choice(templates).format(a=rng.choice(TOPICS), b=rng.choice(TOPICS),
+                                         n=rng.randint(1000, 9999), c=rng.choice("ABC"))
+            for _ in range(n)]
+
+
+# ---------------------------------------------------------------------------
+# Local stand-ins for the embedding API and chat model
+# ---------------------------------------------------------------------------
+
+def make_fake_embeddings(latency_ms: float, per_input_ms: float, dim: int):
+    from langchain_core.embeddings import Embeddings
+    from fake_embedding_server import fake_vector
+
+    class FakeEmbeddings(Embeddings):
+        """
+        Deterministic per-text vectors after a simulated round trip; tracks
+        the time spent so the ingest "embed" stage can be split from "store".
+        """
+
+        def __init__(self):
+            self.seconds = 0.0
+            self.inputs = 0
+            self._lock = threading.Lock()
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            start = time.perf_counter()
+            time.sleep((latency_ms + per_input_ms * len(texts)) / 1000)
+            vectors = [fake_vector(t, dim).tolist() for t in texts]
+            with self._lock:
+                self.seconds += time.perf_counter() - start
+                self.inputs += len(texts)
+            return vectors
+
+        def embed_query(self, text: str) -> List[float]:
+            return self.embed_documents([text])[0]
+
+    return FakeEmbeddings()
+
+
+def make_fake_llm(ttft_ms: float, token_ms: float, answer_tokens: int):
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    def answer_tokens_for(messages) -> List[str]:
+        # Cite whatever sources made it into the prompt, like the real prompt asks for
+        prompt = messages[-1].content if messages else ""
+        sources = [line.split("Source: ", 1)[1] for line in prompt.splitlines() if line.startswith("Source: ")]
+        words = ["Answer:"] + [TOPICS[i % len(TOPICS)] for i in range(answer_tokens)]
+        words += ["\nSources:"] + [f"\n - File: {s}" for s in dict.fromkeys(sources)]
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    class FakeChatModel(BaseChatModel):
+        """
+        Emits a deterministic answer after ttft_ms, then one token every token_ms.
+        """
+
+        @property
+        def _llm_type(self) -> str:
+            return "bench-fake"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            tokens = answer_tokens_for(messages)
+            time.sleep((ttft_ms + token_ms * len(tokens)) / 1000)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            tokens = answer_tokens_for(messages)
+            await asyncio.sleep((ttft_ms + token_ms * len(tokens)) / 1000)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+            await asyncio.sleep(ttft_ms / 1000)
+            for i, token in enumerate(answer_tokens_for(messages)):
+                if i:
+                    await asyncio.sleep(token_ms / 1000)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    return FakeChatModel()
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    arr = np.asarray(values, dtype=float)
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 2),
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def parse_sse(body: str) -> Iterator[Dict[str, Any]]:
+    for block in body.split("\n\n"):
+        event, data = None, None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        if event is not None:
+            yield {"event": event, "data": data}
+
+
+# ---------------------------------------------------------------------------
+# Benchmark phases
+# ---------------------------------------------------------------------------
+
+async def login(client, index: int) -> Dict[str, str]:
+    credentials = {"email": f"bench{index}@example.com", "password": "benchpassword"}
+    await client.post("/register", json=credentials)
+    response = await client.post("/token", json=credentials)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def ingest_user(client, headers, paths: List[str], poll_s: float) -> List[Dict[str, Any]]:
+    jobs = []
+    for path in paths:
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            response = await client.post("/upload", files={"file": (os.path.basename(path), f.read())}, headers=headers)
+        response.raise_for_status()
+        jobs.append((response.json()["job_id"], start))
+
+    results = []
+    for job_id, start in jobs:
+        while True:
+            job = (await client.get(f"/jobs/{job_id}", headers=headers)).json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            await asyncio.sleep(poll_s)
+        job["upload_to_ready_ms"] = (time.perf_counter() - start) * 1000
+        results.append(job)
+    return results
+
+
+async def chat_user(client, headers, questions: List[str]) -> List[Dict[str, Any]]:
+    results = []
+    for question in questions:
+        start = time.perf_counter()
+        response = await client.post("/chat/stream", json={"question": question}, headers=headers)
+        latency_ms = (time.perf_counter() - start) * 1000
+        events = list(parse_sse(response.text)) if response.status_code == 200 else []
+        metrics = next((e["data"] for e in events if e["event"] == "metrics"), None)
+        error = response.status_code != 200 or any(e["event"] == "error" for e in events)
+        results.append({"latency_ms": latency_ms, "metrics": metrics, "error": error})
+    return results
+
+
+async def run_benchmark(args, workdir: str) -> Dict[str, Any]:
+    import httpx
+    from app import main, auth, vector_store, lexical_index, locks, rag, jobs
+
+    # Keep every per-user store inside the scratch directory
+    data_dir = os.path.join(workdir, "data")
+    for module in (main, auth, vector_store, lexical_index, locks):
+        module.DATA_DIR = type(module.DATA_DIR)(data_dir)
+
+    embeddings = make_fake_embeddings(args.embed_latency_ms, args.embed_per_input_ms, args.dim)
+    vector_store.embedding_function.underlying = embeddings
+    llm = make_fake_llm(args.llm_ttft_ms, args.llm_token_ms, args.answer_tokens)
+    rag.LLM = llm
+    rag.RAG_CHAIN = rag.build_chain(llm)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            headers = await asyncio.gather(*(login(client, i) for i in range(args.users)))
+            corpora = [build_corpus(os.path.join(workdir, "corpus", str(i)), args.corpus, args.seed + i)
+                       for i in range(args.users)]
+
+            # Phase 1: every user uploads concurrently
+            start = time.perf_counter()
+            ingest_results = await asyncio.gather(*(
+                ingest_user(client, h, paths, args.poll_ms / 1000) for h, paths in zip(headers, corpora)
+            ))
+            ingest_wall = time.perf_counter() - start
+            embed_seconds, embed_inputs = embeddings.seconds, embeddings.inputs
+
+            # Phase 2: every user chats concurrently, one question at a time
+            start = time.perf_counter()
+            chat_results = await asyncio.gather(*(
+                chat_user(client, h, questions_for(args.seed + i, args.queries)) for i, h in enumerate(headers)
+            ))
+            chat_wall = time.perf_counter() - start
+
+    jobs.shutdown()
+    return summarize(args, ingest_results, ingest_wall, embed_seconds, embed_inputs, chat_results, chat_wall)
+
+
+def summarize(args, ingest_results, ingest_wall, embed_seconds, embed_inputs, chat_results, chat_wall) -> Dict[str, Any]:
+    all_jobs = [job for user_jobs in ingest_results for job in user_jobs]
+    stage_ms = {}
+    for stage in ("extract", "chunk", "index", "embed", "prune"):
+        stage_ms[stage] = round(sum(j["stages"].get(stage, {}).get("duration_ms", 0.0) for j in all_jobs), 2)
+    chunks = sum(j["chunks_processed"] for j in all_jobs)
+    # The job's "embed" stage is embedding + Chroma upsert; split it using the stand-in's own clock
+    embed_ms = round(embed_seconds * 1000, 2)
+    stages = {
+        "extract": stage_ms["extract"],
+        "chunk": stage_ms["chunk"],
+        "embed": embed_ms,
+        "store": round(max(stage_ms["embed"] - embed_ms, 0.0) + stage_ms["index"] + stage_ms["prune"], 2),
+    }
+
+    queries = [q for user_queries in chat_results for q in user_queries]
+    ok = [q for q in queries if not q["error"] and q["metrics"]]
+    retrieve = [q["metrics"]["retrieval_ms"] for q in ok if not q["metrics"].get("cached")]
+    generate = [q["metrics"]["total_ms"] - q["metrics"]["retrieval_ms"] for q in ok if not q["metrics"].get("cached")]
+    stages["retrieve"] = round(sum(retrieve), 2)
+    stages["generate"] = round(sum(generate), 2)
+
+    return {
+        "benchmark": "e2e",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users, "corpus": args.corpus, "queries_per_user": args.queries,
+            "embed_latency_ms": args.embed_latency_ms, "embed_per_input_ms": args.embed_per_input_ms,
+            "dim": args.dim, "llm_ttft_ms": args.llm_ttft_ms, "llm_token_ms": args.llm_token_ms,
+            "answer_tokens": args.answer_tokens, "seed": args.seed,
+        },
+        "ingest": {
+            "files": len(all_jobs),
+            "failed": sum(1 for j in all_jobs if j["status"] != "succeeded"),
+            "chunks": chunks,
+            "embedded_inputs": embed_inputs,
+            "wall_s": round(ingest_wall, 3),
+            "chunks_per_s": round(chunks / ingest_wall, 1) if ingest_wall else None,
+            "job_stage_ms": stage_ms,
+            "upload_to_ready_ms": percentiles([j["upload_to_ready_ms"] for j in all_jobs]),
+        },
+        "query": {
+            "requests": len(queries),
+            "errors": len(queries) - len(ok),
+            "cached": sum(1 for q in ok if q["metrics"].get("cached")),
+            "wall_s": round(chat_wall, 3),
+            "queries_per_s": round(len(queries) / chat_wall, 2) if chat_wall else None,
+            "latency_ms": percentiles([q["latency_ms"] for q in queries]),
+            "ttft_ms": percentiles([q["metrics"]["ttft_ms"] for q in ok if q["metrics"]["ttft_ms"] is not None]),
+            "retrieval_ms": percentiles(retrieve),
+            "generate_ms": percentiles(generate),
+        },
+        "stages_ms": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    ingest, query = result["ingest"], result["query"]
+    print(f"ingest: {ingest['files']} files, {ingest['chunks']} chunks in {ingest['wall_s']}s "
+          f"({ingest['chunks_per_s']} chunks/s, {ingest['failed']} failed)")
+    print("stages (ms, summed over users):")
+    for stage, ms in result["stages_ms"].items():
+        print(f"  {stage:<10} {ms:12.1f}")
+    print(f"query: {query['requests']} requests in {query['wall_s']}s ({query['queries_per_s']} q/s, "
+          f"{query['errors']} errors, {query['cached']} cached)")
+    for name in ("latency_ms", "ttft_ms", "retrieval_ms", "generate_ms"):
+        p = query[name]
+        print(f"  {name:<13} p50={p['p50']} p95={p['p95']} p99={p['p99']}")
+    print(f"peak RSS: {result['peak_rss_mb']['self']} MB (children {result['peak_rss_mb']['children']} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--corpus", choices=sorted(CORPUS_SIZES), default="small")
+    parser.add_argument("--queries", type=int, default=10, help="questions per user")
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    parser.add_argument("--embed-per-input-ms", type=float, default=0.2)
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=10.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--answer-cache", action="store_true", help="leave the answer cache on")
+    parser.add_argument("--poll-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON result here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="documind-bench-") as workdir:
+        # Must be set before the app modules are imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.db")
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+        if not args.answer_cache:
+            os.environ["ANSWER_CACHE_ENABLED"] = "false"
+
+        result = asyncio.run(run_benchmark(args, workdir))
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    # Guarded: PDF extraction workers are spawned and re-import this module
+    main()
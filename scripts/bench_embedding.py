@@ -0,0 +1,73 @@
+"""
+Offline throughput benchmark for the batched embedding pipeline.
+
+Starts scripts/fake_embedding_server.py in a subprocess and embeds a synthetic
+corpus with different concurrency settings, reporting chunks/sec.
+
+    python scripts/bench_embedding.py --chunks 2000 --latency-ms 150
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from app.embedder import BatchEmbedder  # noqa: E402
+
+PORT = 8101
+
+
+def start_server(args):
+    # Separate process so the fake server's JSON encoding doesn't share our GIL
+    server = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "scripts", "fake_embedding_server.py"),
+        "--port", str(PORT), "--latency-ms", str(args.latency_ms),
+        "--per-input-ms", str(args.per_input_ms), "--max-inflight", str(args.max_inflight),
+    ])
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/stats")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("fake embedding server did not start")
+
+
+def synthetic_chunks(n):
+    words = "revenue forecast quarter margin pipeline invoice contract region churn".split()
+    return [" ".join(words[(i + j) % len(words)] for j in range(60)) + f" #{i}" for i in range(n)]
+
+
+def run(label, embedder, texts):
+    start = time.perf_counter()
+    vectors = embedder.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(texts)
+    print(f"{label:<38} {len(texts) / elapsed:10.1f} chunks/s  {elapsed:7.2f}s  "
+          f"requests={embedder.requests} throttled={embedder.throttled} failures={embedder.failures}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--per-input-ms", type=float, default=0.5)
+    parser.add_argument("--max-inflight", type=int, default=6, help="fake server answers 429 above this")
+    args = parser.parse_args()
+
+    server = start_server(args)
+    base = f"http://127.0.0.1:{PORT}/v1"
+    texts = synthetic_chunks(args.chunks)
+
+    # Roughly what LangChain's OpenAIEmbeddings does: 1000 inputs per call, one at a time
+    run("serial, 1000/batch (baseline)", BatchEmbedder("fake", base, "x", concurrency=1, batch_tokens=10**9, batch_size=1000), texts)
+    for concurrency in (1, 4, 8, 16):
+        run(f"token-budgeted, concurrency={concurrency}", BatchEmbedder("fake", base, "x", concurrency=concurrency), texts)
+
+    server.terminate()
@@ -0,0 +1,98 @@
+"""
+Import-time guard for the backend: measures `import app.main` in fresh
+interpreters and fails if it gets slower than a budget or starts pulling in
+modules that are supposed to load lazily (LangChain/OpenAI, chromadb, pandas,
+pdfplumber).
+
+    python scripts/bench_import.py --runs 5 --max-ms 1500
+    python scripts/bench_import.py --top 15     # -X importtime breakdown
+
+Exit status is 1 on a regression, so it can run in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+
+# Must not be imported by `import app.main`; they load on first use or during warm-up
+LAZY_MODULES = ("pandas", "pdfplumber", "chromadb", "langchain_chroma", "langchain_openai",
+                "openai", "langchain_core", "tiktoken", "numpy")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "ms": elapsed * 1000,
+    "modules": len(sys.modules),
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def probe():
+    out = subprocess.check_output([sys.executable, "-c", PROBE], cwd=BACKEND)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def importtime_top(n):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            cwd=BACKEND, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    return rows[:n]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=1500.0, help="fail if the median import exceeds this")
+    parser.add_argument("--top", type=int, default=0, help="print the N slowest imports (cumulative)")
+    parser.add_argument("--output", help="write the JSON result here")
+    args = parser.parse_args()
+
+    probe()  # warm the bytecode cache so runs measure imports, not compilation
+    runs = [probe() for _ in range(args.runs)]
+    timings = [r["ms"] for r in runs]
+    loaded = sorted({m for r in runs for m in r["loaded"]})
+    result = {
+        "benchmark": "import",
+        "runs": args.runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "max_ms": round(max(timings), 1),
+        "modules": runs[-1]["modules"],
+        "lazy_modules_loaded": loaded,
+        "budget_ms": args.max_ms,
+    }
+
+    print(f"import app.main: median {result['median_ms']} ms (min {result['min_ms']}, max {result['max_ms']}) "
+          f"over {args.runs} runs, {result['modules']} modules")
+    if args.top:
+        for cumulative_us, self_us, name in importtime_top(args.top):
+            print(f"  {cumulative_us / 1000:9.1f} ms  {name.strip()}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if loaded:
+        failures.append(f"eagerly imported: {', '.join(loaded)}")
+    if result["median_ms"] > args.max_ms:
+        failures.append(f"median {result['median_ms']} ms over budget {args.max_ms} ms")
+    if failures:
+        print("REGRESSION: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,178 @@
+"""
+Ingestion memory benchmark: peak RSS while ingesting synthetic TXT/CSV/PDF
+files of growing size. Each run happens in a fresh interpreter so ru_maxrss
+belongs to that file alone.
+
+    python scripts/bench_memory.py --kinds txt,csv --sizes-mb 1,4,16
+    python scripts/bench_memory.py --mode legacy      # whole-file lists, for comparison
+
+The streaming pipeline (jobs.run_job) should show roughly the same peak for
+every size; the script exits 1 if the peak grows by more than --max-growth-mb
+between the smallest and largest file of a kind. Vectors go to a null sink by
+default: Chroma keeps its HNSW index resident, which grows with the number of
+vectors by design (bounded by MAX_CHUNKS_PER_USER); use --store chroma to
+include it.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def write_sized(path: str, kind: str, size_mb: float, seed: int):
+    """
+    Grows a synthetic file of the given kind until it reaches size_mb.
+    """
+    from bench_e2e import _paragraph, write_pdf, TOPICS
+
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    if kind == "pdf":
+        # ~2.3 KB per generated page
+        write_pdf(path, max(1, target // 2300), rng)
+        return
+    with open(path, "w") as f:
+        if kind == "csv":
+            f.write("id,part,region,quarter,amount,notes\n")
+        i = 0
+        while f.tell() < target:
+            if kind == "csv":
+                f.write(f"{i},PN-{rng.randint(1000, 9999)}-{rng.choice('ABC')},{rng.choice(TOPICS)},"
+                        f"Q{rng.randint(1, 4)},{rng.uniform(10, 5000):.2f},{rng.choice(TOPICS)} {rng.choice(TOPICS)}\n")
+            else:
+                f.write(_paragraph(rng) + f" (section {i})\n\n")
+            i += 1
+
+
+def child(args):
+    """
+    One measurement: ingest a single file and print a JSON line.
+    """
+    workdir = args.workdir
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.db")
+    os.environ["MAX_CHUNKS_PER_USER"] = str(10 ** 9)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    from bench_e2e import make_fake_embeddings
+    from app import database, models, jobs, ingest, vector_store, lexical_index
+
+    data_dir = os.path.join(workdir, "data")
+    for module in (vector_store, lexical_index):
+        module.DATA_DIR = type(module.DATA_DIR)(data_dir)
+    vector_store.embedding_function.underlying = make_fake_embeddings(0.0, 0.0, args.dim)
+    if args.store == "null":
+        # Embed (so vectors are materialized) but don't keep them
+        vector_store.add_documents_to_chroma = lambda user_id, chunks: vector_store.embedding_function.embed_documents(
+            [c.page_content for c in chunks])
+
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    user = models.User(email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    path = os.path.join(workdir, f"input.{args.kind}")
+    write_sized(path, args.kind, args.size_mb, args.seed)
+    file_bytes = os.path.getsize(path)
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if args.mode == "streaming":
+        job = jobs.create_job(db, user.id, os.path.basename(path), path)
+        jobs.run_job(job.id)
+        db.refresh(job)
+        status, chunks, error = job.status, job.chunks_processed, job.error
+    else:
+        # Pre-streaming shape: whole file -> all chunks -> all vectors at once
+        docs = ingest.process_file(path, os.path.basename(path), user.id)
+        chunk_docs = ingest.chunk_text(docs)
+        lexical_index.index_chunks(user.id, chunk_docs)
+        vector_store.add_documents_to_chroma(user.id, chunk_docs)
+        status, chunks, error = "succeeded", len(chunk_docs), None
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "kind": args.kind, "size_mb": args.size_mb, "file_bytes": file_bytes, "mode": args.mode,
+        "store": args.store, "status": status, "error": error, "chunks": chunks,
+        "seconds": round(elapsed, 2), "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1), "peak_over_baseline_mb": round(peak_rss_mb() - baseline, 1),
+    }))
+    os._exit(0)  # skip interpreter teardown of pools/threads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kinds", default="txt,csv")
+    parser.add_argument("--sizes-mb", default="1,4,16")
+    parser.add_argument("--mode", choices=("streaming", "legacy"), default="streaming")
+    parser.add_argument("--store", choices=("null", "chroma"), default="null")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-growth-mb", type=float, default=64.0)
+    parser.add_argument("--output", help="write the JSON results here")
+    # internal: single measurement in a child process
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--kind", help=argparse.SUPPRESS)
+    parser.add_argument("--size-mb", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = []
+    for kind in args.kinds.split(","):
+        for size in (float(s) for s in args.sizes_mb.split(",")):
+            with tempfile.TemporaryDirectory(prefix="documind-mem-") as workdir:
+                out = subprocess.check_output([
+                    sys.executable, os.path.abspath(__file__), "--child", "--kind", kind, "--size-mb", str(size),
+                    "--workdir", workdir, "--mode", args.mode, "--store", args.store,
+                    "--dim", str(args.dim), "--seed", str(args.seed),
+                ])
+            result = json.loads(out.decode().strip().splitlines()[-1])
+            results.append(result)
+            print(f"{kind:<4} {size:6.1f} MB  {result['status']:<9} {result['chunks']:>7} chunks  "
+                  f"{result['seconds']:7.2f}s  peak {result['peak_rss_mb']:7.1f} MB  "
+                  f"(+{result['peak_over_baseline_mb']:.1f} MB over baseline)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "memory", "mode": args.mode, "store": args.store, "results": results}, f, indent=2)
+
+    failed = False
+    for kind in args.kinds.split(","):
+        runs = sorted((r for r in results if r["kind"] == kind), key=lambda r: r["size_mb"])
+        growth = runs[-1]["peak_over_baseline_mb"] - runs[0]["peak_over_baseline_mb"]
+        print(f"{kind}: peak growth {growth:.1f} MB from {runs[0]['size_mb']} to {runs[-1]['size_mb']} MB input")
+        if any(r["status"] != "succeeded" for r in runs) or growth > args.max_growth_mb:
+            failed = True
+    if failed and args.mode == "streaming":
+        print(f"REGRESSION: peak RSS grew more than {args.max_growth_mb} MB with input size (or a run failed)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
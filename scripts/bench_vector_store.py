@@ -0,0 +1,204 @@
+"""
+Vector backend benchmark: Chroma (HNSW, float32) against the quantized store
+(int8 memory-mapped scan + exact re-rank) on synthetic clustered unit
+vectors, per VECTOR_BACKEND.
+
+    python scripts/bench_vector_store.py --users 8 --vectors 5000 --queries 200 --output bench_vectors.json
+
+For each backend, one child process builds the users' stores and a second,
+fresh child opens them all and runs the queries, so the reported RSS is what
+serving those users costs. Reports recall@k against exact float32 search,
+per-query latency percentiles and RSS over the post-import baseline, split
+into anonymous memory and file pages mapped from the store (page cache the
+kernel can reclaim under pressure).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+def rss_mb(field: str = "VmRSS") -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def make_vectors(user_id: int, n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """
+    Unit vectors around a few topic centroids, like chunk embeddings of a
+    handful of documents.
+    """
+    rng = np.random.default_rng(seed * 1000 + user_id)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, q: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), q)]
+    queries = picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def setup(args):
+    os.environ["VECTOR_BACKEND"] = args.backend
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(args.workdir, "embedding_cache.db")
+    os.environ["STORE_POOL_MAX"] = str(args.users + 1)
+    os.environ["STORE_POOL_MAX_MB"] = str(1 << 20)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    from app import vector_store, locks
+    vector_store.DATA_DIR = type(vector_store.DATA_DIR)(os.path.join(args.workdir, "data"))
+    locks.DATA_DIR = vector_store.DATA_DIR
+    return vector_store
+
+
+def build(args):
+    vector_store = setup(args)
+    from app.quantized_store import QuantizedStore
+
+    start = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        vectors = make_vectors(user_id, args.vectors, args.dim, args.clusters, args.seed)
+        with vector_store.store_pool.lease(user_id) as store:
+            for i in range(0, args.vectors, 1000):
+                part = vectors[i:i + 1000]
+                ids = [f"u{user_id}-{j}" for j in range(i, i + len(part))]
+                metadatas = [{"document_name": f"doc{j % 10}.txt", "page_number": j} for j in range(i, i + len(part))]
+                documents = [f"chunk {j}" for j in range(i, i + len(part))]
+                if isinstance(store, QuantizedStore):
+                    store.upsert(ids, part, metadatas, documents)
+                else:
+                    store._collection.upsert(ids=ids, embeddings=part.tolist(), metadatas=metadatas,
+                                             documents=documents)
+        vector_store.store_pool.close(user_id)
+    elapsed = time.perf_counter() - start
+
+    disk = 0
+    for root, _, files in os.walk(os.path.join(args.workdir, "data")):
+        disk += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    print(json.dumps({"build_seconds": round(elapsed, 2), "disk_mb": round(disk / (1024 * 1024), 1)}))
+
+
+def serve(args):
+    vector_store = setup(args)
+    from app.quantized_store import QuantizedStore
+
+    baseline = {field: rss_mb(field) for field in ("VmRSS", "RssAnon", "RssFile")}
+    latencies, recalls = [], []
+    for user_id in range(1, args.users + 1):
+        with np.load(os.path.join(args.workdir, f"queries_{user_id}.npz")) as saved:
+            queries, truth = saved["queries"], saved["truth"]
+
+        with vector_store.store_pool.lease(user_id) as store:
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                if isinstance(store, QuantizedStore):
+                    ids = [doc.id for doc, _ in store.search_by_vector(query, k=args.k)]
+                else:
+                    ids = store._collection.query(query_embeddings=[query.tolist()], n_results=args.k,
+                                                  include=[])["ids"][0]
+                latencies.append((time.perf_counter() - start) * 1000)
+                found = {int(i.split("-")[1]) for i in ids}
+                recalls.append(len(found & set(expected.tolist())) / args.k)
+
+    latencies = np.asarray(latencies)
+    print(json.dumps({
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "latency_ms": {
+            "mean": round(float(latencies.mean()), 3),
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "p99": round(float(np.percentile(latencies, 99)), 3),
+        },
+        "baseline_rss_mb": round(baseline["VmRSS"], 1),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_over_baseline_mb": round(rss_mb() - baseline["VmRSS"], 1),
+        # Heap (not reclaimable) vs page cache mapped from the store files
+        "anon_over_baseline_mb": round(rss_mb("RssAnon") - baseline["RssAnon"], 1),
+        "file_over_baseline_mb": round(rss_mb("RssFile") - baseline["RssFile"], 1),
+        "open_stores": vector_store.store_pool.stats()["open_stores"],
+    }))
+    os._exit(0)  # skip interpreter teardown of chromadb's threads
+
+
+def write_queries(workdir: str, args):
+    """
+    Queries and exact float32 top-k per user, computed here so the serving
+    child's RSS only reflects the store.
+    """
+    for user_id in range(1, args.users + 1):
+        vectors = make_vectors(user_id, args.vectors, args.dim, args.clusters, args.seed)
+        queries = make_queries(vectors, args.queries, args.seed + user_id)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+        np.savez(os.path.join(workdir, f"queries_{user_id}.npz"), queries=queries, truth=truth)
+
+
+def run_child(phase: str, backend: str, workdir: str, args) -> dict:
+    out = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__), "--child", phase, "--backend", backend, "--workdir", workdir,
+        "--users", str(args.users), "--vectors", str(args.vectors), "--dim", str(args.dim),
+        "--queries", str(args.queries), "--clusters", str(args.clusters), "--k", str(args.k),
+        "--seed", str(args.seed),
+    ])
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="chroma,quantized")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--vectors", type=int, default=5000, help="vectors per user")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100, help="queries per user")
+    parser.add_argument("--clusters", type=int, default=40)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here")
+    # internal: one phase in a child process
+    parser.add_argument("--child", choices=("build", "serve"), help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "build":
+        build(args)
+        return
+    if args.child == "serve":
+        serve(args)
+        return
+
+    print(f"{args.users} users x {args.vectors} vectors x {args.dim} dims, {args.queries} queries per user, k={args.k}")
+    results = []
+    for backend in args.backends.split(","):
+        with tempfile.TemporaryDirectory(prefix="documind-vectors-") as workdir:
+            write_queries(workdir, args)
+            result = {"backend": backend}
+            result.update(run_child("build", backend, workdir, args))
+            result.update(run_child("serve", backend, workdir, args))
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"{backend:<10} recall@{args.k} {result['recall_at_k']:.3f}  latency p50 {latency['p50']:7.2f} ms "
+              f"p95 {latency['p95']:7.2f} ms  RSS +{result['rss_over_baseline_mb']:6.1f} MB "
+              f"(anon +{result['anon_over_baseline_mb']:6.1f}, file +{result['file_over_baseline_mb']:6.1f})  "
+              f"disk {result['disk_mb']:7.1f} MB  build {result['build_seconds']:6.1f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "vector_store", "users": args.users, "vectors": args.vectors, "dim": args.dim,
+                       "queries": args.queries, "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Multi-worker load test: /chat throughput of one uvicorn server run with 1, 2,
+4, ... worker processes on this machine, all sharing one data directory and
+database.
+
+    python scripts/bench_workers.py --workers 1,2,4 --users 4 --concurrency 32 --requests 400 --output bench_workers.json
+
+Starts scripts/fake_embedding_server.py (embeddings and chat completions)
+and, for each worker count, a fresh `uvicorn --workers N` on a scratch
+directory (create_app below is the uvicorn factory each worker imports).
+Every user uploads the bench_e2e corpus, then --concurrency clients send
+distinct questions to /chat in a closed loop (answer cache off, so every
+request retrieves and generates). Reports requests/second and latency
+percentiles per worker count.
+
+Then one user deletes a file through whichever worker takes the request and
+asks again: any source still citing the deleted file means some worker
+served a stale store (expected 0).
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SCRIPTS)
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+def create_app():
+    """
+    uvicorn factory: the real app with its per-user data under BENCH_WORKDIR.
+    """
+    from app import main, auth, vector_store, lexical_index, locks
+    data_dir = os.path.join(os.environ["BENCH_WORKDIR"], "data")
+    for module in (main, auth, vector_store, lexical_index, locks):
+        module.DATA_DIR = type(module.DATA_DIR)(data_dir)
+    return main.app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(url: str, timeout: float = 120.0):
+    import httpx
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def chat_load(client, headers: List[Dict[str, str]], questions: List[str], concurrency: int) -> Dict[str, Any]:
+    from bench_e2e import percentiles
+
+    latencies, errors = [], 0
+    pending = iter(enumerate(questions))
+
+    async def worker():
+        nonlocal errors
+        for i, question in pending:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"question": question}, headers=headers[i % len(headers)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200 or response.json().get("answer", "").startswith("Sorry"):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": len(questions),
+        "errors": errors,
+        "seconds": round(wall, 2),
+        "requests_per_second": round(len(questions) / wall, 2),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def stale_after_delete(client, headers: Dict[str, str], filename: str, asks: int) -> int:
+    from bench_e2e import parse_sse
+
+    response = await client.delete(f"/files/{filename}", headers=headers)
+    response.raise_for_status()
+    stale = 0
+    for i in range(asks):
+        response = await client.post("/chat/stream", json={"question": f"What do the notes say? ({i})"},
+                                     headers=headers)
+        for event in parse_sse(response.text):
+            if event["event"] == "sources":
+                stale += any(s["document_name"] == filename for s in event["data"])
+    return stale
+
+
+async def run_workers(args, workers: int, api_base: str) -> Dict[str, Any]:
+    import httpx
+    from bench_e2e import build_corpus, ingest_user, login, questions_for
+
+    with tempfile.TemporaryDirectory(prefix="documind-workers-") as workdir:
+        port = free_port()
+        env = dict(os.environ,
+                   BENCH_WORKDIR=workdir,
+                   PYTHONPATH=os.pathsep.join([SCRIPTS, os.path.join(ROOT, "backend")]),
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                   EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.db"),
+                   ANSWER_CACHE_ENABLED="false",
+                   EMBEDDING_API_BASE=api_base,
+                   OPENAI_BASE_URL=api_base,
+                   OPENAI_API_KEY="bench",
+                   STARTUP_WARMUP="eager")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bench_workers:create_app", "--factory", "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=SCRIPTS, env=env,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            await wait_ready(base_url + "/")
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+                headers = [await login(client, i) for i in range(args.users)]
+                corpora = [build_corpus(os.path.join(workdir, "corpus", str(i)), args.corpus, args.seed + i)
+                           for i in range(args.users)]
+                await asyncio.gather(*(ingest_user(client, h, paths, 0.1) for h, paths in zip(headers, corpora)))
+
+                # Warm every worker's pool before measuring
+                await chat_load(client, headers, questions_for(args.seed + 1000, workers * args.users * 2),
+                                args.concurrency)
+                result = await chat_load(client, headers, questions_for(args.seed, args.requests), args.concurrency)
+                result["workers"] = workers
+                result["stale_sources_after_delete"] = await stale_after_delete(
+                    client, headers[0], "notes.txt", args.stale_checks)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--corpus", choices=("small", "medium", "large"), default="small")
+    parser.add_argument("--requests", type=int, default=400, help="/chat requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=32, help="clients in flight")
+    parser.add_argument("--stale-checks", type=int, default=20, help="questions asked after the delete")
+    parser.add_argument("--dim", type=int, default=1536, help="fake embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args()
+
+    fake_port = free_port()
+    api_base = f"http://127.0.0.1:{fake_port}/v1"
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(SCRIPTS, "fake_embedding_server.py"), "--port", str(fake_port),
+        "--dim", str(args.dim), "--latency-ms", str(args.embed_latency_ms),
+        "--chat-ttft-ms", str(args.llm_ttft_ms), "--chat-token-ms", str(args.llm_token_ms),
+        "--chat-tokens", str(args.answer_tokens),
+    ])
+    print(f"{os.cpu_count()} CPUs; {args.users} users, {args.corpus} corpus, {args.requests} /chat requests "
+          f"at concurrency {args.concurrency}")
+    results = []
+    try:
+        asyncio.run(wait_ready(f"http://127.0.0.1:{fake_port}/stats"))
+        for workers in (int(w) for w in args.workers.split(",")):
+            result = asyncio.run(run_workers(args, workers, api_base))
+            results.append(result)
+            latency = result["latency_ms"]
+            print(f"workers {workers:>2}: {result['requests_per_second']:7.2f} req/s  "
+                  f"p50 {latency['p50']:7.1f} ms  p95 {latency['p95']:7.1f} ms  errors {result['errors']}  "
+                  f"stale sources after delete {result['stale_sources_after_delete']}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    if len(results) > 1:
+        base = results[0]["requests_per_second"]
+        print("speedup: " + ", ".join(f"{r['workers']}w x{r['requests_per_second'] / base:.2f}" for r in results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "workers", "cpus": os.cpu_count(), "users": args.users, "corpus": args.corpus,
+                       "concurrency": args.concurrency, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
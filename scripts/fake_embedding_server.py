@@ -0,0 +1,130 @@
+"""
+Local stand-in for the OpenAI /embeddings endpoint, for offline benchmarks.
+
+    python scripts/fake_embedding_server.py --port 8100 --latency-ms 150 --max-inflight 4
+
+Then point the backend at it with EMBEDDING_API_BASE=http://127.0.0.1:8100/v1.
+Vectors are deterministic per input text, so cache and recall checks are stable.
+
+It also answers /chat/completions (plain and streamed) after --chat-ttft-ms
+plus --chat-token-ms per token, for benchmarks that run the real backend in
+separate processes; point the chat model at it with OPENAI_BASE_URL.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def fake_vector(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vec /= np.linalg.norm(vec)
+    return vec
+
+
+def encode(vec: np.ndarray, encoding_format: str):
+    if encoding_format == "base64":
+        return base64.b64encode(vec.tobytes()).decode("ascii")
+    return vec.tolist()
+
+
+def create_app(latency_ms: float = 100.0, per_input_ms: float = 0.5, dim: int = 1536,
+               max_inflight: int = 0, error_rate: float = 0.0, chat_ttft_ms: float = 300.0,
+               chat_token_ms: float = 10.0, chat_tokens: int = 40) -> FastAPI:
+    """
+    latency_ms + per_input_ms * len(input) simulates the round trip.
+    Requests beyond max_inflight (0 = unlimited) or a random error_rate share
+    get a 429 with Retry-After, like the real API under rate limiting.
+    """
+    app = FastAPI(title="Fake Embeddings")
+    state = {"inflight": 0, "requests": 0, "throttled": 0, "inputs": 0, "chat_requests": 0}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        state["requests"] += 1
+
+        if (max_inflight and state["inflight"] >= max_inflight) or random.random() < error_rate:
+            state["throttled"] += 1
+            return JSONResponse(status_code=429, headers={"retry-after": "0.2"},
+                                content={"error": {"message": "Rate limit reached", "type": "requests"}})
+
+        state["inflight"] += 1
+        try:
+            await asyncio.sleep((latency_ms + per_input_ms * len(inputs)) / 1000)
+            state["inputs"] += len(inputs)
+            encoding_format = body.get("encoding_format", "float")
+            data = [{"object": "embedding", "index": i, "embedding": encode(fake_vector(t, dim), encoding_format)}
+                    for i, t in enumerate(inputs)]
+        finally:
+            state["inflight"] -= 1
+
+        tokens = sum(len(t) // 4 for t in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state["chat_requests"] += 1
+        words = ["Answer:"] + [f"token{i}" for i in range(chat_tokens)]
+        parts = [w if i == 0 else " " + w for i, w in enumerate(words)]
+        base = {"id": f"chatcmpl-{state['chat_requests']}", "created": int(time.time()), "model": body.get("model")}
+        usage = {"prompt_tokens": sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", [])),
+                 "completion_tokens": len(parts)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep((chat_ttft_ms + chat_token_ms * len(parts)) / 1000)
+            return {**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(parts)}}]}
+
+        async def events():
+            await asyncio.sleep(chat_ttft_ms / 1000)
+            for i, part in enumerate(parts):
+                if i:
+                    await asyncio.sleep(chat_token_ms / 1000)
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [{
+                    "index": 0, "finish_reason": None, "delta": {"content": part}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {**base, "object": "chat.completion.chunk", "choices": [{
+                "index": 0, "finish_reason": "stop", "delta": {}}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return state
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--per-input-ms", type=float, default=0.5)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--max-inflight", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--chat-token-ms", type=float, default=10.0)
+    parser.add_argument("--chat-tokens", type=int, default=40)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.per_input_ms, args.dim, args.max_inflight, args.error_rate,
+                           args.chat_ttft_ms, args.chat_token_ms, args.chat_tokens),
+                host="127.0.0.1", port=args.port, log_level="warning")
@@ -24,7 +24,8 @@ def test_files():
     
     if response.status_code == 200:
         print("Files:", response.json())
-        if "sample.pdf" in response.json()["files"]:
+        names = [f["document_name"] for f in response.json()["files"]]
+        if "sample.pdf" in names:
             print("SUCCESS: sample.pdf found in file list.")
         else:
             print("WARNING: sample.pdf not found (did you upload it?).")
@@ -1,5 +1,6 @@
 import requests
 import os
+import time
 import chromadb
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
@@ -12,6 +13,8 @@ BASE_URL = "http://127.0.0.1:8000"
 USER_EMAIL = "test@example.com"
 USER_PASSWORD = "securepassword"
 TEST_FILE_PATH = "sample.pdf"
+POLL_INTERVAL = 0.5
+POLL_ATTEMPTS = 120
 
 # Create a dummy PDF for testing
 from fpdf import FPDF
@@ -39,16 +42,25 @@ def test_upload_and_verify():
         headers = {"Authorization": f"Bearer {token}"}
         response = requests.post(f"{BASE_URL}/upload", files=files, headers=headers)
     
-    if response.status_code == 200:
-        print("Upload success!", response.json())
-        result = response.json()
-        if result["chunks_processed"] > 0:
-            print("Verified: Backend reports chunks processed.")
-        else:
-            print("Warning: 0 chunks processed.")
-    else:
+    if response.status_code != 202:
         print(f"Upload failed: {response.text}")
         return
+    job_id = response.json()["job_id"]
+    print("Upload accepted!", response.json())
+
+    # Ingestion runs in the background; poll the job until it finishes
+    for _ in range(POLL_ATTEMPTS):
+        job = requests.get(f"{BASE_URL}/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(POLL_INTERVAL)
+    if job["status"] != "succeeded":
+        print(f"Ingestion did not succeed: {job['status']} {job.get('error') or ''}")
+        return
+    if job["chunks_processed"] > 0:
+        print("Verified: Backend reports chunks processed.")
+    else:
+        print("Warning: 0 chunks processed.")
 
     # 3. Verify ChromaDB
     # Assuming user_id=1 for test@example.com